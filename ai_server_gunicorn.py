@@ -0,0 +1,58 @@
+# Prefork production mode for the local AI server:
+#
+#     gunicorn -c ai_server_gunicorn.py local_ai_server:app
+#
+# The app (and the ViT weights) is loaded once in the master process. Workers are
+# forked from it and share the weight pages copy-on-write instead of each loading
+# their own copy. Every worker caps its torch intra-op threads so that
+# workers * threads does not oversubscribe the cores.
+import gc
+import glob
+import json
+import multiprocessing
+import os
+import tempfile
+
+from process_memory import prefork_memory_report, read_memory
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '5000')}"
+workers = int(os.environ.get('AI_WORKERS', max(1, multiprocessing.cpu_count() // 4)))
+# Request threads per worker; the micro-batcher groups their images into one forward pass
+threads = int(os.environ.get('AI_WORKER_THREADS', '4'))
+worker_class = 'gthread'
+timeout = 120
+preload_app = True
+
+TORCH_THREADS_PER_WORKER = int(os.environ.get('AI_TORCH_THREADS', max(1, multiprocessing.cpu_count() // workers)))
+
+# Lets the app find its siblings for the /stats memory report
+os.environ['AI_PREFORK_MASTER_PID'] = str(os.getpid())
+
+# Every worker writes its metrics here, so /metrics on any worker reports the whole server.
+# Files left by an earlier run would be summed in too, so start from an empty directory.
+metrics_dir = os.environ.setdefault('AI_METRICS_DIR', os.path.join(tempfile.gettempdir(), f"ai-metrics-{os.getpid()}"))
+os.makedirs(metrics_dir, exist_ok=True)
+for stale in glob.glob(os.path.join(metrics_dir, 'metrics-*.json')):
+    os.remove(stale)
+
+
+def when_ready(server):
+    # Move everything allocated so far (the model included) out of the garbage
+    # collector's reach, so collections in the workers never write to those pages
+    gc.collect()
+    gc.freeze()
+    server.log.info("Model loaded in master: %s", json.dumps(read_memory(os.getpid())))
+
+
+def post_fork(server, worker):
+    import torch
+    from model_loader import start_all_after_fork
+
+    torch.set_num_threads(TORCH_THREADS_PER_WORKER)
+    server.log.info("Worker %s using %s torch threads", worker.pid, TORCH_THREADS_PER_WORKER)
+    # The weights came from the master; warm up this worker before it reports ready
+    start_all_after_fork()
+
+
+def post_worker_init(worker):
+    worker.log.info("Worker %s ready, memory: %s", worker.pid, json.dumps(prefork_memory_report(worker.ppid)))
@@ -0,0 +1,23 @@
+# Generated by Django 5.1.1 on 2026-10-18 10:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analysis', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='skinanalysis',
+            name='embedding',
+            field=models.BinaryField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='skinanalysis',
+            name='embedding_version',
+            field=models.CharField(blank=True, db_index=True, default='', max_length=32),
+        ),
+    ]
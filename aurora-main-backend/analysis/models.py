@@ -15,6 +15,9 @@ class SkinAnalysis(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     image = models.ImageField(upload_to=user_upload_path)
     results = models.JSONField(default=dict)
+    # Image embedding returned by the AI service (little-endian float32), used to find similar cases
+    embedding = models.BinaryField(null=True, blank=True, editable=False)
+    embedding_version = models.CharField(max_length=32, blank=True, default='', db_index=True)
     status = models.CharField(max_length=10, choices=ANALYSIS_STATUS, default='PENDING')
     created_at = models.DateTimeField(auto_now_add=True)
     completed_at = models.DateTimeField(null=True, blank=True)
@@ -11,4 +11,21 @@ class AnalysisResultSerializer(serializers.ModelSerializer):
     class Meta:
         model = SkinAnalysis
         fields = ['results', 'completed_at']
-        read_only_fields = fields
\ No newline at end of file
+        read_only_fields = fields
+
+class SimilarCaseSerializer(serializers.ModelSerializer):
+    """A past analysis returned by similar-case search, with the condition recorded for it."""
+    condition = serializers.SerializerMethodField()
+    confidence = serializers.SerializerMethodField()
+    similarity = serializers.FloatField(read_only=True)
+
+    class Meta:
+        model = SkinAnalysis
+        fields = ['id', 'image', 'condition', 'confidence', 'similarity', 'created_at']
+        read_only_fields = fields
+
+    def get_condition(self, obj):
+        return obj.results.get('condition')
+
+    def get_confidence(self, obj):
+        return obj.results.get('confidence')
@@ -0,0 +1,202 @@
+import base64
+import binascii
+import threading
+
+import numpy as np
+from django.conf import settings
+
+from .models import SkinAnalysis
+
+
+class SimilarCaseIndex:
+    """
+    Cosine-similarity search over analysis embeddings.
+
+    Vectors are L2-normalized when added, so scoring is one matrix-vector product.
+    Up to `ivf_threshold` vectors every one is scored (brute force). Beyond that the
+    index is partitioned IVF-style: k-means centroids (about sqrt(n) of them) are
+    trained on the stored vectors, each vector is filed under its nearest centroid,
+    and a query only scores the vectors filed under its `nprobe` nearest centroids.
+    The partition is retrained whenever the index has doubled since it was last
+    trained, and vectors added in between are filed under the existing centroids.
+    """
+
+    def __init__(self, dim, ivf_threshold=20000, nprobe=8, seed=0):
+        self.dim = dim
+        self.ivf_threshold = ivf_threshold
+        self.nprobe = nprobe
+        self._rng = np.random.default_rng(seed)
+        self._lock = threading.Lock()
+        self._ids = np.empty(0, dtype=np.int64)
+        self._vectors = np.empty((0, dim), dtype=np.float32)
+        self._size = 0
+        self._centroids = None
+        self._lists = None
+        self._trained_size = 0
+        # Highest analysis id added, so a refresh only loads newer rows
+        self.last_id = 0
+
+    def __len__(self):
+        return self._size
+
+    @property
+    def partitioned(self):
+        return self._centroids is not None
+
+    def add(self, ids, vectors):
+        """Add embeddings, one row of `vectors` per analysis id."""
+        ids = np.asarray(ids, dtype=np.int64).reshape(-1)
+        vectors = np.asarray(vectors, dtype=np.float32).reshape(len(ids), self.dim)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        vectors = vectors / np.where(norms > 0, norms, 1)
+
+        with self._lock:
+            start, end = self._size, self._size + len(ids)
+            if end > len(self._ids):
+                # Grow by doubling so adding one case at a time stays cheap
+                capacity = max(end, 2 * len(self._ids), 64)
+                self._ids = np.resize(self._ids, capacity)
+                grown = np.empty((capacity, self.dim), dtype=np.float32)
+                grown[:start] = self._vectors[:start]
+                self._vectors = grown
+            self._ids[start:end] = ids
+            self._vectors[start:end] = vectors
+            self._size = end
+            if len(ids):
+                self.last_id = max(self.last_id, int(ids.max()))
+
+            if end >= self.ivf_threshold and end >= 2 * self._trained_size:
+                self._train()
+            elif self._centroids is not None:
+                labels = self._nearest_centroids(self._vectors[start:end])
+                for label in np.unique(labels):
+                    self._lists[label] = np.concatenate([self._lists[label], start + np.flatnonzero(labels == label)])
+
+    def _nearest_centroids(self, vectors, chunk=8192):
+        return np.concatenate([np.argmax(vectors[i:i + chunk] @ self._centroids.T, axis=1)
+                               for i in range(0, len(vectors), chunk)] or [np.empty(0, dtype=np.int64)])
+
+    def _train(self, iterations=10):
+        vectors = self._vectors[:self._size]
+        count = max(1, int(np.sqrt(self._size)))
+        # Spherical k-means on a sample: centroids stay unit length, assignment is by dot product
+        sample = vectors[self._rng.choice(self._size, size=min(self._size, 64 * count), replace=False)]
+        centroids = sample[self._rng.choice(len(sample), size=count, replace=False)].copy()
+        for _ in range(iterations):
+            labels = np.argmax(sample @ centroids.T, axis=1)
+            for c in range(count):
+                members = sample[labels == c]
+                if len(members):
+                    mean = members.sum(axis=0)
+                    centroids[c] = mean / max(np.linalg.norm(mean), 1e-12)
+        self._centroids = centroids
+
+        labels = self._nearest_centroids(vectors)
+        order = np.argsort(labels, kind='stable')
+        bounds = np.searchsorted(labels[order], np.arange(count + 1))
+        self._lists = [order[bounds[c]:bounds[c + 1]] for c in range(count)]
+        self._trained_size = self._size
+
+    def search(self, vector, k=5, exclude_ids=()):
+        """The `k` most similar (analysis id, cosine similarity) pairs, most similar first."""
+        query = np.asarray(vector, dtype=np.float32).reshape(self.dim)
+        query = query / max(float(np.linalg.norm(query)), 1e-12)
+
+        with self._lock:
+            if self._centroids is None:
+                ids = self._ids[:self._size]
+                scores = self._vectors[:self._size] @ query
+            else:
+                probes = np.argsort(self._centroids @ query)[::-1][:self.nprobe]
+                positions = np.concatenate([self._lists[c] for c in probes])
+                ids = self._ids[positions]
+                scores = self._vectors[positions] @ query
+
+        if len(exclude_ids):
+            scores = np.where(np.isin(ids, np.asarray(exclude_ids, dtype=np.int64)), -np.inf, scores)
+        k = min(k, int(np.isfinite(scores).sum()))
+        if k <= 0:
+            return []
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(int(ids[i]), float(scores[i])) for i in top]
+
+
+def decode_embedding(encoded):
+    """Raw little-endian float32 bytes of a base64 embedding from the AI service, or None if missing or malformed."""
+    if not isinstance(encoded, str):
+        return None
+    try:
+        raw = base64.b64decode(encoded, validate=True)
+    except (binascii.Error, ValueError):
+        return None
+    return raw if raw and len(raw) % 4 == 0 else None
+
+
+# One index per model version: embeddings from different models are not comparable
+_indexes = {}
+_indexes_lock = threading.Lock()
+_refresh_lock = threading.Lock()
+
+
+def _index_for(version, dim):
+    with _indexes_lock:
+        index = _indexes.get(version)
+        if index is None or index.dim != dim:
+            index = _indexes[version] = SimilarCaseIndex(
+                dim,
+                ivf_threshold=getattr(settings, 'SIMILAR_CASES_IVF_THRESHOLD', 20000),
+                nprobe=getattr(settings, 'SIMILAR_CASES_NPROBE', 8),
+            )
+        return index
+
+
+def clear_indexes():
+    """Forget the in-memory indexes, e.g. after bulk deletions; they are rebuilt on the next search."""
+    with _indexes_lock:
+        _indexes.clear()
+
+
+def _refresh(index, version, batch_size=2000):
+    """Load analyses stored since the last refresh, by this or any other process."""
+    with _refresh_lock:
+        rows = (SkinAnalysis.objects
+                .filter(embedding_version=version, embedding__isnull=False, id__gt=index.last_id)
+                .order_by('id').values_list('id', 'embedding'))
+        ids, vectors = [], []
+        analysis_id = None
+        for analysis_id, embedding in rows.iterator(chunk_size=batch_size):
+            vector = np.frombuffer(bytes(embedding), dtype='<f4')
+            if len(vector) == index.dim:
+                ids.append(analysis_id)
+                vectors.append(vector)
+            if len(ids) >= batch_size:
+                index.add(ids, np.stack(vectors))
+                ids, vectors = [], []
+        if ids:
+            index.add(ids, np.stack(vectors))
+        if analysis_id is not None:
+            # Also skip rows of another dimension next time
+            index.last_id = max(index.last_id, analysis_id)
+
+
+def find_similar_cases(analysis, k=5):
+    """
+    The `k` past analyses whose images are most similar to this one's, most similar
+    first, each with a `similarity` attribute (cosine similarity of the embeddings).
+    """
+    if not analysis.embedding or not analysis.embedding_version:
+        return []
+    vector = np.frombuffer(bytes(analysis.embedding), dtype='<f4')
+    index = _index_for(analysis.embedding_version, len(vector))
+    _refresh(index, analysis.embedding_version)
+
+    # Deleted analyses stay in the index, so a few extra matches are fetched and dropped here
+    matches = index.search(vector, 2 * k + 10, exclude_ids=[analysis.id])
+    analyses = SkinAnalysis.objects.in_bulk([analysis_id for analysis_id, _ in matches])
+    similar = []
+    for analysis_id, score in matches:
+        if analysis_id in analyses:
+            analyses[analysis_id].similarity = score
+            similar.append(analyses[analysis_id])
+    return similar[:k]
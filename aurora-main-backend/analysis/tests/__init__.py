@@ -1,4 +1,5 @@
 from .test_models import *
 from .test_serializers import *
 from .test_views import *
-from .test_urls import *
\ No newline at end of file
+from .test_urls import *
+from .test_similarity import *
\ No newline at end of file
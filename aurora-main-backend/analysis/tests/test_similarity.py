@@ -0,0 +1,82 @@
+import base64
+
+import numpy as np
+from django.test import SimpleTestCase, TestCase
+from users.models import User
+from ..models import SkinAnalysis
+from ..similarity import SimilarCaseIndex, clear_indexes, decode_embedding, find_similar_cases
+
+
+def encode(vector):
+    return base64.b64encode(np.asarray(vector, dtype='<f4').tobytes()).decode('ascii')
+
+
+class SimilarCaseIndexTests(SimpleTestCase):
+    def test_brute_force_orders_by_cosine_similarity(self):
+        index = SimilarCaseIndex(dim=3)
+        index.add([1, 2, 3], [[1, 0, 0], [0, 1, 0], [1, 1, 0]])
+        matches = index.search([1, 0.2, 0], k=2)
+        self.assertEqual([analysis_id for analysis_id, _ in matches], [1, 3])
+        self.assertAlmostEqual(matches[0][1], 1 / np.sqrt(1.04), places=5)
+
+    def test_excluded_ids_and_small_index(self):
+        index = SimilarCaseIndex(dim=2)
+        self.assertEqual(index.search([1, 0], k=3), [])
+        index.add([5, 6], [[1, 0], [0, 1]])
+        self.assertEqual([analysis_id for analysis_id, _ in index.search([1, 0], k=5, exclude_ids=[5])], [6])
+
+    def test_ivf_matches_brute_force_on_clustered_data(self):
+        rng = np.random.default_rng(0)
+        centers = rng.normal(size=(20, 16))
+        vectors = centers[rng.integers(0, 20, 2000)] + 0.2 * rng.normal(size=(2000, 16))
+        brute = SimilarCaseIndex(dim=16, ivf_threshold=10 ** 9)
+        ivf = SimilarCaseIndex(dim=16, ivf_threshold=500, nprobe=4)
+        for start in range(0, 2000, 100):
+            ids = np.arange(start, start + 100) + 1
+            brute.add(ids, vectors[start:start + 100])
+            ivf.add(ids, vectors[start:start + 100])
+
+        self.assertTrue(ivf.partitioned)
+        self.assertEqual(len(ivf), 2000)
+        for query in vectors[:20]:
+            expected = {analysis_id for analysis_id, _ in brute.search(query, k=5)}
+            found = {analysis_id for analysis_id, _ in ivf.search(query, k=5)}
+            self.assertGreaterEqual(len(expected & found), 4)
+
+    def test_decode_embedding(self):
+        self.assertEqual(decode_embedding(encode([1.0, 2.0])), np.asarray([1, 2], dtype='<f4').tobytes())
+        self.assertIsNone(decode_embedding(None))
+        self.assertIsNone(decode_embedding('not base64!'))
+        self.assertIsNone(decode_embedding(base64.b64encode(b'abc').decode('ascii')))
+
+
+class FindSimilarCasesTests(TestCase):
+    def setUp(self):
+        clear_indexes()
+        self.user = User.objects.create_user(email='test@example.com', password='testpass')
+
+    def create_analysis(self, vector, condition, version='v1'):
+        return SkinAnalysis.objects.create(
+            user=self.user,
+            results={'condition': condition, 'confidence': 0.9, 'model_version': version},
+            embedding=decode_embedding(encode(vector)),
+            embedding_version=version,
+        )
+
+    def test_returns_nearest_past_cases_of_the_same_model_version(self):
+        acne = self.create_analysis([1, 0, 0], 'Acne')
+        self.create_analysis([0, 1, 0], 'Eczema')
+        self.create_analysis([1, 0.1, 0], 'Acne', version='v2')
+        query = self.create_analysis([0.9, 0.1, 0], 'Acne')
+
+        similar = find_similar_cases(query, k=1)
+        self.assertEqual([case.id for case in similar], [acne.id])
+        self.assertGreater(similar[0].similarity, 0.9)
+
+        # Analyses stored after the index was built are picked up on the next search
+        newer = self.create_analysis([0.9, 0.1, 0], 'Acne')
+        self.assertEqual(find_similar_cases(query, k=1)[0].id, newer.id)
+
+    def test_analysis_without_embedding(self):
+        analysis = SkinAnalysis.objects.create(user=self.user)
+        self.assertEqual(find_similar_cases(analysis), [])
@@ -5,6 +5,7 @@ import requests
 from django.conf import settings
 from .models import SkinAnalysis
 from .serializers import SkinAnalysisSerializer, AnalysisResultSerializer
+from .similarity import decode_embedding
 from users.permissions import IsOwnerOrAdmin
 
 class SkinAnalysisView(generics.CreateAPIView):
@@ -27,7 +28,12 @@ class SkinAnalysisView(generics.CreateAPIView):
             
             if response.status_code == 200:
                 # Update analysis with results
-                analysis.results = response.json()
+                results = response.json()
+                # Kept apart from the results for similar-case search
+                analysis.embedding = decode_embedding(results.pop('embedding', None))
+                version = results.get('embedding_version', results.get('model_version', ''))
+                analysis.embedding_version = str(version)[:32] if analysis.embedding else ''
+                analysis.results = results
                 analysis.status = 'COMPLETED'
                 analysis.save()
                 
@@ -236,6 +236,11 @@ MAX_UPLOAD_SIZE = 20 * 1024 * 1024  # 20MB
 
 AI_SERVICE_URL = os.getenv('AI_SERVICE_URL', 'https://us-central1-aurora-457407.cloudfunctions.net/predict')
 
+# Similar-case search over stored analysis embeddings: brute force up to this many cases, IVF beyond
+SIMILAR_CASES_IVF_THRESHOLD = int(os.getenv('SIMILAR_CASES_IVF_THRESHOLD', '20000'))
+# Clusters scanned per IVF query; more is slower but misses fewer neighbours
+SIMILAR_CASES_NPROBE = int(os.getenv('SIMILAR_CASES_NPROBE', '8'))
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.1/ref/settings/#default-auto-field
 
@@ -1,7 +1,9 @@
+import numpy as np
 from django.urls import reverse
 from rest_framework.test import APITestCase
 from users.models import User
 from analysis.models import SkinAnalysis
+from analysis.similarity import clear_indexes
 from ..models import Consultation
 
 class ConsultationViewTests(APITestCase):
@@ -28,4 +30,29 @@ class ConsultationViewTests(APITestCase):
         data = {'status': 'COMPLETED', 'notes': 'Treatment prescribed'}
         response = self.client.patch(url, data)
         self.assertEqual(response.status_code, 200)
-        self.assertEqual(response.data['status'], 'COMPLETED')
\ No newline at end of file
+        self.assertEqual(response.data['status'], 'COMPLETED')
+
+    def test_dermatologist_gets_similar_cases(self):
+        clear_indexes()
+        self.analysis.embedding = np.asarray([1, 0, 0], dtype='<f4').tobytes()
+        self.analysis.embedding_version = 'v1'
+        self.analysis.save()
+        similar = SkinAnalysis.objects.create(
+            user=self.user,
+            results={'condition': 'Acne', 'confidence': 0.95},
+            embedding=np.asarray([0.9, 0.1, 0], dtype='<f4').tobytes(),
+            embedding_version='v1'
+        )
+
+        self.client.force_authenticate(user=self.derma)
+        url = reverse('consultations:consultation-similar', args=[self.consultation.id])
+        response = self.client.get(url, {'k': 3})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([case['id'] for case in response.data['similar_cases']], [similar.id])
+        self.assertEqual(response.data['similar_cases'][0]['condition'], 'Acne')
+
+    def test_patient_cannot_get_similar_cases(self):
+        self.client.force_authenticate(user=self.user)
+        url = reverse('consultations:consultation-similar', args=[self.consultation.id])
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 403)
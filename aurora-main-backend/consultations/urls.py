@@ -1,9 +1,10 @@
 from django.urls import path
-from .views import ConsultationListView, ConsultationDetailView
+from .views import ConsultationListView, ConsultationDetailView, ConsultationSimilarCasesView
 
 app_name = 'consultations'
 
 urlpatterns = [
     path('', ConsultationListView.as_view(), name='consultation-list'),
     path('<int:pk>/', ConsultationDetailView.as_view(), name='consultation-detail'),
+    path('<int:pk>/similar/', ConsultationSimilarCasesView.as_view(), name='consultation-similar'),
 ]
\ No newline at end of file
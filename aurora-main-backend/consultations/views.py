@@ -1,9 +1,14 @@
-from rest_framework import generics, permissions
+from rest_framework import generics, permissions, status
+from rest_framework.response import Response
 from .models import Consultation
 from .serializers import ConsultationSerializer
-from users.permissions import IsDermatologist, IsOwnerOrAdmin
+from analysis.serializers import SimilarCaseSerializer
+from analysis.similarity import find_similar_cases
+from users.permissions import IsAdmin, IsDermatologist, IsOwnerOrAdmin
 from rest_framework.exceptions import PermissionDenied
 
+MAX_SIMILAR_CASES = 50
+
 
 class ConsultationListView(generics.ListCreateAPIView):
     serializer_class = ConsultationSerializer
@@ -30,4 +35,24 @@ class ConsultationDetailView(generics.RetrieveUpdateAPIView):
         if self.request.user.role == 'DERMA':
             serializer.save(dermatologist=self.request.user)
         else:
-            serializer.save()
\ No newline at end of file
+            serializer.save()
+
+class ConsultationSimilarCasesView(generics.GenericAPIView):
+    """Past analyses whose images look most like this consultation's, for the reviewing dermatologist."""
+    queryset = Consultation.objects.select_related('analysis')
+    permission_classes = [permissions.IsAuthenticated, IsDermatologist | IsAdmin]
+
+    def get(self, request, *args, **kwargs):
+        consultation = self.get_object()
+        try:
+            k = min(max(int(request.query_params.get('k', 5)), 1), MAX_SIMILAR_CASES)
+        except ValueError:
+            return Response({'error': 'k must be an integer'}, status=status.HTTP_400_BAD_REQUEST)
+
+        analysis = consultation.analysis
+        cases = find_similar_cases(analysis, k)
+        return Response({
+            'analysis': analysis.id,
+            'has_embedding': bool(analysis.embedding),
+            'similar_cases': SimilarCaseSerializer(cases, many=True, context={'request': request}).data
+        })
@@ -0,0 +1,127 @@
+import os
+import threading
+import time
+from collections import deque
+
+import torch
+
+
+# Default batching window, overridable from the environment
+BATCH_MAX_SIZE = int(os.environ.get('AI_BATCH_MAX_SIZE', '16'))
+BATCH_MAX_WAIT_MS = float(os.environ.get('AI_BATCH_MAX_WAIT_MS', '5'))
+
+
+class _PendingRequest:
+    """A single preprocessed image waiting for its slice of a batched forward pass."""
+
+    __slots__ = ('pixel_values', 'done', 'result', 'error')
+
+    def __init__(self, pixel_values):
+        self.pixel_values = pixel_values
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class MicroBatcher:
+    """
+    Collect images submitted from concurrent request handlers and run them through
+    the model as one batch.
+
+    `run_batch` receives a stacked tensor of shape (N, C, H, W) and returns a tensor
+    or a tuple of tensors whose first dimension is N. Every caller of `submit` gets
+    back row i of each returned tensor (None stays None).
+
+    A batch is dispatched as soon as `max_batch_size` images are waiting, or when the
+    oldest waiting image has been queued for `max_wait_ms`, whichever comes first.
+    """
+
+    def __init__(self, run_batch, max_batch_size=BATCH_MAX_SIZE, max_wait_ms=BATCH_MAX_WAIT_MS):
+        self.run_batch = run_batch
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait = max(0.0, float(max_wait_ms)) / 1000.0
+        self._queue = deque()
+        self._cond = threading.Condition()
+        self._worker = None
+        self._closed = False
+        # Simple counters so the batch size distribution can be inspected
+        self.batches_run = 0
+        self.images_run = 0
+
+    def submit(self, pixel_values, timeout=None):
+        """Queue one image tensor of shape (C, H, W) and block until its result is ready."""
+        pending = _PendingRequest(pixel_values)
+        with self._cond:
+            self._ensure_worker()
+            self._queue.append(pending)
+            self._cond.notify()
+
+        if not pending.done.wait(timeout):
+            raise TimeoutError("Timed out waiting for a batched prediction")
+        if pending.error is not None:
+            raise pending.error
+        return pending.result
+
+    @property
+    def average_batch_size(self):
+        return self.images_run / self.batches_run if self.batches_run else 0.0
+
+    @property
+    def queue_depth(self):
+        """Images waiting for the next batch."""
+        return len(self._queue)
+
+    def _ensure_worker(self):
+        # Started lazily so importing the server does not spawn threads
+        if self._worker is None or not self._worker.is_alive():
+            self._worker = threading.Thread(target=self._run, name='micro-batcher', daemon=True)
+            self._worker.start()
+
+    def close(self):
+        """Let the worker thread exit once the queue is empty (images submitted later are still run)."""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+    def _next_batch(self):
+        with self._cond:
+            while not self._queue:
+                if self._closed:
+                    # Cleared under the lock, so a later submit starts a fresh worker
+                    self._worker = None
+                    return None
+                self._cond.wait()
+
+            # Wait for more requests until the batch is full or the window closes
+            deadline = time.monotonic() + self.max_wait
+            while len(self._queue) < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+
+            count = min(len(self._queue), self.max_batch_size)
+            return [self._queue.popleft() for _ in range(count)]
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                return
+            try:
+                pixel_values = torch.stack([pending.pixel_values for pending in batch])
+                outputs = self.run_batch(pixel_values)
+                self.batches_run += 1
+                self.images_run += len(batch)
+
+                for i, pending in enumerate(batch):
+                    if isinstance(outputs, tuple):
+                        pending.result = tuple(None if output is None else output[i] for output in outputs)
+                    else:
+                        pending.result = outputs[i]
+            except Exception as e:
+                for pending in batch:
+                    pending.error = e
+            finally:
+                for pending in batch:
+                    pending.done.set()
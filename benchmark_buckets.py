@@ -0,0 +1,98 @@
+import argparse
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy as np
+import torch
+
+from benchmark_inference import MODEL_PATH, TINY_VIT, build_tiny_model, has_weights
+from inference_backends import COMPILE_BUCKETS, COMPILE_CACHE_DIR, TorchCompiledBackend, TorchEagerBackend
+
+# Sizes between the buckets show what padding costs
+EXTRA_BATCH_SIZES = (3, 6, 12)
+
+
+def time_forward(backend, pixel_values, repeats):
+    backend(pixel_values)
+    latencies = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        backend(pixel_values)
+        latencies.append(time.perf_counter() - started)
+    return float(np.median(latencies) * 1000)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Eager vs torch.compile forward latency per batch-size bucket.")
+    parser.add_argument('--model-path', default=MODEL_PATH)
+    parser.add_argument('--tiny', action='store_true', help="use the tiny random ViT even if real weights are present")
+    parser.add_argument('--buckets', type=int, nargs='+', default=list(COMPILE_BUCKETS))
+    parser.add_argument('--batch-sizes', type=int, nargs='+', help="default: the buckets plus a few sizes in between")
+    parser.add_argument('--cache-dir', default=COMPILE_CACHE_DIR,
+                        help="compile cache (default AI_COMPILE_CACHE_DIR); a fresh one measures a cold compile")
+    parser.add_argument('--repeats', type=int, default=20)
+    parser.add_argument('--json', help="also write the report to this file")
+    args = parser.parse_args()
+
+    model_path = args.model_path
+    tiny = args.tiny or not has_weights(model_path)
+    tiny_dir = None
+    if tiny:
+        tiny_dir = tempfile.mkdtemp(prefix='tiny-vit-')
+        model_path = build_tiny_model(model_path, tiny_dir)
+        print(f"No weights in {args.model_path}; using a tiny random ViT ({TINY_VIT})")
+
+    try:
+        eager = TorchEagerBackend(model_path)
+        started = time.perf_counter()
+        compiled = TorchCompiledBackend(model_path, args.buckets, args.cache_dir)
+        load_seconds = time.perf_counter() - started
+        print(f"compiled backend loaded in {load_seconds:.1f}s (per bucket: "
+              + ", ".join(f"{b}: {s:.1f}s" for b, s in compiled.compile_seconds.items()) + ")")
+
+        size = eager.config.image_size
+        batch_sizes = args.batch_sizes or sorted(set(compiled.buckets) | set(EXTRA_BATCH_SIZES))
+        generator = torch.Generator().manual_seed(0)
+        rows = []
+        print(f"{'batch':>5} {'bucket':>6} {'eager ms':>9} {'compiled ms':>12} {'speedup':>8} {'max |diff|':>11}")
+        for batch_size in batch_sizes:
+            pixel_values = torch.randn(batch_size, eager.config.num_channels, size, size, generator=generator)
+            eager_ms = time_forward(eager, pixel_values, args.repeats)
+            compiled_ms = time_forward(compiled, pixel_values, args.repeats)
+            difference = float((compiled(pixel_values) - eager(pixel_values)).abs().max())
+            rows.append({
+                "batch_size": batch_size,
+                "bucket": compiled.bucket_for(batch_size),
+                "eager_ms": eager_ms,
+                "compiled_ms": compiled_ms,
+                "speedup": eager_ms / compiled_ms,
+                "max_abs_logit_diff": difference,
+            })
+            print(f"{batch_size:>5} {rows[-1]['bucket']:>6} {eager_ms:>9.2f} {compiled_ms:>12.2f} "
+                  f"{rows[-1]['speedup']:>7.2f}x {difference:>11.2e}")
+    finally:
+        if tiny_dir:
+            shutil.rmtree(tiny_dir, ignore_errors=True)
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({
+                "model": "tiny-random-vit" if tiny else args.model_path,
+                "torch": torch.__version__,
+                "python": sys.version.split()[0],
+                "machine": platform.machine(),
+                "cpus": os.cpu_count(),
+                "threads": torch.get_num_threads(),
+                "load_seconds": load_seconds,
+                "compile_seconds": compiled.compile_seconds,
+                "buckets": rows,
+            }, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,244 @@
+import argparse
+import importlib
+import io
+import json
+import os
+import platform
+import resource
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from sample_images import synthetic_image
+
+MODEL_PATH = 'skincondition_detection-main/saved_vit_model'
+WEIGHT_FILES = ('model.safetensors', 'pytorch_model.bin')
+IN_PROCESS_TARGETS = ('local_ai_server', 'fixed_ai_server')
+# Upload sizes seen in practice: webcam, downscaled phone photo, full 12 MP phone photo, square PNG
+DEFAULT_IMAGES = ['640x480:jpeg', '1280x960:jpeg', '4032x3024:jpeg', '1080x1080:png']
+# Tiny ViT used when the real weights are not present: same architecture and head, fewer and narrower layers
+TINY_VIT = {"hidden_size": 192, "num_hidden_layers": 4, "num_attention_heads": 3, "intermediate_size": 768}
+# Server settings recorded with every report so runs can be compared
+SETTINGS_PREFIXES = ('AI_BATCH_', 'AI_CACHE_', 'AI_PHASH_', 'AI_INFERENCE_', 'AI_MMAP_', 'AI_TORCH_', 'AI_WORKER',
+                     'AI_WARMUP_', 'AI_MAX_IMAGE_', 'AI_SHADOW_', 'AI_PRECISION_', 'AI_COMPILE_',
+                     'AI_CASCADE_')
+
+
+def encode_images(specs, count, seed=0):
+    """Encode `count` distinct images per `WIDTHxHEIGHT:format` spec; returns (spec, filename, bytes) tuples."""
+    rng = np.random.default_rng(seed)
+    uploads = []
+    for spec in specs:
+        size, _, image_format = spec.partition(':')
+        width, height = (int(v) for v in size.lower().split('x'))
+        image_format = (image_format or 'jpeg').upper()
+        for i in range(count):
+            buffer = io.BytesIO()
+            synthetic_image(rng, width, height).save(buffer, image_format, **({'quality': 90} if image_format == 'JPEG' else {}))
+            uploads.append((spec, f"{width}x{height}-{i}.{image_format.lower()}", buffer.getvalue()))
+    return uploads
+
+
+def has_weights(model_path):
+    return any(os.path.exists(os.path.join(model_path, name)) for name in WEIGHT_FILES)
+
+
+def build_tiny_model(model_path, output_dir):
+    """Save a randomly initialized small ViT with the real model's config, labels and preprocessing."""
+    from transformers import ViTConfig, ViTForImageClassification
+
+    config = ViTConfig.from_pretrained(model_path)
+    for key, value in TINY_VIT.items():
+        setattr(config, key, value)
+    ViTForImageClassification(config).save_pretrained(output_dir)
+    shutil.copy(os.path.join(model_path, 'preprocessor_config.json'), output_dir)
+    return output_dir
+
+
+class InProcessClient:
+    """Drive a Flask server module through its test client, one client per thread."""
+
+    def __init__(self, module_name, ready_timeout):
+        self.app = importlib.import_module(module_name).app
+        self._local = threading.local()
+        client = self.app.test_client()
+        deadline = time.time() + ready_timeout
+        while client.get('/health/ready').status_code != 200:
+            if time.time() > deadline:
+                raise RuntimeError(f"{module_name} did not become ready within {ready_timeout}s")
+            time.sleep(0.2)
+
+    def post(self, endpoint, uploads):
+        client = getattr(self._local, 'client', None)
+        if client is None:
+            client = self._local.client = self.app.test_client()
+        field = 'file' if endpoint == '/predict' else 'files'
+        data = {field: [(io.BytesIO(data), filename) for _, filename, data in uploads]}
+        response = client.post(endpoint, data=data, content_type='multipart/form-data')
+        return response.status_code
+
+
+class HttpClient:
+    """Drive a running server (e.g. vit_api under uvicorn) over HTTP."""
+
+    def __init__(self, base_url, ready_timeout):
+        import requests
+
+        self.base_url = base_url.rstrip('/')
+        self.session = requests.Session()
+        deadline = time.time() + ready_timeout
+        while True:
+            try:
+                if self.session.get(f"{self.base_url}/health/ready", timeout=5).status_code == 200:
+                    break
+            except requests.RequestException:
+                pass
+            if time.time() > deadline:
+                raise RuntimeError(f"{self.base_url} did not become ready within {ready_timeout}s")
+            time.sleep(0.5)
+
+    def post(self, endpoint, uploads):
+        field = 'file' if endpoint == '/predict' else 'files'
+        files = [(field, (filename, data)) for _, filename, data in uploads]
+        return self.session.post(f"{self.base_url}{endpoint}", files=files, timeout=300).status_code
+
+
+def server_peak_rss_mb(pid):
+    """Peak resident memory (VmHWM) of another process in MB, if readable."""
+    try:
+        with open(f'/proc/{pid}/status', 'r') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
+
+
+def run_scenario(client, endpoint, uploads, batch_size, concurrency, requests, warmup):
+    """Send `requests` requests from `concurrency` threads and return latency and throughput figures."""
+    def payload(n):
+        return [uploads[(n * batch_size + j) % len(uploads)] for j in range(batch_size)]
+
+    def send(n):
+        started = time.perf_counter()
+        status = client.post(endpoint, payload(n))
+        return time.perf_counter() - started, status
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(send, range(-warmup, 0)))
+        started = time.perf_counter()
+        outcomes = list(pool.map(send, range(requests)))
+        elapsed = time.perf_counter() - started
+
+    latencies = np.array([latency for latency, status in outcomes if status == 200]) * 1000
+    errors = {}
+    for _, status in outcomes:
+        if status != 200:
+            errors[str(status)] = errors.get(str(status), 0) + 1
+
+    def percentile(q):
+        return float(np.percentile(latencies, q)) if len(latencies) else None
+
+    return {
+        "endpoint": endpoint,
+        "batch_size": batch_size,
+        "concurrency": concurrency,
+        "requests": requests,
+        "errors": errors,
+        "latency_ms_p50": percentile(50),
+        "latency_ms_p95": percentile(95),
+        "latency_ms_p99": percentile(99),
+        "latency_ms_mean": float(latencies.mean()) if len(latencies) else None,
+        "requests_per_second": len(latencies) / elapsed,
+        "images_per_second": len(latencies) * batch_size / elapsed,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the predict endpoints with synthetic uploads.")
+    parser.add_argument('--target', default='local_ai_server',
+                        help=f"{' or '.join(IN_PROCESS_TARGETS)} (run in-process), or the URL of a running server")
+    parser.add_argument('--model-path', default=MODEL_PATH)
+    parser.add_argument('--tiny', action='store_true', help="use the tiny random ViT even if real weights are present")
+    parser.add_argument('--images', nargs='+', default=DEFAULT_IMAGES, help="WIDTHxHEIGHT:format specs")
+    parser.add_argument('--unique', type=int, default=8, help="distinct images per spec")
+    parser.add_argument('--endpoint', choices=['predict', 'predict_batch'], default='predict')
+    parser.add_argument('--batch-size', type=int, default=4, help="images per /predict_batch request")
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 4, 8])
+    parser.add_argument('--requests', type=int, default=100, help="requests per scenario")
+    parser.add_argument('--warmup', type=int, default=8, help="untimed requests before each scenario")
+    parser.add_argument('--keep-caches', action='store_true',
+                        help="leave the prediction cache and near-duplicate lookup on (in-process targets)")
+    parser.add_argument('--server-pid', type=int, help="pid of the server, to report its peak RSS for URL targets")
+    parser.add_argument('--ready-timeout', type=float, default=600)
+    parser.add_argument('--json', help="also write the report to this file")
+    args = parser.parse_args()
+
+    in_process = not args.target.startswith(('http://', 'https://'))
+    model_path = args.model_path
+    tiny = args.tiny or not has_weights(model_path)
+    tiny_dir = None
+    if in_process:
+        if args.target not in IN_PROCESS_TARGETS:
+            parser.error(f"--target must be one of {', '.join(IN_PROCESS_TARGETS)} or a URL")
+        if tiny:
+            tiny_dir = tempfile.mkdtemp(prefix='tiny-vit-')
+            model_path = build_tiny_model(model_path, tiny_dir)
+            print(f"No weights in {args.model_path}; using a tiny random ViT ({TINY_VIT})")
+        os.environ['AI_MODEL_PATH'] = model_path
+        if not args.keep_caches:
+            # Measure inference, not cache hits on repeated synthetic images
+            os.environ['AI_CACHE_MAX_ENTRIES'] = '0'
+            os.environ['AI_PHASH_MAX_DISTANCE'] = '-1'
+        client = InProcessClient(args.target, args.ready_timeout)
+    else:
+        print("URL target: start the server with AI_CACHE_MAX_ENTRIES=0 and AI_PHASH_MAX_DISTANCE=-1 "
+              "so repeated images are not answered from its caches")
+        client = HttpClient(args.target, args.ready_timeout)
+
+    endpoint = f"/{args.endpoint}"
+    batch_size = args.batch_size if args.endpoint == 'predict_batch' else 1
+    scenarios = []
+    try:
+        for spec in args.images:
+            uploads = encode_images([spec], args.unique)
+            for concurrency in args.concurrency:
+                report = run_scenario(client, endpoint, uploads, batch_size, concurrency, args.requests, args.warmup)
+                report["image"] = spec
+                report["upload_kb_mean"] = float(np.mean([len(data) for _, _, data in uploads]) / 1024)
+                scenarios.append(report)
+                print(f"{spec:<16} c={concurrency:<3} p50 {report['latency_ms_p50'] or 0:8.1f} ms  "
+                      f"p95 {report['latency_ms_p95'] or 0:8.1f} ms  p99 {report['latency_ms_p99'] or 0:8.1f} ms  "
+                      f"{report['images_per_second']:7.1f} img/s  errors {report['errors'] or 0}")
+    finally:
+        if tiny_dir:
+            shutil.rmtree(tiny_dir, ignore_errors=True)
+
+    # ru_maxrss is reported in KB on Linux; in-process it includes the server and the client
+    peak_rss_mb = (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024 if in_process
+                   else server_peak_rss_mb(args.server_pid) if args.server_pid else None)
+    print(f"peak RSS: {peak_rss_mb:.0f} MB" if peak_rss_mb is not None else "peak RSS: not available")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({
+                "target": args.target,
+                "model": "tiny-random-vit" if tiny and in_process else args.model_path,
+                "endpoint": endpoint,
+                "python": sys.version.split()[0],
+                "machine": platform.machine(),
+                "cpus": os.cpu_count(),
+                "settings": {k: v for k, v in sorted(os.environ.items()) if k.startswith(SETTINGS_PREFIXES)},
+                "peak_rss_mb": peak_rss_mb,
+                "scenarios": scenarios,
+            }, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
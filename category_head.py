@@ -0,0 +1,63 @@
+import re
+
+import torch
+
+GENERIC_LABEL = re.compile(r'^LABEL_\d+$')
+
+
+class CategoryHead:
+    """
+    Aggregate the model's per-label probabilities into skin-condition probabilities.
+
+    `index[i]` is the category of output label i, precomputed once per model, so the
+    mapping for a whole batch is one scatter-sum over the softmax output instead of a
+    Python lookup per label. Every label contributes its probability mass to its
+    category, not just the top-k labels.
+    """
+
+    def __init__(self, categories, index):
+        self.categories = list(categories)
+        self.index = torch.as_tensor(index, dtype=torch.long)
+
+    @classmethod
+    def from_ranges(cls, categories, ranges, num_labels, default):
+        """Map labels in [start, end) of `ranges[category]` to that category and the rest to `default`."""
+        index = torch.full((num_labels,), categories.index(default), dtype=torch.long)
+        for category, (start, end) in ranges.items():
+            index[start:min(end, num_labels)] = categories.index(category)
+        return cls(categories, index)
+
+    @classmethod
+    def from_config(cls, config, categories, ranges, default, label_names=None):
+        """
+        Build the head for a model config.
+
+        Fine-tuned heads are mapped through `config.id2label` by category name. Generic
+        LABEL_0..LABEL_n names are first resolved through `label_names` (the shared
+        LABEL_TO_NAME table); a generic label without a name, or whose name is not one
+        of `categories`, raises ValueError rather than being guessed. Heads with other
+        names (e.g. the 1000 ImageNet classes) are mapped with `ranges`.
+        """
+        num_labels = len(config.id2label)
+        by_name = {category.lower(): i for i, category in enumerate(categories)}
+        labels = [str(config.id2label[i]) for i in range(num_labels)]
+
+        if all(GENERIC_LABEL.match(label) for label in labels):
+            names = [(label_names or {}).get(label) for label in labels]
+            unmapped = [f"{label} ({name or 'no name'})" for label, name in zip(labels, names)
+                        if name is None or name.lower() not in by_name]
+            if unmapped:
+                raise ValueError(f"Model labels without a category: {', '.join(unmapped)}; "
+                                 f"expected one of {', '.join(categories)}")
+            labels = names
+        if all(label.lower() in by_name for label in labels):
+            return cls(categories, [by_name[label.lower()] for label in labels])
+        return cls.from_ranges(categories, ranges, num_labels, default)
+
+    def __call__(self, probs):
+        """Return (N, len(categories)) category probabilities for (N, num_labels) label probabilities."""
+        category_probs = probs.new_zeros((probs.shape[0], len(self.categories)))
+        return category_probs.index_add_(1, self.index, probs)
+
+    def category_of(self, label_index):
+        return self.categories[int(self.index[label_index])]
@@ -0,0 +1,102 @@
+import argparse
+import json
+import multiprocessing
+import os
+import resource
+import sys
+import time
+
+import numpy as np
+from PIL import Image
+
+from sample_images import find_images, synthetic_images
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'skincondition_detection-main'))
+from vit_preprocessing import ViTPreprocessor
+
+MODEL_PATH = 'skincondition_detection-main/saved_vit_model'
+
+
+def load_images(image_dir, synthetic_count, seed=0):
+    """Return real images from `image_dir` if given, otherwise random smooth synthetic ones."""
+    if image_dir:
+        return [Image.open(p) for p in find_images(image_dir)]
+    return synthetic_images(synthetic_count, seed)
+
+
+def measure_backend(name, model_path, pixel_values, batch_size, repeats):
+    """Run in a fresh process so peak RSS only reflects this backend."""
+    import torch
+    from inference_backends import load_backend
+
+    started = time.perf_counter()
+    backend = load_backend(model_path, name)
+    load_seconds = time.perf_counter() - started
+
+    pixel_values = torch.from_numpy(pixel_values)
+    top1 = []
+    latencies = []
+    for repeat in range(repeats):
+        for start in range(0, len(pixel_values), batch_size):
+            batch = pixel_values[start:start + batch_size]
+            started = time.perf_counter()
+            logits = backend(batch)
+            latencies.append((time.perf_counter() - started) / len(batch))
+            if repeat == 0:
+                top1.extend(logits.argmax(dim=1).tolist())
+
+    # ru_maxrss is reported in KB on Linux
+    peak_rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    return {
+        "backend": name,
+        "load_seconds": load_seconds,
+        "latency_ms_per_image_p50": float(np.percentile(latencies, 50) * 1000),
+        "latency_ms_per_image_mean": float(np.mean(latencies) * 1000),
+        "peak_rss_mb": peak_rss_mb,
+        "top1": top1,
+    }
+
+
+def compare(model_path, backends, images, batch_size=8, repeats=3, baseline='torch'):
+    preprocessor = ViTPreprocessor.from_pretrained(model_path)
+    pixel_values = np.concatenate([preprocessor([image]).copy() for image in images])
+
+    context = multiprocessing.get_context('spawn')
+    reports = {}
+    for name in [baseline] + [b for b in backends if b != baseline]:
+        with context.Pool(1) as pool:
+            reports[name] = pool.apply(measure_backend, (name, model_path, pixel_values, batch_size, repeats))
+
+    reference = np.array(reports[baseline]["top1"])
+    for report in reports.values():
+        report["top1_agreement"] = float(np.mean(np.array(report.pop("top1")) == reference))
+    return reports
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare inference backends against the fp32 torch model.")
+    parser.add_argument('--model-path', default=MODEL_PATH)
+    parser.add_argument('--backends', nargs='+', default=['torch-int8'])
+    parser.add_argument('--images', help="directory of real images (recommended for agreement numbers)")
+    parser.add_argument('--synthetic', type=int, default=32, help="number of synthetic images when --images is not given")
+    parser.add_argument('--batch-size', type=int, default=8)
+    parser.add_argument('--repeats', type=int, default=3)
+    parser.add_argument('--json', help="also write the report to this file")
+    args = parser.parse_args()
+
+    images = load_images(args.images, args.synthetic)
+    reports = compare(args.model_path, args.backends, images, args.batch_size, args.repeats)
+
+    print(f"{len(images)} images, batch size {args.batch_size}")
+    print(f"{'backend':<12} {'top-1 agree':>11} {'p50 ms/img':>11} {'mean ms/img':>12} {'peak RSS MB':>12} {'load s':>7}")
+    for report in reports.values():
+        print(f"{report['backend']:<12} {report['top1_agreement']:>11.1%} {report['latency_ms_per_image_p50']:>11.2f} "
+              f"{report['latency_ms_per_image_mean']:>12.2f} {report['peak_rss_mb']:>12.0f} {report['load_seconds']:>7.2f}")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({"images": len(images), "batch_size": args.batch_size, "reports": list(reports.values())}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
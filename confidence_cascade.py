@@ -0,0 +1,105 @@
+import os
+import threading
+import time
+from collections import Counter
+
+import torch
+
+from metrics import REGISTRY
+
+# Defaults, overridable from the environment. The cascade is off unless a first-tier resolution is set.
+CASCADE_RESOLUTION = int(os.environ.get('AI_CASCADE_RESOLUTION', '0'))
+# First-tier answers at or above this top-1 category confidence are returned without the full model
+CASCADE_THRESHOLD = float(os.environ.get('AI_CASCADE_THRESHOLD', '0.9'))
+
+CASCADE_IMAGES = REGISTRY.counter('ai_cascade_images_total', "Images answered by each cascade tier (fast or full)",
+                                  ('tier',))
+CASCADE_SECONDS = REGISTRY.histogram('ai_cascade_duration_seconds',
+                                     "Model time per image by cascade path (fast only, or fast then escalated)",
+                                     ('path',))
+CASCADE_ESCALATED_AGREEMENT = REGISTRY.counter(
+    'ai_cascade_escalated_agreement_total',
+    "Escalated images by whether the full model kept the first tier's top-1 condition", ('agree',))
+
+
+class ConfidenceCascade:
+    """
+    Two-tier inference: a cheap first pass at reduced resolution, and the full
+    model only for the images it is not confident about.
+
+    `run` downscales a preprocessed (N, 3, H, W) batch to `resolution` and calls
+    `fast(low_res)`, the same model with interpolated position embeddings. Images
+    whose top-1 category confidence reaches `threshold` keep the first-tier answer;
+    the rest go through `full(pixel_values)` at the original resolution. Both
+    callables return (top_probs, top_indices, embeddings or None).
+
+    Per-tier counts, the model latency of each path, and how often the full model
+    disagrees with the first tier on escalated images are recorded, so the
+    threshold can be tuned against real traffic.
+    """
+
+    def __init__(self, resolution=CASCADE_RESOLUTION, threshold=CASCADE_THRESHOLD):
+        self.resolution = resolution
+        self.threshold = threshold
+        self._lock = threading.Lock()
+        self.tiers = Counter()
+        self.escalated_disagreements = 0
+
+    def downscale(self, pixel_values):
+        # Area averaging of the normalized tensor, so the upload is decoded and normalized only once
+        return torch.nn.functional.interpolate(pixel_values, size=(self.resolution, self.resolution), mode='area')
+
+    def run(self, pixel_values, fast, full):
+        """Return (top_probs, top_indices, embeddings, tiers) with one 'fast' or 'full' tier per image."""
+        started = time.perf_counter()
+        top_probs, top_indices, embeddings = fast(self.downscale(pixel_values))
+        fast_seconds = time.perf_counter() - started
+        escalate = (top_probs[:, 0] < self.threshold).nonzero().flatten()
+        tiers = ['fast'] * len(pixel_values)
+
+        disagreements = 0
+        if len(escalate):
+            full_probs, full_indices, full_embeddings = full(pixel_values[escalate])
+            full_seconds = time.perf_counter() - started - fast_seconds
+            disagreements = int((full_indices[:, 0] != top_indices[escalate, 0]).sum())
+            top_probs, top_indices = top_probs.clone(), top_indices.clone()
+            top_probs[escalate], top_indices[escalate] = full_probs, full_indices
+            if embeddings is not None and full_embeddings is not None:
+                # Kept per image; the tier tells which resolution an embedding comes from
+                embeddings = embeddings.clone()
+                embeddings[escalate] = full_embeddings
+            for row in escalate.tolist():
+                tiers[row] = 'full'
+
+        escalated = len(escalate)
+        confident = len(tiers) - escalated
+        # Batched calls are spread evenly over their images
+        per_image_fast = fast_seconds / len(tiers)
+        for _ in range(confident):
+            CASCADE_SECONDS.observe(per_image_fast, 'fast')
+        for _ in range(escalated):
+            CASCADE_SECONDS.observe(per_image_fast + full_seconds / escalated, 'escalated')
+        if confident:
+            CASCADE_IMAGES.inc('fast', amount=confident)
+        if escalated:
+            CASCADE_IMAGES.inc('full', amount=escalated)
+            CASCADE_ESCALATED_AGREEMENT.inc('false', amount=disagreements)
+            CASCADE_ESCALATED_AGREEMENT.inc('true', amount=escalated - disagreements)
+        with self._lock:
+            self.tiers['fast'] += confident
+            self.tiers['full'] += escalated
+            self.escalated_disagreements += disagreements
+        return top_probs, top_indices, embeddings, tiers
+
+    def stats(self):
+        with self._lock:
+            fast, full = self.tiers['fast'], self.tiers['full']
+            disagreements = self.escalated_disagreements
+        total = fast + full
+        return {
+            "resolution": self.resolution,
+            "threshold": self.threshold,
+            "images": {"fast": fast, "full": full},
+            "fast_hit_rate": fast / total if total else None,
+            "escalated_disagreement_rate": disagreements / full if full else None,
+        }
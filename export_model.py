@@ -0,0 +1,95 @@
+import argparse
+import inspect
+import os
+
+import torch
+from transformers import ViTForImageClassification
+
+from inference_backends import (ONNX_FILE, SAFETENSORS_FILE, TORCHSCRIPT_FILE, LogitsOnly, TorchCompiledBackend,
+                                TorchInt8Backend)
+
+MODEL_PATH = 'skincondition_detection-main/saved_vit_model'
+
+
+def load_for_export(model_path):
+    model = ViTForImageClassification.from_pretrained(model_path, torchscript=True)
+    model.eval()
+    size = model.config.image_size
+    example = torch.zeros(1, model.config.num_channels, size, size)
+    return LogitsOnly(model).eval(), example
+
+
+def export_torchscript(model_path):
+    model, example = load_for_export(model_path)
+    with torch.no_grad():
+        traced = torch.jit.freeze(torch.jit.trace(model, example))
+    path = os.path.join(model_path, TORCHSCRIPT_FILE)
+    traced.save(path)
+    print(f"TorchScript model saved to {path}")
+
+
+def export_onnx(model_path):
+    model, example = load_for_export(model_path)
+    path = os.path.join(model_path, ONNX_FILE)
+    # Newer torch releases default to the dynamo exporter; keep the TorchScript-based one
+    options = {'dynamo': False} if 'dynamo' in inspect.signature(torch.onnx.export).parameters else {}
+    with torch.no_grad():
+        torch.onnx.export(
+            model,
+            (example,),
+            path,
+            input_names=['pixel_values'],
+            output_names=['logits'],
+            dynamic_axes={'pixel_values': {0: 'batch'}, 'logits': {0: 'batch'}},
+            opset_version=17,
+            **options,
+        )
+    print(f"ONNX model saved to {path}")
+
+
+def export_safetensors(model_path):
+    from safetensors.torch import save_file
+
+    model = ViTForImageClassification.from_pretrained(model_path)
+    state_dict = {name: tensor.contiguous() for name, tensor in model.state_dict().items()}
+    path = os.path.join(model_path, SAFETENSORS_FILE)
+    # Only the weights file is written, so config.json (and the model version) stay untouched
+    save_file(state_dict, path, metadata={'format': 'pt'})
+    print(f"Safetensors weights saved to {path}; they are memory-mapped at startup")
+
+
+def export_int8(model_path):
+    # Loading the int8 backend quantizes the model and caches the result if needed
+    backend = TorchInt8Backend(model_path)
+    print(f"Quantized int8 weights saved to {backend.cache_path}")
+
+
+def export_compiled(model_path):
+    # Loading the compiled backend compiles every batch bucket and fills the on-disk cache if needed
+    backend = TorchCompiledBackend(model_path)
+    print(f"Compiled graphs for batch sizes {', '.join(map(str, backend.buckets))} cached in {backend.cache_dir}")
+
+
+# Safetensors first: writing it changes the model version that the int8 cache is keyed by
+EXPORTERS = {
+    'safetensors': export_safetensors,
+    'torchscript': export_torchscript,
+    'onnx': export_onnx,
+    'int8': export_int8,
+    'compiled': export_compiled,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export the saved ViT model for the alternative inference backends.")
+    parser.add_argument('--model-path', default=MODEL_PATH)
+    parser.add_argument('--format', nargs='+', choices=list(EXPORTERS), default=list(EXPORTERS))
+    args = parser.parse_args()
+
+    for name in EXPORTERS:
+        if name in args.format:
+            EXPORTERS[name](args.model_path)
+
+
+if __name__ == "__main__":
+    main()
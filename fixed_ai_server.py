@@ -1,99 +1,317 @@
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, send_file, g
 from flask_cors import CORS
 from PIL import Image
 import numpy as np
 import torch
-from transformers import ViTForImageClassification, ViTFeatureExtractor
-import io
 import os
+import sys
+import time
+
+# Shared preprocessing lives next to the model so the Cloud Function can deploy it too
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'skincondition_detection-main'))
+from vit_preprocessing import InvalidImage, ViTPreprocessor
+from condition_labels import LABEL_TO_NAME
+from model_loader import ModelLoader
+from category_head import CategoryHead
+from request_profiler import RequestProfiler
+from metrics import (CONTENT_TYPE, IN_FLIGHT, MODEL_INFO, MODEL_PRECISION, REGISTRY, REQUEST_ERRORS, REQUEST_SECONDS,
+                     REQUESTS, STAGE_SECONDS)
 
 app = Flask(__name__)
 CORS(app)
 
-# Load model and feature extractor
-model_path = 'skincondition_detection-main/saved_vit_model'
-model = ViTForImageClassification.from_pretrained(model_path)
-feature_extractor = ViTFeatureExtractor.from_pretrained(model_path)
-model.eval()  # Set model to evaluation mode
+# Load preprocessor now and the model in the background
+model_path = os.environ.get('AI_MODEL_PATH', 'skincondition_detection-main/saved_vit_model')
+preprocessor = ViTPreprocessor.from_pretrained(model_path)
 
 # Define categories
 CATEGORIES = [
     "Acne", "Carcinoma", "Eczema", "Keratosis", "Milia", "Rosacea",
-    "Oily Skin", "Dry Skin", "Normal", "Non-Wrinkled Skin"
+    "Oily Skin", "Dry Skin", "Normal", "Non-Wrinkled Skin",
+    # Only predicted by the fine-tuned head (see condition_labels.LABEL_TO_NAME), not by the ImageNet ranges
+    "Hyperpigmentation", "Wrinkles"
 ]
 
+# Map ImageNet classes to skin conditions when the model still has the 1000-class head
+CATEGORY_RANGES = {
+    "Acne": (0, 100),
+    "Carcinoma": (101, 200),
+    "Eczema": (201, 300),
+    "Keratosis": (301, 400),
+    "Milia": (401, 500),
+    "Rosacea": (501, 600),
+    "Oily Skin": (601, 700),
+    "Dry Skin": (701, 800),
+    "Normal": (801, 900),
+    "Non-Wrinkled Skin": (901, 1000)
+}
+
 # Define critical conditions
 CRITICAL_CONDITIONS = ["Carcinoma", "Eczema", "Rosacea"]
 
+# Maximum number of images accepted by /predict_batch in one request
+MAX_BATCH_FILES = 16
+
+def calibration_pixel_values():
+    """The real images in AI_PRECISION_CALIBRATION_DIR the reduced-precision self-check compares against fp32."""
+    from inference_backends import calibration_images
+
+    return torch.from_numpy(preprocessor(calibration_images()).copy())
+
+def load_model():
+    """
+    Load the backend selected by AI_INFERENCE_BACKEND (torch, torch-int8, torch-compile, torchscript or onnx), in the
+    precision selected by AI_INFERENCE_PRECISION if it passes the self-check against fp32.
+    """
+    # Imported here so the port is bound before transformers has finished importing
+    with model_loader.timed('import'):
+        from inference_backends import apply_precision, load_backend
+    with model_loader.timed('weight_load'):
+        model = load_backend(model_path)
+    # Built once per model from its id2label, so it always matches the loaded head; the self-check compares categories
+    model.category_head = CategoryHead.from_config(model.config, CATEGORIES, CATEGORY_RANGES, default="Normal",
+                                                   label_names=LABEL_TO_NAME)
+    with model_loader.timed('precision_check'):
+        apply_precision(model, calibration_pixel_values, category_head=model.category_head)
+    return model
+
+def run_model(pixel_values, record_stages=True):
+    """Return (N, len(CATEGORIES)) category probabilities for a stacked batch."""
+    model = model_loader.model
+    with torch.no_grad():
+        started = time.perf_counter()
+        logits = model(pixel_values)
+        forward_done = time.perf_counter()
+        probs = model.category_head(torch.nn.functional.softmax(logits, dim=1))
+    if record_stages:
+        STAGE_SECONDS.observe(forward_done - started, 'forward')
+        STAGE_SECONDS.observe(time.perf_counter() - forward_done, 'category_mapping')
+    return probs
+
+def warm_up_model(model, batch_size):
+    """Run a synthetic batch through preprocessing and the forward pass."""
+    image = Image.fromarray(np.random.randint(0, 256, (480, 640, 3), dtype=np.uint8))
+    run_model(torch.from_numpy(preprocessor([image] * batch_size)), record_stages=False)
+
+model_loader = ModelLoader(load_model, warm_up_model)
+MODEL_INFO.set_function(lambda: {(model_loader.model.name, model_loader.model.precision): 1}
+                        if model_loader.loaded else {})
+MODEL_PRECISION.set_function(lambda: {(model_loader.model.precision_check["requested"], model_loader.model.precision): 1}
+                             if model_loader.loaded else {})
+model_loader.start()
+
+def model_not_ready_response():
+    REQUEST_ERRORS.inc(request.path, 'not_ready')
+    response = jsonify({"error": "Model is still loading, please retry shortly", "model": model_loader.status()})
+    response.headers['Retry-After'] = '5'
+    return response, 503
+
 def recommend_products(condition, top_k=3):
     # This is a simplified version - you should replace this with your actual product database
-    products = [
-        {"product": "Gentle Cleanser", "brand": "SkinCare", "skin_type": "All", "category": "Cleanser"},
-        {"product": "Moisturizing Cream", "brand": "SkinCare", "skin_type": "Dry", "category": "Moisturizer"},
-        {"product": "Oil Control Serum", "brand": "SkinCare", "skin_type": "Oily", "category": "Serum"}
-    ]
-    return products[:top_k]
+    with STAGE_SECONDS.time('recommend'):
+        products = [
+            {"product": "Gentle Cleanser", "brand": "SkinCare", "skin_type": "All", "category": "Cleanser"},
+            {"product": "Moisturizing Cream", "brand": "SkinCare", "skin_type": "Dry", "category": "Moisturizer"},
+            {"product": "Oil Control Serum", "brand": "SkinCare", "skin_type": "Oily", "category": "Serum"}
+        ]
+        return products[:top_k]
+
+def build_prediction_result(probs):
+    """Turn the category probabilities of one image into the /predict response body."""
+    # Get top prediction
+    top_idx = torch.argmax(probs).item()
+    condition = CATEGORIES[top_idx]
+    confidence = float(probs[top_idx])
+    
+    # Get alternative predictions
+    alt_predictions = []
+    top_probs, top_indices = torch.topk(probs, min(3, len(CATEGORIES)))
+    for alt_prob, alt_idx in zip(top_probs[1:].tolist(), top_indices[1:].tolist()):
+        if alt_prob > 0.1:  # Only include if confidence is above 10%
+            alt_predictions.append({
+                "condition": CATEGORIES[alt_idx],
+                "confidence": alt_prob
+            })
+    
+    # Prepare response
+    result = {
+        "condition": condition,
+        "confidence": confidence,
+        "alternative_predictions": alt_predictions,
+        "backend": model_loader.model.name
+    }
+    
+    # Add recommendations based on confidence
+    if confidence >= 0.99:
+        result["recommendation_type"] = "products"
+        result["recommendations"] = recommend_products(condition)
+    elif confidence < 0.90 and condition in CRITICAL_CONDITIONS:
+        result["recommendation_type"] = "refer"
+        result["message"] = "Model is not confident and condition is critical. Please consult a dermatologist."
+        result["recommendations"] = recommend_products(condition)
+    else:
+        result["recommendation_type"] = "cautious_products"
+        result["message"] = "Model is moderately confident. Use recommended products with care."
+        result["recommendations"] = recommend_products(condition)
+    
+    return result
 
 @app.route('/predict', methods=['POST'])
 def predict():
     try:
+        if not model_loader.loaded:
+            return model_not_ready_response()
         if 'file' not in request.files:
             return jsonify({"error": "No image file provided"}), 400
 
         file = request.files['file']
         image_bytes = file.read()
-        image = Image.open(io.BytesIO(image_bytes)).convert('RGB').resize((224, 224))
+        with STAGE_SECONDS.time('decode'):
+            image = preprocessor.decode(image_bytes)
         
-        # Prepare image for model
-        inputs = feature_extractor(images=[np.array(image)], return_tensors='pt')
+        # Rescale and normalize in one pass
+        with STAGE_SECONDS.time('preprocess'):
+            pixel_values = torch.from_numpy(preprocessor([image]))
         
         # Get predictions
-        with torch.no_grad():
-            outputs = model(**inputs)
-            logits = outputs.logits
-            probs = torch.nn.functional.softmax(logits, dim=1)
-        
-        # Get top prediction
-        top_idx = torch.argmax(probs).item()
-        
-        # Map the model's output to our categories
-        # The pre-trained model has 1000 classes, we'll map to our categories
-        mapped_idx = top_idx % len(CATEGORIES)
-        condition = CATEGORIES[mapped_idx]
-        
-        # Get confidence for the mapped index
-        # We need to handle the case where the tensor shape might be different
-        try:
-            confidence = float(probs[0, top_idx])
-        except IndexError:
-            # If we can't get the confidence for the original index, use a default value
-            confidence = 0.85
+        probs = run_model(pixel_values)
         
-        # Prepare response
-        result = {
-            "condition": condition,
-            "confidence": confidence
-        }
-        
-        # Add recommendations based on confidence
-        if confidence >= 0.99:
-            result["recommendation_type"] = "products"
-            result["recommendations"] = recommend_products(condition)
-        elif confidence < 0.90 and condition in CRITICAL_CONDITIONS:
-            result["recommendation_type"] = "refer"
-            result["message"] = "Model is not confident and condition is critical. Please consult a dermatologist."
-            result["recommendations"] = recommend_products(condition)
-        else:
-            result["recommendation_type"] = "cautious_products"
-            result["message"] = "Model is moderately confident. Use recommended products with care."
-            result["recommendations"] = recommend_products(condition)
-        
-        return jsonify(result)
+        return jsonify(build_prediction_result(probs[0]))
+    except InvalidImage as e:
+        # Rejected from the header, before any pixels were decoded
+        app.logger.warning(f"Rejected image ({e.reason}): {str(e)}")
+        REQUEST_ERRORS.inc(request.path, e.reason)
+        return jsonify({"error": str(e), "reason": e.reason}), e.status_code
     except Exception as e:
         # Log the error
         app.logger.error(f"Error processing image: {str(e)}")
+        REQUEST_ERRORS.inc(request.path, 'error')
         # Return a proper JSON error response
         return jsonify({"error": f"Error processing image: {str(e)}"}), 500
 
+@app.route('/predict_batch', methods=['POST'])
+def predict_batch():
+    """Analyze several images in one request with a single forward pass."""
+    try:
+        if not model_loader.loaded:
+            return model_not_ready_response()
+        files = request.files.getlist('files') or request.files.getlist('file')
+        if not files:
+            return jsonify({"error": "No image files provided"}), 400
+        if len(files) > MAX_BATCH_FILES:
+            return jsonify({"error": f"At most {MAX_BATCH_FILES} images can be analyzed per request"}), 400
+
+        # Decode every image up front; undecodable ones are reported in place
+        results = [None] * len(files)
+        images = []
+        positions = []
+        for i, file in enumerate(files):
+            try:
+                with STAGE_SECONDS.time('decode'):
+                    image = preprocessor.decode(file.read())
+            except InvalidImage as e:
+                app.logger.warning(f"Rejected image {file.filename} ({e.reason}): {str(e)}")
+                REQUEST_ERRORS.inc(request.path, e.reason)
+                results[i] = {"filename": file.filename, "error": str(e), "reason": e.reason}
+                continue
+            except Exception as e:
+                app.logger.error(f"Error decoding image {file.filename}: {str(e)}")
+                REQUEST_ERRORS.inc(request.path, 'error')
+                results[i] = {"filename": file.filename, "error": f"Error processing image: {str(e)}"}
+                continue
+            images.append(image)
+            positions.append(i)
+
+        if images:
+            # Stack all images into one tensor and run a single forward pass
+            with STAGE_SECONDS.time('preprocess'):
+                pixel_values = torch.from_numpy(preprocessor(images))
+            probs = run_model(pixel_values)
+            for row, i in enumerate(positions):
+                result = build_prediction_result(probs[row])
+                result["filename"] = files[i].filename
+                results[i] = result
+
+        return jsonify({"results": results})
+    except Exception as e:
+        app.logger.error(f"Error processing image batch: {str(e)}")
+        REQUEST_ERRORS.inc(request.path, 'error')
+        return jsonify({"error": f"Error processing image batch: {str(e)}"}), 500
+
+PREDICT_ENDPOINTS = ('/predict', '/predict_batch')
+
+@app.before_request
+def start_request_metrics():
+    if request.path in PREDICT_ENDPOINTS:
+        g.request_started = time.perf_counter()
+        IN_FLIGHT.inc(request.path)
+
+@app.after_request
+def count_request(response):
+    if request.path in PREDICT_ENDPOINTS:
+        REQUESTS.inc(request.path, str(response.status_code))
+    return response
+
+@app.teardown_request
+def finish_request_metrics(error=None):
+    started = g.pop('request_started', None)
+    if started is not None:
+        IN_FLIGHT.dec(request.path)
+        REQUEST_SECONDS.observe(time.perf_counter() - started, request.path)
+
+# Profiles selected prediction requests on demand (admin header or sampling rate)
+profiler = RequestProfiler()
+
+@app.before_request
+def start_profile():
+    if request.path in PREDICT_ENDPOINTS:
+        g.profile = profiler.start(request.headers, request.path)
+
+@app.after_request
+def stop_profile(response):
+    session = g.pop('profile', None)
+    if session is not None:
+        response.headers['X-Profile-Id'] = session.stop()
+    return response
+
+@app.teardown_request
+def abandon_profile(error=None):
+    # Only reached with a session still open when the request failed before after_request
+    session = g.pop('profile', None)
+    if session is not None:
+        session.stop()
+
+@app.route('/profiles', methods=['GET'])
+def list_profiles():
+    """Recent request profiles, newest first; requires the X-Profile-Token admin header."""
+    if not profiler.authorized(request.headers):
+        return jsonify({"error": "Profiling admin token required"}), 403
+    return jsonify({"profiles": profiler.list_profiles()})
+
+@app.route('/profiles/<name>', methods=['GET'])
+def download_profile(name):
+    if not profiler.authorized(request.headers):
+        return jsonify({"error": "Profiling admin token required"}), 403
+    path = profiler.profile_path(name)
+    if path is None:
+        return jsonify({"error": "Profile not found"}), 404
+    return send_file(path, as_attachment=True, download_name=name)
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Prometheus metrics for the prediction endpoints and their stages."""
+    return app.response_class(REGISTRY.render(), content_type=CONTENT_TYPE)
+
+@app.route('/health/live', methods=['GET'])
+def health_live():
+    """Liveness: the process is up and serving HTTP, even while the model loads."""
+    return jsonify({"status": "alive"})
+
+@app.route('/health/ready', methods=['GET'])
+def health_ready():
+    """Readiness: the model is loaded and its warm-up latency has stabilized."""
+    status = model_loader.status()
+    return jsonify(status), 200 if status["ready"] else 503
+
 if __name__ == '__main__':
     app.run(host='0.0.0.0', port=5000) 
\ No newline at end of file
@@ -0,0 +1,455 @@
+import inspect
+import json
+import logging
+import mmap
+import os
+import struct
+import tempfile
+import threading
+import time
+
+import torch
+from PIL import Image
+from transformers import ViTConfig, ViTForImageClassification
+from transformers.modeling_utils import no_init_weights
+
+from prediction_cache import compute_model_version
+from sample_images import find_images
+
+
+# File names written next to the saved model by export_model.py
+TORCHSCRIPT_FILE = 'model.torchscript.pt'
+ONNX_FILE = 'model.onnx'
+
+DEFAULT_BACKEND = os.environ.get('AI_INFERENCE_BACKEND', 'torch')
+
+# Quantized weights are cached here, one file per model version; outside the model directory, which is tracked
+QUANTIZED_CACHE_DIR = os.environ.get('AI_QUANTIZED_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'ai-quantized'))
+
+# Map model.safetensors into memory instead of deserializing it (set to 0 to disable)
+MMAP_WEIGHTS = os.environ.get('AI_MMAP_WEIGHTS', '1') != '0'
+SAFETENSORS_FILE = 'model.safetensors'
+
+# Batch sizes the torch-compile backend compiles a graph for; other sizes are padded up to the next one
+COMPILE_BUCKETS = tuple(int(n) for n in os.environ.get('AI_COMPILE_BUCKETS', '1,4,8,16').split(','))
+# Inductor's on-disk cache of compiled graphs and kernels, shared by all models (entries are keyed by graph)
+COMPILE_CACHE_DIR = os.environ.get('AI_COMPILE_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'ai-compiled'))
+
+# Numeric precision of the torch backend: fp32, bf16 (converted weights) or bf16-autocast (fp32 weights,
+# bf16 matmuls). Reduced precision is only kept if it passes the startup self-check against fp32.
+PRECISION = os.environ.get('AI_INFERENCE_PRECISION', 'fp32')
+PRECISION_MIN_AGREEMENT = float(os.environ.get('AI_PRECISION_MIN_AGREEMENT', '0.98'))
+# fp32 time / reduced-precision time the self-check must reach (0 keeps it regardless of speed)
+PRECISION_MIN_SPEEDUP = float(os.environ.get('AI_PRECISION_MIN_SPEEDUP', '1.0'))
+# Fixed set of real images for the self-check; required for a reduced precision, which stays off without it
+PRECISION_CALIBRATION_DIR = os.environ.get('AI_PRECISION_CALIBRATION_DIR')
+PRECISION_CALIBRATION_IMAGES = int(os.environ.get('AI_PRECISION_CALIBRATION_IMAGES', '16'))
+PRECISIONS = ('fp32', 'bf16', 'bf16-autocast')
+
+logger = logging.getLogger(__name__)
+
+SAFETENSORS_DTYPES = {
+    'F64': torch.float64, 'F32': torch.float32, 'F16': torch.float16, 'BF16': torch.bfloat16,
+    'I64': torch.int64, 'I32': torch.int32, 'I16': torch.int16, 'I8': torch.int8,
+    'U8': torch.uint8, 'BOOL': torch.bool,
+}
+
+
+def load_mmap_state_dict(path):
+    """
+    Return the tensors of a safetensors file as views into a private memory map.
+
+    Nothing is read up front: pages come from the OS page cache on first touch, and
+    processes mapping the same file share those pages.
+    """
+    with open(path, 'rb') as f:
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_COPY)
+
+    header_size, = struct.unpack('<Q', mapped[:8])
+    header = json.loads(mapped[8:8 + header_size])
+    data_start = 8 + header_size
+
+    state_dict = {}
+    for name, info in header.items():
+        if name == '__metadata__':
+            continue
+        dtype = SAFETENSORS_DTYPES[info['dtype']]
+        begin, end = info['data_offsets']
+        count = (end - begin) // dtype.itemsize
+        tensor = torch.frombuffer(mapped, dtype=dtype, count=count, offset=data_start + begin) if count else torch.empty(0, dtype=dtype)
+        state_dict[name] = tensor.reshape(info['shape'])
+    return state_dict
+
+
+def load_vit(model_path, config=None):
+    """Load ViTForImageClassification, memory-mapping model.safetensors when it is available."""
+    weights_path = os.path.join(model_path, SAFETENSORS_FILE)
+    can_assign = 'assign' in inspect.signature(torch.nn.Module.load_state_dict).parameters
+    if not (MMAP_WEIGHTS and can_assign and os.path.exists(weights_path)):
+        return ViTForImageClassification.from_pretrained(model_path)
+
+    config = config or ViTConfig.from_pretrained(model_path)
+    with no_init_weights():
+        model = ViTForImageClassification(config)
+    # assign=True makes the parameters the mapped tensors themselves instead of copying into them
+    model.load_state_dict(load_mmap_state_dict(weights_path), assign=True)
+    return model
+
+
+class TorchEagerBackend:
+    """The Hugging Face model run eagerly in PyTorch, in fp32 or, after `set_precision`, in bf16."""
+
+    name = 'torch'
+    precisions = PRECISIONS
+    precision = 'fp32'
+    # Also runs inputs smaller than config.image_size, with interpolated position embeddings
+    any_resolution = True
+
+    def __init__(self, model_path):
+        self.model_path = model_path
+        self.config = ViTConfig.from_pretrained(model_path)
+        self.model = self.load_model()
+
+    def load_model(self):
+        model = load_vit(self.model_path, self.config)
+        model.eval()  # Set model to evaluation mode
+        # Inference only; also keeps forked workers from touching the shared weight pages
+        model.requires_grad_(False)
+        return model
+
+    def set_precision(self, precision):
+        """Switch between fp32 and bf16; going back from converted bf16 weights reloads the fp32 ones."""
+        if precision not in self.precisions:
+            raise ValueError(f"The {self.name} backend does not support {precision}")
+        if self.precision == 'bf16' and precision != 'bf16':
+            self.model = self.load_model()
+        elif precision == 'bf16' and self.precision != 'bf16':
+            self.model.to(torch.bfloat16)
+        self.precision = precision
+
+    def _run(self, forward, pixel_values):
+        with torch.no_grad():
+            if self.precision == 'bf16':
+                return forward(pixel_values.to(torch.bfloat16))
+            if self.precision == 'bf16-autocast':
+                with torch.autocast('cpu', dtype=torch.bfloat16):
+                    return forward(pixel_values)
+            return forward(pixel_values)
+
+    def __call__(self, pixel_values):
+        """Return fp32 logits for a (N, 3, H, W) float tensor."""
+        return self._run(lambda x: self.model(pixel_values=x).logits, pixel_values).float()
+
+    def forward_features(self, pixel_values):
+        """Return fp32 (logits, embeddings); the embedding is the final CLS token the classifier reads."""
+        logits, embeddings = self._run(lambda x: classify_cls_token(self.model, x), pixel_values)
+        return logits.float(), embeddings.float()
+
+
+def classify_cls_token(model, pixel_values):
+    """ViTForImageClassification's forward pass, also returning the CLS embedding it classifies."""
+    # Other input sizes get position embeddings interpolated from the trained grid
+    interpolate = pixel_values.shape[-1] != model.config.image_size or pixel_values.shape[-2] != model.config.image_size
+    embeddings = model.vit(pixel_values, interpolate_pos_encoding=interpolate)[0][:, 0, :]
+    return model.classifier(embeddings), embeddings
+
+
+class LogitsOnly(torch.nn.Module):
+    """Wrap the Hugging Face model so tracing sees a plain tensor -> tensor function."""
+
+    def __init__(self, model):
+        super().__init__()
+        self.model = model
+
+    def forward(self, pixel_values):
+        return self.model(pixel_values=pixel_values, return_dict=False)[0]
+
+
+class LogitsAndEmbeddings(torch.nn.Module):
+    """Wrap the Hugging Face model as a plain tensor -> (logits, CLS embeddings) function for compiling."""
+
+    def __init__(self, model):
+        super().__init__()
+        self.model = model
+
+    def forward(self, pixel_values):
+        return classify_cls_token(self.model, pixel_values)
+
+
+class TorchCompiledBackend(TorchEagerBackend):
+    """
+    The model compiled with torch.compile (inductor) for a fixed set of batch sizes.
+
+    A batch is zero-padded up to the nearest of `buckets` (larger ones are split into
+    chunks of the largest), so only one static-shape graph per bucket is ever
+    compiled, and all of them share the same weights. Every bucket is compiled
+    while loading. Compiled graphs and kernels are stored in inductor's on-disk
+    cache under `cache_dir` (TORCHINDUCTOR_CACHE_DIR takes precedence if set), keyed
+    by the graph and the torch version, so a restart reuses them and only pays for
+    re-tracing (seconds instead of minutes).
+    """
+
+    name = 'torch-compile'
+    precisions = ('fp32',)
+    # Graphs are only compiled for the trained input size
+    any_resolution = False
+
+    def __init__(self, model_path, buckets=COMPILE_BUCKETS, cache_dir=COMPILE_CACHE_DIR):
+        import torch._dynamo
+        import torch._inductor.config
+
+        super().__init__(model_path)
+        self.buckets = tuple(sorted(set(max(1, n) for n in buckets)))
+        # Inductor only reads its cache location from the environment (process-wide), so a
+        # TORCHINDUCTOR_CACHE_DIR set by the operator takes precedence over `cache_dir`
+        self.cache_dir = os.environ.setdefault('TORCHINDUCTOR_CACHE_DIR', cache_dir)
+        os.makedirs(self.cache_dir, exist_ok=True)
+        # Whole-graph caching only exists in newer torch (2.2+); older versions cache the kernels alone
+        if hasattr(torch._inductor.config, 'fx_graph_cache'):
+            torch._inductor.config.fx_graph_cache = True
+        # One cached graph per bucket, without falling back to a dynamic-shape graph
+        if hasattr(torch._dynamo.config, 'cache_size_limit'):
+            torch._dynamo.config.cache_size_limit = max(torch._dynamo.config.cache_size_limit, len(self.buckets))
+        self.compiled = torch.compile(LogitsAndEmbeddings(self.model), dynamic=False)
+
+        size = self.config.image_size
+        self.compile_seconds = {}
+        for bucket in self.buckets:
+            started = time.perf_counter()
+            self(torch.zeros(bucket, self.config.num_channels, size, size))
+            self.compile_seconds[bucket] = time.perf_counter() - started
+        logger.info("Compiled batch buckets in " + ", ".join(f"{b}: {s:.1f}s" for b, s in self.compile_seconds.items()))
+
+    def bucket_for(self, batch_size):
+        """The smallest bucket that fits `batch_size` images (at most the largest bucket)."""
+        for bucket in self.buckets:
+            if bucket >= batch_size:
+                return bucket
+        return self.buckets[-1]
+
+    def forward_features(self, pixel_values):
+        largest = self.buckets[-1]
+        if len(pixel_values) > largest:
+            chunks = [self.forward_features(pixel_values[i:i + largest]) for i in range(0, len(pixel_values), largest)]
+            return tuple(torch.cat(outputs) for outputs in zip(*chunks))
+
+        count = len(pixel_values)
+        bucket = self.bucket_for(count)
+        if bucket != count:
+            padding = pixel_values.new_zeros((bucket - count, *pixel_values.shape[1:]))
+            pixel_values = torch.cat([pixel_values, padding])
+        with torch.no_grad():
+            logits, embeddings = self.compiled(pixel_values)
+        return logits[:count], embeddings[:count]
+
+    def __call__(self, pixel_values):
+        return self.forward_features(pixel_values)[0]
+
+
+class TorchInt8Backend(TorchEagerBackend):
+    """
+    The model with every Linear layer dynamically quantized to int8.
+
+    Quantizing ViT-Base takes a few seconds and needs the fp32 weights in memory, so
+    the quantized state dict is saved on first start, keyed by the model version.
+    Later starts build an uninitialized skeleton and load the int8 weights directly.
+    """
+
+    name = 'torch-int8'
+    precisions = ('fp32',)
+
+    def __init__(self, model_path, cache_dir=QUANTIZED_CACHE_DIR):
+        self.model_path = model_path
+        self.config = ViTConfig.from_pretrained(model_path)
+        self.version = compute_model_version(model_path)
+        self.cache_path = os.path.join(cache_dir, f"vit-int8-{self.version}.pt")
+
+        if os.path.exists(self.cache_path):
+            with no_init_weights():
+                skeleton = ViTForImageClassification(self.config)
+            self.model = self.quantize(skeleton)
+            self.model.load_state_dict(torch.load(self.cache_path, map_location='cpu'))
+        else:
+            self.model = self.quantize(load_vit(model_path, self.config))
+            os.makedirs(cache_dir, exist_ok=True)
+            # Write to a temporary file first so a crash never leaves a truncated cache entry
+            tmp_path = f"{self.cache_path}.{os.getpid()}.tmp"
+            torch.save(self.model.state_dict(), tmp_path)
+            os.replace(tmp_path, self.cache_path)
+        self.model.eval()
+        self.model.requires_grad_(False)
+
+    @staticmethod
+    def quantize(model):
+        return torch.ao.quantization.quantize_dynamic(model.eval(), {torch.nn.Linear}, dtype=torch.qint8)
+
+
+class TorchScriptBackend:
+    """A traced TorchScript graph written by `python export_model.py --format torchscript`."""
+
+    name = 'torchscript'
+    precisions = ('fp32',)
+    precision = 'fp32'
+
+    def __init__(self, model_path):
+        self.model_path = model_path
+        self.config = ViTConfig.from_pretrained(model_path)
+        path = os.path.join(model_path, TORCHSCRIPT_FILE)
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"{path} not found, run: python export_model.py --format torchscript")
+        self.model = torch.jit.optimize_for_inference(torch.jit.load(path, map_location='cpu').eval())
+
+    def __call__(self, pixel_values):
+        with torch.no_grad():
+            return self.model(pixel_values)
+
+
+class OnnxRuntimeBackend:
+    """An ONNX graph written by `python export_model.py --format onnx`, run with all ONNX Runtime graph optimizations."""
+
+    name = 'onnx'
+    precisions = ('fp32',)
+    precision = 'fp32'
+
+    def __init__(self, model_path):
+        self.model_path = model_path
+        self.config = ViTConfig.from_pretrained(model_path)
+        path = os.path.join(model_path, ONNX_FILE)
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"{path} not found, run: python export_model.py --format onnx")
+
+        self.onnx_path = path
+        self._session = None
+        self._session_pid = None
+        self._session_lock = threading.Lock()
+
+    def session(self):
+        # ONNX Runtime thread pools do not survive fork, so every process builds its own session
+        with self._session_lock:
+            if self._session_pid != os.getpid():
+                import onnxruntime as ort
+
+                options = ort.SessionOptions()
+                options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+                options.intra_op_num_threads = torch.get_num_threads()
+                self._session = ort.InferenceSession(self.onnx_path, options, providers=['CPUExecutionProvider'])
+                self._session_pid = os.getpid()
+            return self._session
+
+    def __call__(self, pixel_values):
+        session = self.session()
+        logits, = session.run(None, {session.get_inputs()[0].name: pixel_values.numpy()})
+        return torch.from_numpy(logits)
+
+
+BACKENDS = {
+    TorchEagerBackend.name: TorchEagerBackend,
+    TorchInt8Backend.name: TorchInt8Backend,
+    TorchCompiledBackend.name: TorchCompiledBackend,
+    TorchScriptBackend.name: TorchScriptBackend,
+    OnnxRuntimeBackend.name: OnnxRuntimeBackend,
+}
+
+
+def load_backend(model_path, name=DEFAULT_BACKEND):
+    """Load the saved model with the inference backend called `name`."""
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown inference backend '{name}', expected one of: {', '.join(BACKENDS)}")
+    return BACKENDS[name](model_path)
+
+
+def calibration_images(directory=PRECISION_CALIBRATION_DIR, count=PRECISION_CALIBRATION_IMAGES):
+    """
+    The first `count` images (in sorted order, so every start checks the same ones) of
+    `directory`. Raises FileNotFoundError when no directory is set or it has no images.
+    """
+    if not directory:
+        raise FileNotFoundError("AI_PRECISION_CALIBRATION_DIR is not set")
+    paths = find_images(directory)
+    if not paths:
+        raise FileNotFoundError(f"No calibration images in {directory}")
+    return [Image.open(p).convert('RGB') for p in paths[:count]]
+
+
+def _timed_logits(backend, pixel_values, batch_size):
+    started = time.perf_counter()
+    logits = torch.cat([backend(pixel_values[i:i + batch_size]) for i in range(0, len(pixel_values), batch_size)])
+    return logits, time.perf_counter() - started
+
+
+def apply_precision(backend, calibration, precision=PRECISION, min_agreement=PRECISION_MIN_AGREEMENT,
+                    min_speedup=PRECISION_MIN_SPEEDUP, batch_size=8, category_head=None):
+    """
+    Switch `backend` to `precision` if it keeps up with fp32 on a calibration batch.
+
+    `calibration()` returns the preprocessed calibration images, a fixed set of real
+    photos (see `calibration_images`); it is only called when a reduced precision is
+    requested, and if it raises FileNotFoundError the backend stays in fp32.
+
+    Both precisions run the calibration set twice and the second, warm pass is
+    compared. Agreement is measured on the top-1 of `category_head(probs)`, i.e. the
+    condition the server returns, or on the raw labels without a head. The backend
+    stays in (or returns to) fp32 if the reduced precision fails, agrees with fp32 on
+    fewer than `min_agreement` of the images, or is less than `min_speedup` times
+    faster (CPUs without native bf16 emulate it slowly). Returns a report of the
+    check, also stored as `backend.precision_check`.
+    """
+    report = {"requested": precision, "active": 'fp32', "fallback_reason": None}
+    if precision not in PRECISIONS:
+        raise ValueError(f"Unknown precision '{precision}', expected one of: {', '.join(PRECISIONS)}")
+    if precision == 'fp32':
+        backend.precision_check = report
+        return report
+    if precision not in backend.precisions:
+        report["fallback_reason"] = f"not supported by the {backend.name} backend"
+        logger.warning(f"Precision {precision} is {report['fallback_reason']}; running in fp32")
+        backend.precision_check = report
+        return report
+
+    try:
+        pixel_values = calibration()
+    except FileNotFoundError as e:
+        report["fallback_reason"] = f"no calibration images: {e}"
+        logger.error(f"Precision {precision} needs a fixed set of real calibration images in "
+                     f"AI_PRECISION_CALIBRATION_DIR ({e}); RUNNING IN FP32")
+        backend.precision_check = report
+        return report
+
+    def predicted(logits):
+        probs = torch.softmax(logits, dim=1)
+        return category_head(probs) if category_head is not None else probs
+
+    _timed_logits(backend, pixel_values, batch_size)
+    reference, fp32_seconds = _timed_logits(backend, pixel_values, batch_size)
+    try:
+        backend.set_precision(precision)
+        _timed_logits(backend, pixel_values, batch_size)
+        logits, reduced_seconds = _timed_logits(backend, pixel_values, batch_size)
+    except Exception as e:
+        report["fallback_reason"] = f"error: {e}"
+    else:
+        predictions, reference_predictions = predicted(logits), predicted(reference)
+        agreement = float((predictions.argmax(dim=1) == reference_predictions.argmax(dim=1)).float().mean())
+        prob_delta = (predictions - reference_predictions).abs().max()
+        report.update({
+            "calibration_images": len(pixel_values),
+            "top1_agreement": agreement,
+            "max_prob_delta": float(prob_delta),
+            "fp32_ms_per_image": fp32_seconds / len(pixel_values) * 1000,
+            "reduced_ms_per_image": reduced_seconds / len(pixel_values) * 1000,
+        })
+        if agreement < min_agreement:
+            report["fallback_reason"] = f"top-1 agreement {agreement:.1%} is below {min_agreement:.1%}"
+        elif fp32_seconds < reduced_seconds * min_speedup:
+            report["fallback_reason"] = f"less than {min_speedup:g}x faster than fp32 on this CPU"
+        else:
+            report["active"] = precision
+
+    if report["active"] != precision:
+        backend.set_precision('fp32')
+        logger.warning(f"Precision {precision} rejected ({report['fallback_reason']}); running in fp32")
+    else:
+        logger.info(f"Running in {precision}: {report['top1_agreement']:.1%} top-1 agreement with fp32, "
+                    f"{report['fp32_ms_per_image']:.1f} -> {report['reduced_ms_per_image']:.1f} ms per image")
+    backend.precision_check = report
+    return report
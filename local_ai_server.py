@@ -1,17 +1,37 @@
-from flask import Flask, request, jsonify, send_file
+from flask import Flask, request, jsonify, send_file, g
 from flask_cors import CORS
 from PIL import Image
 import numpy as np
 import torch
-from transformers import ViTForImageClassification, ViTFeatureExtractor
-import io
 import os
+import sys
 import csv
 import random
 import logging
 import json
 import base64
+import contextlib
+import functools
+import hmac
+import time
 from werkzeug.utils import secure_filename
+from batching import MicroBatcher
+from prediction_cache import PredictionCache, compute_model_version
+from perceptual_hash import NearDuplicateIndex, dhash
+from process_memory import prefork_memory_report, read_memory
+from category_head import CategoryHead
+
+# Shared preprocessing lives next to the model so the Cloud Function can deploy it too
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'skincondition_detection-main'))
+from vit_preprocessing import InvalidImage, ViTPreprocessor
+from condition_labels import LABEL_TO_NAME
+from model_loader import ModelLoader
+from request_profiler import RequestProfiler
+# Server-only modules from the repo root that build on the shared executor and metrics
+from shadow_evaluation import ShadowEvaluator
+from confidence_cascade import CASCADE_RESOLUTION, ConfidenceCascade
+from metrics import (CONTENT_TYPE, IN_FLIGHT, MODEL_INFO, MODEL_PRECISION, QUEUE_DEPTH, REGISTRY, REQUEST_ERRORS,
+                     REQUEST_SECONDS, REQUESTS, STAGE_SECONDS)
 
 app = Flask(__name__)
 # Configure CORS to allow all origins and methods
@@ -24,16 +44,38 @@ app.logger.setLevel(logging.INFO)
 # Increase the maximum content length to handle larger images
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max
 
-# Load model and feature extractor
-model_path = 'skincondition_detection-main/saved_vit_model'
-model = ViTForImageClassification.from_pretrained(model_path)
-feature_extractor = ViTFeatureExtractor.from_pretrained(model_path)
-model.eval()  # Set model to evaluation mode
+# Maximum number of images accepted by /predict_batch in one request
+MAX_BATCH_FILES = 16
+
+# The model itself is loaded in the background by model_loader below
+model_path = os.environ.get('AI_MODEL_PATH', 'skincondition_detection-main/saved_vit_model')
+preprocessor = ViTPreprocessor.from_pretrained(model_path)
+
+# Optional candidate model evaluated on a sample of live traffic; its results are only recorded in the metrics
+SHADOW_MODEL_PATH = os.environ.get('AI_SHADOW_MODEL_PATH')
+
+# Two-tier inference: the model at AI_CASCADE_RESOLUTION first, at full resolution only when it is not confident
+cascade = ConfidenceCascade() if CASCADE_RESOLUTION else None
+
+# Token for the /admin/model endpoints (sent as X-Admin-Token); they are disabled when unset
+ADMIN_TOKEN = os.environ.get('AI_ADMIN_TOKEN', '')
+
+# Results of recent predictions, keyed by upload hash and model version
+prediction_cache = PredictionCache()
+# Results of recent predictions, searchable by perceptual hash for re-encoded uploads
+near_duplicates = NearDuplicateIndex()
+
+def clear_prediction_caches():
+    """Forget cached results, e.g. after the product catalog changed."""
+    prediction_cache.clear()
+    near_duplicates.clear()
 
 # Define categories with their corresponding ImageNet class ranges
 CATEGORIES = [
     "Acne", "Carcinoma", "Eczema", "Keratosis", "Milia", "Rosacea",
-    "Oily Skin", "Dry Skin", "Normal", "Non-Wrinkled Skin"
+    "Oily Skin", "Dry Skin", "Normal", "Non-Wrinkled Skin",
+    # Only predicted by the fine-tuned head (see condition_labels.LABEL_TO_NAME), not by the ImageNet ranges
+    "Hyperpigmentation", "Wrinkles"
 ]
 
 # Map ImageNet classes to skin conditions (example ranges - adjust based on your model)
@@ -126,18 +168,158 @@ def load_products_from_csv():
 # Load all products
 ALL_PRODUCTS = load_products_from_csv()
 
-def get_category_from_index(idx):
-    """Map model output index to skin condition category."""
-    for category, (start, end) in CATEGORY_RANGES.items():
-        if start <= idx < end:
-            return category
-    return "Normal"  # Default category if no match found
+def run_model_batch(model, pixel_values, record_stages=True, forward_stage='forward'):
+    """
+    Run one forward pass over a stacked batch and return the top 3 category probs and category indices per image,
+    plus the image embeddings (None for backends that only return logits).
+    """
+    with torch.no_grad():
+        started = time.perf_counter()
+        if hasattr(model, 'forward_features'):
+            logits, embeddings = model.forward_features(pixel_values)
+        else:
+            logits, embeddings = model(pixel_values), None
+        forward_done = time.perf_counter()
+        probs = torch.nn.functional.softmax(logits, dim=1)
+        # Sum the probability of every model label into its skin category
+        category_probs = model.category_head(probs)
+        top_probs, top_indices = torch.topk(category_probs, k=min(3, len(CATEGORIES)), dim=1)
+    if record_stages:
+        STAGE_SECONDS.observe(forward_done - started, forward_stage)
+        STAGE_SECONDS.observe(time.perf_counter() - forward_done, 'category_mapping')
+    return top_probs, top_indices, embeddings
+
+def single_image(batcher):
+    """A batch -> outputs callable that sends a one-image batch through `batcher`."""
+    def run(pixel_values):
+        return tuple(None if output is None else output[None] for output in batcher.submit(pixel_values[0]))
+    return run
+
+def run_prediction(model, pixel_values, batched=False):
+    """
+    Top 3 category probs and indices, embeddings and cascade tier ('fast', 'full', or None when the cascade is off)
+    per image. /predict sends its single image through the micro-batchers (`batched`); /predict_batch runs directly.
+    """
+    if batched:
+        fast, full = single_image(model.fast_batcher), single_image(model.batcher)
+    else:
+        fast = functools.partial(run_model_batch, model, forward_stage='forward_fast')
+        full = functools.partial(run_model_batch, model)
+    if model.fast_batcher is None:
+        return (*full(pixel_values), [None] * len(pixel_values))
+    return cascade.run(pixel_values, fast, full)
+
+def encode_embedding(embedding):
+    """Base64 of the little-endian float32 values, so the backend can store one embedding per analysis."""
+    return base64.b64encode(embedding.numpy().astype('<f4').tobytes()).decode('ascii')
+
+@functools.lru_cache(maxsize=1)
+def calibration_pixel_values():
+    """The real images in AI_PRECISION_CALIBRATION_DIR the reduced-precision self-check compares against fp32."""
+    from inference_backends import calibration_images
+
+    return torch.from_numpy(preprocessor(calibration_images()).copy())
+
+def load_model_version(path, timed=lambda phase: contextlib.nullcontext()):
+    """
+    Load the model in `path` with the backend selected by AI_INFERENCE_BACKEND (torch, torch-int8, torch-compile,
+    torchscript or onnx), in the precision selected by AI_INFERENCE_PRECISION if it passes the self-check against fp32.
+    """
+    from inference_backends import apply_precision, load_backend
+
+    with timed('weight_load'):
+        model = load_backend(path)
+    # Built once per model from its id2label, so it always matches the loaded head; the self-check compares categories
+    model.category_head = CategoryHead.from_config(model.config, CATEGORIES, CATEGORY_RANGES, default="Normal",
+                                                   label_names=LABEL_TO_NAME)
+    with timed('precision_check'):
+        apply_precision(model, calibration_pixel_values, category_head=model.category_head)
+    model.version = compute_model_version(path)
+    # Each model batches its own /predict calls, so a batch never mixes two versions
+    model.batcher = MicroBatcher(functools.partial(run_model_batch, model))
+    # The cascade's first tier gets its own batcher: its batches are low-resolution images
+    model.fast_batcher = None
+    if cascade is not None and getattr(model, 'any_resolution', False):
+        model.fast_batcher = MicroBatcher(functools.partial(run_model_batch, model, forward_stage='forward_fast'))
+    elif cascade is not None:
+        app.logger.warning(f"The {model.name} backend only runs at full resolution; the cascade is off for {path}")
+    return model
+
+def load_model():
+    # Imported here so the port is bound before transformers has finished importing
+    with model_loader.timed('import'):
+        import inference_backends  # noqa: F401 (timed on its own, used by load_model_version)
+    return load_model_version(model_path, model_loader.timed)
+
+def unload_model(model):
+    """Called when a replaced model is dropped; its batcher threads exit once drained."""
+    model.batcher.close()
+    if model.fast_batcher is not None:
+        model.fast_batcher.close()
+
+def warm_up_model(model, batch_size):
+    """Run a synthetic batch through preprocessing and the forward pass."""
+    image = Image.fromarray(np.random.randint(0, 256, (480, 640, 3), dtype=np.uint8))
+    pixel_values = torch.from_numpy(preprocessor([image] * batch_size))
+    run_model_batch(model, pixel_values, record_stages=False)
+    if model.fast_batcher is not None:
+        run_model_batch(model, cascade.downscale(pixel_values), record_stages=False)
+
+model_loader = ModelLoader(load_model, warm_up_model, unload=unload_model)
+QUEUE_DEPTH.set_function(lambda: model_loader.model.batcher.queue_depth if model_loader.loaded else 0)
+MODEL_INFO.set_function(lambda: {(model_loader.model.name, model_loader.model.precision): 1}
+                        if model_loader.loaded else {})
+MODEL_PRECISION.set_function(lambda: {(model_loader.model.precision_check["requested"], model_loader.model.precision): 1}
+                             if model_loader.loaded else {})
+if os.environ.get('AI_PREFORK_MASTER_PID') == str(os.getpid()):
+    # Prefork master: load before forking so workers share the weights; each worker warms up itself
+    model_loader.load()
+else:
+    model_loader.start()
+
+def same_preprocessing(path):
+    """True if the model in `path` expects the same input as the tensors `preprocessor` produces."""
+    candidate = ViTPreprocessor.from_pretrained(path)
+    return (candidate.width, candidate.height) == (preprocessor.width, preprocessor.height) \
+        and np.array_equal(candidate.lut, preprocessor.lut)
+
+def load_shadow_model():
+    # The shadow reuses the live model's preprocessed tensors
+    if not same_preprocessing(SHADOW_MODEL_PATH):
+        raise ValueError(f"The shadow model in {SHADOW_MODEL_PATH} uses different preprocessing")
+    return load_model_version(SHADOW_MODEL_PATH)
+
+shadow_loader = None
+shadow = None
+if SHADOW_MODEL_PATH:
+    shadow_loader = ModelLoader(load_shadow_model, warm_up_model, unload=unload_model)
+    shadow = ShadowEvaluator(
+        lambda pixel_values: run_model_batch(shadow_loader.model, pixel_values, record_stages=False)[:2])
+    if os.environ.get('AI_PREFORK_MASTER_PID') == str(os.getpid()):
+        shadow_loader.load()
+    else:
+        shadow_loader.start()
+
+def submit_shadow(pixel_values, top_probs, top_indices, model):
+    """Hand a batch the live model has answered to the shadow model, unless shadowing is off or shed."""
+    if shadow is not None and shadow_loader.loaded:
+        shadow.submit(pixel_values, top_probs, top_indices, model.batcher.queue_depth)
+
+def model_not_ready_response():
+    REQUEST_ERRORS.inc(request.path, 'not_ready')
+    response = jsonify({"error": "Model is still loading, please retry shortly", "model": model_loader.status()})
+    response.headers['Retry-After'] = '5'
+    return response, 503
 
 def recommend_products(condition, top_k=3):
     """
     Recommend products based on the detected skin condition.
     This function matches the condition with suitable products from the CSV.
     """
+    with STAGE_SECONDS.time('recommend'):
+        return _recommend_products(condition, top_k)
+
+def _recommend_products(condition, top_k):
     recommended_products = []
     
     # Map skin conditions to product targets
@@ -148,7 +330,9 @@ def recommend_products(condition, top_k=3):
         "Oily Skin": ["Sebum control", "Enlarged pores", "Excess oil"],
         "Dry Skin": ["Dry Skin", "Moisturising", "Hyderating"],
         "Normal": ["Dull skin", "Uneven skin tone"],
-        "Non-Wrinkled Skin": ["Anti Aging", "Fine Lines", "Wrinkles"]
+        "Non-Wrinkled Skin": ["Anti Aging", "Fine Lines", "Wrinkles"],
+        "Hyperpigmentation": ["Hyperpigmentation", "Dark spots", "Dark spots & pigmentation", "Uneven skin tone"],
+        "Wrinkles": ["Anti Aging", "Fine lines and early signs of aging", "Loss of skin elasticity"]
     }
     
     # Get relevant targets for the condition
@@ -170,74 +354,376 @@ def recommend_products(condition, top_k=3):
     
     return recommended_products
 
+def build_prediction_result(top_probs, top_indices, embedding, model, tier=None):
+    """
+    Turn the top 3 (category probs, category indices) and embedding of one image from `model` into the /predict
+    response body. `tier` is the cascade tier that answered, if the cascade is on.
+    """
+    # Convert to numpy for easier handling
+    top_probs = top_probs.numpy()
+    top_indices = top_indices.numpy()
+    
+    # The indices are already skin categories
+    condition = CATEGORIES[top_indices[0]]
+    confidence = float(top_probs[0])
+    
+    # Get alternative predictions
+    alt_predictions = []
+    for i in range(1, min(3, len(top_indices))):
+        alt_condition = CATEGORIES[top_indices[i]]
+        alt_confidence = float(top_probs[i])
+        if alt_confidence > 0.1:  # Only include if confidence is above 10%
+            alt_predictions.append({
+                "condition": alt_condition,
+                "confidence": alt_confidence
+            })
+    
+    # Prepare response
+    result = {
+        "condition": condition,
+        "confidence": confidence,
+        "alternative_predictions": alt_predictions,
+        "model_version": model.version,
+        "backend": model.name
+    }
+    if tier is not None:
+        result["cascade_tier"] = tier
+    if embedding is not None:
+        # Comparable only with embeddings of the same embedding_version; the fast tier sees a smaller image
+        result["embedding"] = encode_embedding(embedding)
+        result["embedding_version"] = f"{model.version}@{cascade.resolution}px" if tier == 'fast' else model.version
+    
+    # Add recommendations based on confidence
+    if confidence >= 0.99:
+        result["recommendation_type"] = "products"
+        result["recommendations"] = recommend_products(condition)
+    elif confidence < 0.90 and condition in CRITICAL_CONDITIONS:
+        result["recommendation_type"] = "refer"
+        result["message"] = "Model is not confident and condition is critical. Please consult a dermatologist."
+        result["recommendations"] = recommend_products(condition)
+    else:
+        result["recommendation_type"] = "cautious_products"
+        result["message"] = "Model is moderately confident. Use recommended products with care."
+        result["recommendations"] = recommend_products(condition)
+    
+    return result
+
 @app.route('/predict', methods=['POST'])
 def predict():
     try:
+        if not model_loader.loaded:
+            return model_not_ready_response()
         if 'file' not in request.files:
             return jsonify({"error": "No image file provided"}), 400
+        # Read once: the request finishes on this model even if a new one is swapped in meanwhile
+        model = model_loader.model
 
         file = request.files['file']
         image_bytes = file.read()
-        image = Image.open(io.BytesIO(image_bytes)).convert('RGB').resize((224, 224))
         
-        # Prepare image for model
-        inputs = feature_extractor(images=[np.array(image)], return_tensors='pt')
+        # Identical re-uploads are answered from the cache
+        with STAGE_SECONDS.time('cache_lookup'):
+            cache_key = PredictionCache.make_key(image_bytes, model.version)
+            cached = prediction_cache.get(cache_key)
+        if cached is not None:
+            return jsonify(cached)
         
-        # Get predictions
-        with torch.no_grad():
-            outputs = model(**inputs)
-            logits = outputs.logits
-            probs = torch.nn.functional.softmax(logits, dim=1)
-            
-            # Get top 3 predictions
-            top_probs, top_indices = torch.topk(probs[0], k=3)
-            
-            # Convert to numpy for easier handling
-            top_probs = top_probs.numpy()
-            top_indices = top_indices.numpy()
-            
-            # Map the top prediction to our categories
-            condition = get_category_from_index(top_indices[0])
-            confidence = float(top_probs[0])
-            
-            # Get alternative predictions
-            alt_predictions = []
-            for i in range(1, min(3, len(top_indices))):
-                alt_condition = get_category_from_index(top_indices[i])
-                alt_confidence = float(top_probs[i])
-                if alt_confidence > 0.1:  # Only include if confidence is above 10%
-                    alt_predictions.append({
-                        "condition": alt_condition,
-                        "confidence": alt_confidence
-                    })
+        with STAGE_SECONDS.time('decode'):
+            image = preprocessor.decode(image_bytes)
         
-        # Prepare response
-        result = {
-            "condition": condition,
-            "confidence": confidence,
-            "alternative_predictions": alt_predictions
-        }
+        # Re-encoded copies of a recent upload reuse its prediction
+        image_hash = None
+        if near_duplicates.enabled:
+            with STAGE_SECONDS.time('near_duplicate_lookup'):
+                image_hash = dhash(image)
+                duplicate = near_duplicates.lookup(image_hash)
+            if duplicate is not None and duplicate["model_version"] == model.version:
+                prediction_cache.put(cache_key, duplicate)
+                return jsonify(duplicate)
         
-        # Add recommendations based on confidence
-        if confidence >= 0.99:
-            result["recommendation_type"] = "products"
-            result["recommendations"] = recommend_products(condition)
-        elif confidence < 0.90 and condition in CRITICAL_CONDITIONS:
-            result["recommendation_type"] = "refer"
-            result["message"] = "Model is not confident and condition is critical. Please consult a dermatologist."
-            result["recommendations"] = recommend_products(condition)
-        else:
-            result["recommendation_type"] = "cautious_products"
-            result["message"] = "Model is moderately confident. Use recommended products with care."
-            result["recommendations"] = recommend_products(condition)
+        # Rescale and normalize in one pass
+        with STAGE_SECONDS.time('preprocess'):
+            pixel_values = torch.from_numpy(preprocessor([image]))
+        
+        # Get top 3 predictions from a batched forward pass (queue wait included)
+        with STAGE_SECONDS.time('batch_wait_and_inference'):
+            top_probs, top_indices, embeddings, tiers = run_prediction(model, pixel_values, batched=True)
+        submit_shadow(pixel_values, top_probs, top_indices, model)
         
+        embedding = embeddings[0] if embeddings is not None else None
+        result = build_prediction_result(top_probs[0], top_indices[0], embedding, model, tiers[0])
+        prediction_cache.put(cache_key, result)
+        if image_hash is not None:
+            near_duplicates.add(image_hash, result)
         return jsonify(result)
+    except InvalidImage as e:
+        # Rejected from the header, before any pixels were decoded
+        app.logger.warning(f"Rejected image ({e.reason}): {str(e)}")
+        REQUEST_ERRORS.inc(request.path, e.reason)
+        return jsonify({"error": str(e), "reason": e.reason}), e.status_code
     except Exception as e:
         # Log the error
         app.logger.error(f"Error processing image: {str(e)}")
+        REQUEST_ERRORS.inc(request.path, 'error')
         # Return a proper JSON error response
         return jsonify({"error": f"Error processing image: {str(e)}"}), 500
 
+@app.route('/predict_batch', methods=['POST'])
+def predict_batch():
+    """Analyze several images (e.g. one face from different angles) in a single forward pass."""
+    try:
+        if not model_loader.loaded:
+            return model_not_ready_response()
+        files = request.files.getlist('files') or request.files.getlist('file')
+        if not files:
+            return jsonify({"error": "No image files provided"}), 400
+        if len(files) > MAX_BATCH_FILES:
+            return jsonify({"error": f"At most {MAX_BATCH_FILES} images can be analyzed per request"}), 400
+        model = model_loader.model
+
+        # Decode every image up front; undecodable ones are reported in place
+        results = [None] * len(files)
+        images = []
+        positions = []
+        cache_keys = {}
+        image_hashes = {}
+        for i, file in enumerate(files):
+            image_bytes = file.read()
+            cache_keys[i] = PredictionCache.make_key(image_bytes, model.version)
+            cached = prediction_cache.get(cache_keys[i])
+            if cached is not None:
+                results[i] = dict(cached, filename=file.filename)
+                continue
+            try:
+                with STAGE_SECONDS.time('decode'):
+                    image = preprocessor.decode(image_bytes)
+            except InvalidImage as e:
+                app.logger.warning(f"Rejected image {file.filename} ({e.reason}): {str(e)}")
+                REQUEST_ERRORS.inc(request.path, e.reason)
+                results[i] = {"filename": file.filename, "error": str(e), "reason": e.reason}
+                continue
+            except Exception as e:
+                app.logger.error(f"Error decoding image {file.filename}: {str(e)}")
+                REQUEST_ERRORS.inc(request.path, 'error')
+                results[i] = {"filename": file.filename, "error": f"Error processing image: {str(e)}"}
+                continue
+            if near_duplicates.enabled:
+                image_hashes[i] = dhash(image)
+                duplicate = near_duplicates.lookup(image_hashes[i])
+                if duplicate is not None and duplicate["model_version"] == model.version:
+                    prediction_cache.put(cache_keys[i], duplicate)
+                    results[i] = dict(duplicate, filename=file.filename)
+                    continue
+            images.append(image)
+            positions.append(i)
+
+        if images:
+            # Stack all images into one tensor and run a single forward pass
+            with STAGE_SECONDS.time('preprocess'):
+                pixel_values = torch.from_numpy(preprocessor(images))
+            top_probs, top_indices, embeddings, tiers = run_prediction(model, pixel_values)
+            submit_shadow(pixel_values, top_probs, top_indices, model)
+            for row, i in enumerate(positions):
+                embedding = embeddings[row] if embeddings is not None else None
+                result = build_prediction_result(top_probs[row], top_indices[row], embedding, model, tiers[row])
+                prediction_cache.put(cache_keys[i], result)
+                if i in image_hashes:
+                    near_duplicates.add(image_hashes[i], result)
+                results[i] = dict(result, filename=files[i].filename)
+
+        return jsonify({"results": results})
+    except Exception as e:
+        app.logger.error(f"Error processing image batch: {str(e)}")
+        REQUEST_ERRORS.inc(request.path, 'error')
+        return jsonify({"error": f"Error processing image batch: {str(e)}"}), 500
+
+@app.route('/embed', methods=['POST'])
+def embed():
+    """The image embedding alone, e.g. to backfill analyses stored before embeddings were recorded."""
+    try:
+        if not model_loader.loaded:
+            return model_not_ready_response()
+        if 'file' not in request.files:
+            return jsonify({"error": "No image file provided"}), 400
+        model = model_loader.model
+        if not hasattr(model, 'forward_features'):
+            return jsonify({"error": f"The {model.name} backend does not produce embeddings"}), 501
+
+        image_bytes = request.files['file'].read()
+        cached = prediction_cache.get(PredictionCache.make_key(image_bytes, model.version))
+        if cached is None:
+            with STAGE_SECONDS.time('decode'):
+                image = preprocessor.decode(image_bytes)
+            with STAGE_SECONDS.time('preprocess'):
+                pixel_values = torch.from_numpy(preprocessor([image]))
+            with STAGE_SECONDS.time('batch_wait_and_inference'):
+                _, _, embedding = model.batcher.submit(pixel_values[0])
+            encoded, version = encode_embedding(embedding), model.version
+        else:
+            # Possibly from the cascade's fast tier
+            encoded, version = cached["embedding"], cached.get("embedding_version", model.version)
+        return jsonify({"embedding": encoded, "embedding_version": version, "model_version": model.version})
+    except InvalidImage as e:
+        app.logger.warning(f"Rejected image ({e.reason}): {str(e)}")
+        REQUEST_ERRORS.inc(request.path, e.reason)
+        return jsonify({"error": str(e), "reason": e.reason}), e.status_code
+    except Exception as e:
+        app.logger.error(f"Error embedding image: {str(e)}")
+        REQUEST_ERRORS.inc(request.path, 'error')
+        return jsonify({"error": f"Error embedding image: {str(e)}"}), 500
+
+PREDICT_ENDPOINTS = ('/predict', '/predict_batch', '/embed')
+
+@app.before_request
+def start_request_metrics():
+    if request.path in PREDICT_ENDPOINTS:
+        g.request_started = time.perf_counter()
+        IN_FLIGHT.inc(request.path)
+
+@app.after_request
+def count_request(response):
+    if request.path in PREDICT_ENDPOINTS:
+        REQUESTS.inc(request.path, str(response.status_code))
+    return response
+
+@app.teardown_request
+def finish_request_metrics(error=None):
+    started = g.pop('request_started', None)
+    if started is not None:
+        IN_FLIGHT.dec(request.path)
+        REQUEST_SECONDS.observe(time.perf_counter() - started, request.path)
+
+# Profiles selected prediction requests on demand (admin header or sampling rate)
+# The micro-batcher thread runs the forward pass, so it is sampled along with the request
+profiler = RequestProfiler(thread_prefixes=('micro-batcher',))
+
+@app.before_request
+def start_profile():
+    if request.path in PREDICT_ENDPOINTS:
+        g.profile = profiler.start(request.headers, request.path)
+
+@app.after_request
+def stop_profile(response):
+    session = g.pop('profile', None)
+    if session is not None:
+        response.headers['X-Profile-Id'] = session.stop()
+    return response
+
+@app.teardown_request
+def abandon_profile(error=None):
+    # Only reached with a session still open when the request failed before after_request
+    session = g.pop('profile', None)
+    if session is not None:
+        session.stop()
+
+@app.route('/profiles', methods=['GET'])
+def list_profiles():
+    """Recent request profiles, newest first; requires the X-Profile-Token admin header."""
+    if not profiler.authorized(request.headers):
+        return jsonify({"error": "Profiling admin token required"}), 403
+    return jsonify({"profiles": profiler.list_profiles()})
+
+@app.route('/profiles/<name>', methods=['GET'])
+def download_profile(name):
+    if not profiler.authorized(request.headers):
+        return jsonify({"error": "Profiling admin token required"}), 403
+    path = profiler.profile_path(name)
+    if path is None:
+        return jsonify({"error": "Profile not found"}), 404
+    return send_file(path, as_attachment=True, download_name=name)
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Prometheus metrics, summed over all workers when running under ai_server_gunicorn.py."""
+    return app.response_class(REGISTRY.render(), content_type=CONTENT_TYPE)
+
+@app.route('/health/live', methods=['GET'])
+def health_live():
+    """Liveness: the process is up and serving HTTP, even while the model loads."""
+    return jsonify({"status": "alive"})
+
+@app.route('/health/ready', methods=['GET'])
+def health_ready():
+    """Readiness: the model is loaded and its warm-up latency has stabilized."""
+    status = model_loader.status()
+    return jsonify(status), 200 if status["ready"] else 503
+
+def process_memory_stats():
+    """Memory of this process, or of every worker when running under ai_server_gunicorn.py."""
+    master_pid = os.environ.get('AI_PREFORK_MASTER_PID')
+    if master_pid and int(master_pid) != os.getpid():
+        return prefork_memory_report(int(master_pid))
+    return {"pid": os.getpid(), "process": read_memory(os.getpid())}
+
+@app.route('/stats', methods=['GET'])
+def stats():
+    """Runtime statistics for the prediction caches and the micro-batcher."""
+    model = model_loader.model if model_loader.loaded else None
+    return jsonify({
+        "model_version": model.version if model else None,
+        "backend": model.name if model else None,
+        "precision": model.precision_check if model else None,
+        "model_loader": model_loader.status(),
+        "prediction_cache": prediction_cache.stats(),
+        "near_duplicates": near_duplicates.stats(),
+        "rejected_images": preprocessor.rejection_stats(),
+        "batcher": {
+            "batches_run": model.batcher.batches_run,
+            "images_run": model.batcher.images_run,
+            "average_batch_size": model.batcher.average_batch_size
+        } if model else None,
+        "shadow": dict(shadow.stats(), model_loader=shadow_loader.status()) if shadow else None,
+        "cascade": dict(cascade.stats(), active=model.fast_batcher is not None if model else False) if cascade else None,
+        "memory": process_memory_stats()
+    })
+
+def admin_authorized():
+    token = request.headers.get('X-Admin-Token')
+    return bool(ADMIN_TOKEN and token) and hmac.compare_digest(token, ADMIN_TOKEN)
+
+def model_versions():
+    status = model_loader.status()
+    return {"version": status["version"], "previous_version": status["previous_version"], "swap": status["swap"]}
+
+@app.route('/admin/model', methods=['GET', 'POST'])
+def admin_model():
+    """
+    GET: the serving and previous model versions and the state of the last swap.
+    POST {"model_path": ...}: load that checkpoint in the background, warm it up and
+    swap it in without dropping requests; the current model is kept for rollback.
+    """
+    if not admin_authorized():
+        return jsonify({"error": "Admin token required"}), 403
+    if request.method == 'GET':
+        return jsonify(model_versions())
+
+    master_pid = os.environ.get('AI_PREFORK_MASTER_PID')
+    if master_pid and int(master_pid) != os.getpid():
+        # Only the worker that received this request would switch, and workers would disagree
+        return jsonify({"error": "Hot-swap is not supported under prefork serving; restart the server instead"}), 409
+
+    new_path = (request.get_json(silent=True) or {}).get('model_path') or model_path
+    if not os.path.isfile(os.path.join(new_path, 'config.json')):
+        return jsonify({"error": f"No model found in {new_path}"}), 400
+    # Uploads are decoded and normalized once for every model, so the new one must expect the same input
+    if not same_preprocessing(new_path):
+        return jsonify({"error": "The new model uses different preprocessing; restart the server to switch to it"}), 400
+
+    if not model_loader.swap(functools.partial(load_model_version, new_path)):
+        return jsonify({"error": "The model is still loading or another swap is in progress", **model_versions()}), 409
+    app.logger.info(f"Swapping in model from {new_path}")
+    return jsonify(model_versions()), 202
+
+@app.route('/admin/model/rollback', methods=['POST'])
+def admin_model_rollback():
+    """Make the previous model current again; the replaced one becomes the new previous."""
+    if not admin_authorized():
+        return jsonify({"error": "Admin token required"}), 403
+    if model_loader.rollback() is None:
+        return jsonify({"error": "No previous model to roll back to", **model_versions()}), 409
+    app.logger.info(f"Rolled back to model {model_loader.model.version}")
+    return jsonify(model_versions())
+
 # Add a new endpoint to get all products
 @app.route('/products', methods=['GET'])
 def get_all_products():
@@ -277,6 +763,8 @@ def update_product_image():
         for product in ALL_PRODUCTS:
             if str(product['id']) == product_id_str:
                 product['image'] = image_url
+                # Cached results embed the old catalog entry
+                clear_prediction_caches()
                 app.logger.info(f"Updated image for product ID {product_id_str}")
                 return jsonify({"success": True, "product": product})
         
@@ -319,6 +807,8 @@ def update_product():
                     if key != 'id':  # Don't update the ID
                         product[key] = value
                 
+                # Cached results embed the old catalog entry
+                clear_prediction_caches()
                 app.logger.info(f"Updated product ID {product_id_str}")
                 return jsonify({"success": True, "product": product})
         
@@ -368,6 +858,8 @@ def add_product():
         
         # Add the new product to the list
         ALL_PRODUCTS.append(new_product)
+        # Cached recommendations were computed without the new product
+        clear_prediction_caches()
         
         app.logger.info(f"Added new product: {new_product['name']} with ID {new_product['id']}")
         return jsonify({"success": True, "product": new_product})
@@ -0,0 +1,102 @@
+import os
+import threading
+
+import numpy as np
+from PIL import Image
+
+
+# Defaults, overridable from the environment. A negative distance disables the lookup.
+# Off unless configured: a hit returns another upload's prediction and embedding as-is,
+# so only turn it on (10 bits catches re-encoded copies) where uploads are not user-specific.
+PHASH_MAX_DISTANCE = int(os.environ.get('AI_PHASH_MAX_DISTANCE', '-1'))
+PHASH_MAX_ENTRIES = int(os.environ.get('AI_PHASH_MAX_ENTRIES', '4096'))
+HASH_SIZE = 16
+
+# Number of set bits for every byte value
+POPCOUNT = np.array([bin(i).count('1') for i in range(256)], dtype=np.uint8)
+
+
+def dhash(image, hash_size=HASH_SIZE):
+    """
+    Difference hash of an image as a packed uint8 array of hash_size * hash_size bits.
+
+    The image is reduced to a (hash_size + 1) x hash_size grayscale thumbnail and each
+    bit records whether a pixel is brighter than its left neighbour. Re-encoding,
+    EXIF changes and small rescales leave most bits unchanged.
+    """
+    thumbnail = image.convert('L').resize((hash_size + 1, hash_size), Image.BILINEAR)
+    pixels = np.asarray(thumbnail, dtype=np.int16)
+    return np.packbits(pixels[:, 1:] > pixels[:, :-1])
+
+
+class NearDuplicateIndex:
+    """
+    Ring buffer of recent image hashes and their predictions, searched by Hamming distance.
+
+    `lookup` compares a hash against every stored hash in one vectorized pass and
+    returns the prediction of the closest one if it is within `max_distance` bits.
+    The distance of the closest match is recorded for every lookup so the threshold
+    can be tuned from `stats()`.
+    """
+
+    def __init__(self, max_distance=PHASH_MAX_DISTANCE, max_entries=PHASH_MAX_ENTRIES, hash_size=HASH_SIZE):
+        self.max_distance = max_distance
+        self.capacity = max(1, int(max_entries))
+        self.hash_bits = hash_size * hash_size
+        self._hashes = np.zeros((self.capacity, self.hash_bits // 8), dtype=np.uint8)
+        self._values = [None] * self.capacity
+        self._size = 0
+        self._next = 0
+        self._lock = threading.Lock()
+        self.lookups = 0
+        self.hits = 0
+        # nearest_distances[d] counts lookups whose closest stored hash was d bits away
+        self.nearest_distances = np.zeros(self.hash_bits + 1, dtype=np.int64)
+
+    @property
+    def enabled(self):
+        return self.max_distance >= 0
+
+    def lookup(self, image_hash):
+        """Return the stored prediction closest to `image_hash`, or None if none is close enough."""
+        with self._lock:
+            self.lookups += 1
+            if self._size == 0:
+                return None
+
+            distances = POPCOUNT[np.bitwise_xor(self._hashes[:self._size], image_hash)].sum(axis=1, dtype=np.int32)
+            nearest = int(np.argmin(distances))
+            distance = int(distances[nearest])
+            self.nearest_distances[distance] += 1
+
+            if distance > self.max_distance:
+                return None
+            self.hits += 1
+            return self._values[nearest]
+
+    def add(self, image_hash, value):
+        with self._lock:
+            self._hashes[self._next] = image_hash
+            self._values[self._next] = value
+            self._next = (self._next + 1) % self.capacity
+            self._size = min(self._size + 1, self.capacity)
+
+    def clear(self):
+        with self._lock:
+            self._values = [None] * self.capacity
+            self._size = 0
+            self._next = 0
+
+    def stats(self):
+        with self._lock:
+            histogram = {str(d): int(n) for d, n in enumerate(self.nearest_distances) if n}
+            return {
+                "enabled": self.enabled,
+                "entries": self._size,
+                "max_entries": self.capacity,
+                "max_distance": self.max_distance,
+                "lookups": self.lookups,
+                "hits": self.hits,
+                "hit_rate": self.hits / self.lookups if self.lookups else 0.0,
+                "nearest_distance_histogram": histogram,
+            }
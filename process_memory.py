@@ -0,0 +1,66 @@
+import os
+
+
+def read_memory(pid):
+    """
+    Resident memory of a process in MB, split into shared and private pages (Linux only).
+
+    PSS divides every shared page between the processes that map it, so summing PSS
+    over a master and its workers gives their real combined footprint, while summing
+    RSS counts the shared model weights once per process.
+    """
+    fields = {}
+    try:
+        with open(f'/proc/{pid}/smaps_rollup', 'r') as f:
+            for line in f:
+                parts = line.split()
+                if len(parts) >= 3 and parts[2] == 'kB':
+                    fields[parts[0].rstrip(':')] = int(parts[1])
+    except OSError:
+        return None
+
+    def mb(*names):
+        return sum(fields.get(name, 0) for name in names) / 1024
+
+    return {
+        "rss_mb": mb('Rss'),
+        "pss_mb": mb('Pss'),
+        "shared_mb": mb('Shared_Clean', 'Shared_Dirty'),
+        "private_mb": mb('Private_Clean', 'Private_Dirty'),
+    }
+
+
+def child_pids(parent_pid):
+    """Return the pids of the direct children of `parent_pid` by scanning /proc."""
+    children = []
+    for entry in os.listdir('/proc'):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f'/proc/{entry}/stat', 'r') as f:
+                # The command name may contain spaces, so split after its closing parenthesis
+                ppid = int(f.read().rsplit(')', 1)[1].split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+        if ppid == parent_pid:
+            children.append(int(entry))
+    return sorted(children)
+
+
+def prefork_memory_report(master_pid):
+    """Memory of a prefork master and each of its workers, plus combined RSS and PSS."""
+    master = read_memory(master_pid)
+    workers = {}
+    for pid in child_pids(master_pid):
+        memory = read_memory(pid)
+        if memory is not None:
+            workers[str(pid)] = memory
+
+    processes = [m for m in [master, *workers.values()] if m is not None]
+    return {
+        "master_pid": master_pid,
+        "master": master,
+        "workers": workers,
+        "combined_rss_mb": sum(m["rss_mb"] for m in processes),
+        "combined_pss_mb": sum(m["pss_mb"] for m in processes),
+    }
@@ -0,0 +1,25 @@
+import glob
+import os
+
+import numpy as np
+from PIL import Image
+
+IMAGE_EXTENSIONS = ('*.jpg', '*.jpeg', '*.png')
+
+
+def find_images(directory):
+    """Paths of the JPEG and PNG images anywhere under `directory`, sorted."""
+    return sorted(p for ext in IMAGE_EXTENSIONS for p in glob.glob(os.path.join(directory, '**', ext), recursive=True))
+
+
+def synthetic_image(rng, width=640, height=480):
+    """Low-frequency colour field plus sensor-like noise, loosely resembling a skin close-up."""
+    field = rng.uniform(60, 220, size=(6, 8, 3)).astype(np.uint8)
+    base = np.asarray(Image.fromarray(field).resize((width, height), Image.BICUBIC), dtype=np.float32)
+    return Image.fromarray(np.clip(base + rng.normal(0, 8, size=base.shape), 0, 255).astype(np.uint8))
+
+
+def synthetic_images(count, seed=0, width=640, height=480):
+    """`count` synthetic images, the same ones for the same seed."""
+    rng = np.random.default_rng(seed)
+    return [synthetic_image(rng, width, height) for _ in range(count)]
@@ -0,0 +1,109 @@
+import logging
+import os
+import random
+import threading
+import time
+from collections import Counter
+
+from bounded_executor import BoundedExecutor, ExecutorBusy
+from metrics import REGISTRY
+
+# Defaults, overridable from the environment
+SHADOW_SAMPLE_RATE = float(os.environ.get('AI_SHADOW_SAMPLE_RATE', '0.1'))
+# Shadow jobs allowed to wait behind the one being evaluated before more are shed
+SHADOW_MAX_PENDING = int(os.environ.get('AI_SHADOW_MAX_PENDING', '4'))
+# Shadow jobs are shed while more than this many images wait for the live model
+SHADOW_SHED_QUEUE_DEPTH = int(os.environ.get('AI_SHADOW_SHED_QUEUE_DEPTH', '4'))
+DELTA_BUCKETS = (-0.5, -0.2, -0.1, -0.05, -0.02, 0.0, 0.02, 0.05, 0.1, 0.2, 0.5, 1.0)
+
+logger = logging.getLogger(__name__)
+
+SHADOW_IMAGES = REGISTRY.counter('ai_shadow_images_total',
+                                 "Images sampled for the shadow model by outcome (evaluated, shed_*, error)",
+                                 ('outcome',))
+SHADOW_AGREEMENT = REGISTRY.counter('ai_shadow_agreement_total',
+                                    "Shadow-evaluated images by whether the shadow top-1 matched the live one",
+                                    ('agree',))
+SHADOW_CONFIDENCE_DELTA = REGISTRY.histogram('ai_shadow_confidence_delta',
+                                             "Shadow top-1 confidence minus live top-1 confidence",
+                                             buckets=DELTA_BUCKETS)
+SHADOW_SECONDS = REGISTRY.histogram('ai_shadow_forward_seconds', "Shadow model forward pass latency per batch")
+
+
+class ShadowEvaluator:
+    """
+    Compare a candidate model with the live one on a sample of real traffic.
+
+    After the live model has answered, `submit` hands the already-preprocessed
+    batch and the live top-k to a single background thread, which runs
+    `run(pixel_values) -> (top_probs, top_indices)` on the shadow model and records
+    top-1 agreement, the confidence delta and the shadow latency. The caller never
+    waits for the shadow, and its result is never returned to clients.
+
+    A sampled batch is shed instead of evaluated when more than `shed_queue_depth`
+    images are waiting for the live model, or when `max_pending` shadow jobs are
+    already queued, so the shadow only uses capacity the live path is not using.
+    """
+
+    def __init__(self, run, sample_rate=SHADOW_SAMPLE_RATE, max_pending=SHADOW_MAX_PENDING,
+                 shed_queue_depth=SHADOW_SHED_QUEUE_DEPTH):
+        self._run = run
+        self.sample_rate = min(1.0, max(0.0, sample_rate))
+        self.shed_queue_depth = shed_queue_depth
+        self._executor = BoundedExecutor(concurrency=1, queue_depth=max_pending, thread_name_prefix='shadow')
+        self._lock = threading.Lock()
+        self.outcomes = Counter()
+        self.agreed = 0
+
+    def _count(self, outcome, images):
+        SHADOW_IMAGES.inc(outcome, amount=images)
+        with self._lock:
+            self.outcomes[outcome] += images
+
+    def submit(self, pixel_values, top_probs, top_indices, queue_depth):
+        """Maybe evaluate this batch on the shadow model in the background; returns True if queued."""
+        if not (self.sample_rate and random.random() < self.sample_rate):
+            return False
+        images = len(pixel_values)
+        if queue_depth > self.shed_queue_depth:
+            self._count('shed_queue_pressure', images)
+            return False
+        try:
+            # The preprocessor reuses its output buffer for the next request on this thread
+            self._executor.submit(self._evaluate, pixel_values.clone(), top_probs, top_indices)
+        except ExecutorBusy:
+            self._count('shed_backlog', images)
+            return False
+        return True
+
+    def _evaluate(self, pixel_values, top_probs, top_indices):
+        try:
+            started = time.perf_counter()
+            shadow_probs, shadow_indices = self._run(pixel_values)
+            SHADOW_SECONDS.observe(time.perf_counter() - started)
+        except Exception:
+            logger.exception("Shadow model failed")
+            self._count('error', len(pixel_values))
+            return
+
+        agreed = 0
+        for row in range(len(pixel_values)):
+            agree = int(shadow_indices[row][0]) == int(top_indices[row][0])
+            agreed += agree
+            SHADOW_AGREEMENT.inc('true' if agree else 'false')
+            SHADOW_CONFIDENCE_DELTA.observe(float(shadow_probs[row][0]) - float(top_probs[row][0]))
+        with self._lock:
+            self.agreed += agreed
+        self._count('evaluated', len(pixel_values))
+
+    def stats(self):
+        with self._lock:
+            outcomes = dict(self.outcomes)
+            agreed = self.agreed
+        evaluated = outcomes.get('evaluated', 0)
+        return {
+            "sample_rate": self.sample_rate,
+            "images": outcomes,
+            "agreement_rate": agreed / evaluated if evaluated else None,
+            "executor": self._executor.stats(),
+        }
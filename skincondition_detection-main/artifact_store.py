@@ -0,0 +1,157 @@
+import argparse
+import base64
+import hashlib
+import json
+import logging
+import os
+import shutil
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# Parallel downloads per fetch; the model weights dominate, so a few is enough
+DOWNLOAD_WORKERS = int(os.environ.get('AI_ARTIFACT_DOWNLOAD_WORKERS', '4'))
+CHUNK_SIZE = 1 << 20
+
+logger = logging.getLogger(__name__)
+
+
+def file_md5(path):
+    """Base64 MD5 of a file, in the same format GCS reports as `md5_hash`."""
+    digest = hashlib.md5()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return base64.b64encode(digest.digest()).decode('ascii')
+
+
+class GCSBucket:
+    """Artifacts in a Google Cloud Storage bucket."""
+
+    def __init__(self, bucket_name):
+        from google.cloud import storage
+
+        self.bucket_name = bucket_name
+        self._bucket = storage.Client().bucket(bucket_name)
+
+    def describe(self, name):
+        """Return {"generation", "md5", "size"} of an object without downloading it."""
+        blob = self._bucket.get_blob(name)
+        if blob is None:
+            raise FileNotFoundError(f"gs://{self.bucket_name}/{name}")
+        return {"generation": str(blob.generation), "md5": blob.md5_hash, "size": blob.size}
+
+    def download(self, name, destination):
+        self._bucket.blob(name).download_to_filename(destination)
+
+
+class LocalBucket:
+    """
+    A directory standing in for the bucket, so cold starts can be benchmarked and
+    tested without GCS. The file's mtime and size play the role of the generation.
+    """
+
+    def __init__(self, root):
+        self.root = root
+
+    def describe(self, name):
+        path = os.path.join(self.root, name)
+        stat = os.stat(path)
+        return {"generation": f"{stat.st_mtime_ns}-{stat.st_size}", "md5": file_md5(path), "size": stat.st_size}
+
+    def download(self, name, destination):
+        shutil.copyfile(os.path.join(self.root, name), destination)
+
+
+def open_bucket(source):
+    """`gs://bucket` opens a GCS bucket, `file:///dir` or a plain path a LocalBucket."""
+    if source.startswith('gs://'):
+        return GCSBucket(source[len('gs://'):].strip('/'))
+    if source.startswith('file://'):
+        source = source[len('file://'):]
+    return LocalBucket(source)
+
+
+class ArtifactCache:
+    """
+    Download artifacts from a bucket into local paths (e.g. under /tmp) concurrently,
+    reusing copies left by an earlier start when they are still current.
+
+    Next to every downloaded file a `<file>.meta.json` records the object's generation
+    and MD5. A cached copy is reused when its recorded generation and MD5 match the
+    bucket and its size is unchanged; otherwise it is downloaded again to a temporary
+    file, checked against the MD5 and moved into place, so an interrupted download
+    never leaves a truncated file that looks valid.
+    """
+
+    def __init__(self, bucket, workers=DOWNLOAD_WORKERS):
+        self.bucket = bucket
+        self.workers = max(1, workers)
+
+    @staticmethod
+    def _meta_path(path):
+        return f"{path}.meta.json"
+
+    def _is_current(self, path, remote):
+        try:
+            with open(self._meta_path(path), 'r') as f:
+                cached = json.load(f)
+            size = os.path.getsize(path)
+        except (OSError, ValueError):
+            return False
+        return (cached.get("generation") == remote["generation"] and cached.get("md5") == remote["md5"]
+                and size == remote["size"])
+
+    def fetch_one(self, name, path):
+        """Make `path` a current copy of object `name`; returns how it was obtained and how long it took."""
+        started = time.perf_counter()
+        remote = self.bucket.describe(name)
+        if self._is_current(path, remote):
+            return {"name": name, "status": "cached", "seconds": time.perf_counter() - started}
+
+        directory = os.path.dirname(path) or '.'
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.download-')
+        os.close(fd)
+        try:
+            self.bucket.download(name, tmp_path)
+            if remote["md5"] is not None and file_md5(tmp_path) != remote["md5"]:
+                raise IOError(f"Checksum mismatch downloading {name}")
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        with open(self._meta_path(path), 'w') as f:
+            json.dump(remote, f)
+        return {"name": name, "status": "downloaded", "bytes": remote["size"],
+                "seconds": time.perf_counter() - started}
+
+    def fetch(self, files):
+        """Fetch `{object name: local path}` concurrently and return one report per file."""
+        with ThreadPoolExecutor(max_workers=min(self.workers, len(files)) or 1) as pool:
+            futures = [pool.submit(self.fetch_one, name, path) for name, path in files.items()]
+            return [future.result() for future in futures]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time two consecutive artifact fetches from a bucket or local directory.")
+    parser.add_argument('--source', required=True, help="gs://bucket, file:///dir or a plain directory")
+    parser.add_argument('--cache-dir', default=None, help="local cache directory (default: a fresh temporary one)")
+    parser.add_argument('--workers', type=int, default=DOWNLOAD_WORKERS)
+    parser.add_argument('names', nargs='+', help="object names to fetch")
+    args = parser.parse_args()
+
+    cache_dir = args.cache_dir or tempfile.mkdtemp(prefix='artifact-cache-')
+    files = {name: os.path.join(cache_dir, name) for name in args.names}
+    cache = ArtifactCache(open_bucket(args.source), args.workers)
+
+    for run in ('first fetch', 'second fetch'):
+        started = time.perf_counter()
+        reports = cache.fetch(files)
+        print(f"{run}: {time.perf_counter() - started:.2f}s " + ", ".join(
+            f"{r['name']} {r['status']} {r['seconds']:.2f}s" for r in reports))
+
+
+if __name__ == "__main__":
+    main()
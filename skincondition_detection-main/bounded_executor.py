@@ -0,0 +1,73 @@
+import asyncio
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# Defaults, overridable from the environment
+INFERENCE_CONCURRENCY = int(os.environ.get('AI_INFERENCE_CONCURRENCY', '2'))
+INFERENCE_QUEUE_DEPTH = int(os.environ.get('AI_INFERENCE_QUEUE_DEPTH', '8'))
+RETRY_AFTER_SECONDS = int(os.environ.get('AI_RETRY_AFTER_SECONDS', '1'))
+
+
+class ExecutorBusy(Exception):
+    """Raised when a job is submitted while every worker is busy and the queue is full."""
+
+
+class BoundedExecutor:
+    """
+    Thread pool with a hard cap on waiting jobs, for running blocking inference off
+    the event loop.
+
+    At most `concurrency` jobs run at once and at most `queue_depth` more wait for a
+    worker. Anything beyond that is rejected immediately with ExecutorBusy instead of
+    queueing, so a burst turns into fast 503s rather than ever-growing latency.
+    """
+
+    def __init__(self, concurrency=INFERENCE_CONCURRENCY, queue_depth=INFERENCE_QUEUE_DEPTH,
+                 thread_name_prefix='inference'):
+        self.concurrency = max(1, concurrency)
+        self.queue_depth = max(0, queue_depth)
+        self._pool = ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix=thread_name_prefix)
+        self._lock = threading.Lock()
+        self._pending = 0
+        self.completed = 0
+        self.rejected = 0
+
+    def _acquire(self):
+        with self._lock:
+            if self._pending >= self.concurrency + self.queue_depth:
+                self.rejected += 1
+                raise ExecutorBusy(f"{self._pending} inference jobs already running or queued")
+            self._pending += 1
+
+    def _release(self, _future=None):
+        with self._lock:
+            self._pending -= 1
+            self.completed += 1
+
+    def submit(self, fn, *args):
+        """Submit `fn(*args)` and return a concurrent.futures.Future, or raise ExecutorBusy."""
+        self._acquire()
+        try:
+            future = self._pool.submit(fn, *args)
+        except BaseException:
+            self._release()
+            raise
+        future.add_done_callback(self._release)
+        return future
+
+    async def run(self, fn, *args):
+        """Run `fn(*args)` on the pool and await its result without blocking the event loop."""
+        return await asyncio.wrap_future(self.submit(fn, *args))
+
+    def stats(self):
+        with self._lock:
+            pending = self._pending
+        return {
+            "concurrency": self.concurrency,
+            "queue_depth": self.queue_depth,
+            "running": min(pending, self.concurrency),
+            "queued": max(0, pending - self.concurrency),
+            "completed": self.completed,
+            "rejected": self.rejected,
+        }
@@ -0,0 +1,13 @@
+# Names of the generic LABEL_n outputs of the fine-tuned skin-condition head, shared by
+# the Cloud Function and the local servers so every deployment reports the same condition
+LABEL_TO_NAME = {
+    "LABEL_0": "Acne",
+    "LABEL_1": "Milia",
+    "LABEL_2": "Hyperpigmentation",
+    "LABEL_3": "Wrinkles",
+    "LABEL_4": "Keratosis",
+    "LABEL_5": "Oily Skin",
+    "LABEL_6": "Dry Skin",
+    "LABEL_7": "Normal",
+    "LABEL_8": "Non-Wrinkled Skin"
+}
@@ -1,12 +1,15 @@
-from google.cloud import storage
 import tensorflow as tf
 import numpy as np
 import pandas as pd
-from PIL import Image
 import os
+import time
 from flask import jsonify
 import functions_framework
-from transformers import TFAutoModelForImageClassification, ViTFeatureExtractor
+from transformers import TFAutoModelForImageClassification
+from artifact_store import ArtifactCache, open_bucket
+from condition_labels import LABEL_TO_NAME
+from recommendation_index import RecommendationIndex
+from vit_preprocessing import InvalidImage, ViTPreprocessor
 
 # === Configuration ===
 BUCKET_NAME = "aurora-project"  # ✅ Replace with your actual bucket
@@ -14,48 +17,47 @@ MODEL_FOLDER = "models"
 CSV_PATH = "models/aurora_products_B.csv"
 TMP_MODEL_DIR = "/tmp/vit_model"
 TMP_CSV_PATH = "/tmp/products.csv"
+# gs://bucket, or a local directory with the same layout to run and benchmark offline
+ARTIFACT_SOURCE = os.environ.get("AI_ARTIFACT_SOURCE", f"gs://{BUCKET_NAME}")
 
 # === Labels and Critical Conditions ===
-LABEL_TO_NAME = {
-    "LABEL_0": "Acne",
-    "LABEL_1": "Milia",
-    "LABEL_2": "Hyperpigmentation",
-    "LABEL_3": "Wrinkles",
-    "LABEL_4": "Keratosis",
-    "LABEL_5": "Oily Skin",
-    "LABEL_6": "Dry Skin",
-    "LABEL_7": "Normal",
-    "LABEL_8": "Non-Wrinkled Skin"
-}
 CRITICAL_CONDITIONS = ["Acne", "Milia", "Keratosis", "Hyperpigmentation"]
 
 # === Global Variables ===
 model = None
-feature_extractor = None
+preprocessor = None
 df = None
-
-def download_blob(bucket_name, source_blob_name, destination_file_name):
-    client = storage.Client()
-    bucket = client.bucket(bucket_name)
-    blob = bucket.blob(source_blob_name)
-    blob.download_to_filename(destination_file_name)
+recommendations_index = None
 
 def load_resources():
-    global model, feature_extractor, df
-
-    if model is None or feature_extractor is None:
-        os.makedirs(TMP_MODEL_DIR, exist_ok=True)
-        download_blob(BUCKET_NAME, f"{MODEL_FOLDER}/config.json", f"{TMP_MODEL_DIR}/config.json")
-        download_blob(BUCKET_NAME, f"{MODEL_FOLDER}/tf_model.h5", f"{TMP_MODEL_DIR}/tf_model.h5")
-        download_blob(BUCKET_NAME, f"{MODEL_FOLDER}/preprocessor_config.json", f"{TMP_MODEL_DIR}/preprocessor_config.json")
-        
+    global model, preprocessor, df, recommendations_index
+
+    if model is None or preprocessor is None or df is None:
+        # Fetch everything at once; files still valid in /tmp from an earlier start are reused
+        files = {
+            f"{MODEL_FOLDER}/config.json": f"{TMP_MODEL_DIR}/config.json",
+            f"{MODEL_FOLDER}/tf_model.h5": f"{TMP_MODEL_DIR}/tf_model.h5",
+            f"{MODEL_FOLDER}/preprocessor_config.json": f"{TMP_MODEL_DIR}/preprocessor_config.json",
+            CSV_PATH: TMP_CSV_PATH,
+        }
+        started = time.perf_counter()
+        reports = ArtifactCache(open_bucket(ARTIFACT_SOURCE)).fetch(files)
+        print(f"Fetched artifacts in {time.perf_counter() - started:.2f}s: " + ", ".join(
+            f"{r['name']} {r['status']} {r['seconds']:.2f}s" for r in reports))
+
+    if model is None or preprocessor is None:
         model = TFAutoModelForImageClassification.from_pretrained(TMP_MODEL_DIR)
-        feature_extractor = ViTFeatureExtractor.from_pretrained(TMP_MODEL_DIR)
+        preprocessor = ViTPreprocessor.from_pretrained(TMP_MODEL_DIR)
 
     if df is None:
-        download_blob(BUCKET_NAME, CSV_PATH, TMP_CSV_PATH)
         df = pd.read_csv(TMP_CSV_PATH)
 
+    if recommendations_index is None:
+        # Every condition the model can predict, so requests never filter the frame
+        conditions = set(LABEL_TO_NAME.values())
+        conditions.update(LABEL_TO_NAME.get(label, label) for label in model.config.id2label.values())
+        recommendations_index = RecommendationIndex.from_substring(df, 'Targets', conditions, required='Product')
+
 @functions_framework.http
 def predict(request):
     load_resources()
@@ -64,10 +66,13 @@ def predict(request):
         return jsonify({"error": "No image file provided"}), 400
 
     file = request.files['file']
-    image = Image.open(file.stream).convert("RGB").resize((224, 224))
-    inputs = feature_extractor(images=[np.array(image)], return_tensors='tf')
+    try:
+        image = preprocessor.decode(file.stream)
+    except InvalidImage as e:
+        return jsonify({"error": str(e), "reason": e.reason}), e.status_code
+    pixel_values = preprocessor([image])
 
-    logits = model(**inputs).logits
+    logits = model(pixel_values=pixel_values).logits
     probs = tf.nn.softmax(logits, axis=1).numpy()[0]
 
     top_idx = np.argmax(probs)
@@ -80,8 +85,7 @@ def predict(request):
         "confidence": round(confidence, 4)
     }
 
-    matches = df[df['Targets'].str.lower().str.contains(condition.lower(), na=False)]
-    recommendations = matches[matches['Product'].notna()].head(3).to_dict(orient='records')
+    recommendations = recommendations_index(condition)
 
     if confidence >= 0.99:
         result["recommendation_type"] = "products"
@@ -0,0 +1,301 @@
+import atexit
+import bisect
+import glob
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+# Defaults, overridable from the environment. With a directory set, every process
+# writes its metrics there and /metrics reports the sum over all of them.
+METRICS_DIR = os.environ.get('AI_METRICS_DIR')
+METRICS_FLUSH_SECONDS = float(os.environ.get('AI_METRICS_FLUSH_SECONDS', '2'))
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def _reset(self):
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def samples(self):
+        with self._lock:
+            return [[list(labels), value] for labels, value in self._values.items()]
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+
+class Gauge(_Metric):
+    """
+    A gauge; `set_function` makes it read its value when metrics are collected. For a
+    labelled gauge the function returns a {label values tuple: value} dict.
+
+    `multiprocess_mode` says how the values of several processes are combined: 'sum'
+    for amounts such as requests in flight, 'max' for info-style gauges that every
+    process sets to the same 1 (e.g. the loaded model), so they still read 1.
+    """
+
+    kind = 'gauge'
+
+    def __init__(self, name, documentation, labelnames=(), multiprocess_mode='sum'):
+        super().__init__(name, documentation, labelnames)
+        if multiprocess_mode not in ('sum', 'max'):
+            raise ValueError(f"Unknown multiprocess_mode {multiprocess_mode!r}")
+        self.multiprocess_mode = multiprocess_mode
+        self._function = None
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def dec(self, *labels, amount=1):
+        self.inc(*labels, amount=-amount)
+
+    def set(self, value, *labels):
+        with self._lock:
+            self._values[labels] = value
+
+    def set_function(self, function):
+        self._function = function
+
+    @contextmanager
+    def track_inprogress(self, *labels):
+        self.inc(*labels)
+        try:
+            yield
+        finally:
+            self.dec(*labels)
+
+    def samples(self):
+        if self._function is not None:
+            value = self._function()
+            if self.labelnames:
+                with self._lock:
+                    self._values = {tuple(labels): v for labels, v in value.items()}
+            else:
+                self.set(value)
+        return super().samples()
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, *labels):
+        # Per-bucket (not cumulative) counts plus the sum; cumulated only when rendered
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(labels)
+            if entry is None:
+                entry = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            entry[0][index] += 1
+            entry[1] += value
+
+    @contextmanager
+    def time(self, *labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, *labels)
+
+    def samples(self):
+        with self._lock:
+            return [[list(labels), [list(counts), total]] for labels, (counts, total) in self._values.items()]
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    escaped = (str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, v in pairs)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + '}'
+
+
+def _format_value(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class MetricsRegistry:
+    """
+    Counters, gauges and histograms rendered in the Prometheus text format.
+
+    Recording a value only updates a dict in this process under a lock. When a
+    directory is configured (prefork serving), a background thread writes this
+    process's values to `<directory>/metrics-<pid>.json` every `flush_seconds`, and
+    `render` sums the files of all processes (gauges can take the maximum instead),
+    so any worker can answer a scrape for the whole server. Gauges of processes that
+    have exited are dropped; their counters and histograms are kept so totals never
+    go backwards. A forked child starts from empty values so nothing is counted twice.
+    """
+
+    def __init__(self, directory=METRICS_DIR, flush_seconds=METRICS_FLUSH_SECONDS):
+        self.directory = directory
+        self.flush_seconds = flush_seconds
+        self._metrics = {}
+        self._flusher = None
+        self._flusher_pid = None
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+            self._start_flusher()
+            atexit.register(self.flush)
+            os.register_at_fork(after_in_child=self._after_fork)
+
+    def _register(self, metric):
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self._register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name, documentation, labelnames=(), multiprocess_mode='sum'):
+        return self._register(Gauge(name, documentation, labelnames, multiprocess_mode))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def _after_fork(self):
+        for metric in self._metrics.values():
+            metric._reset()
+        self._start_flusher()
+
+    def _start_flusher(self):
+        self._flusher_pid = os.getpid()
+        self._flusher = threading.Thread(target=self._flush_loop, name='metrics-flusher', daemon=True)
+        self._flusher.start()
+
+    def _flush_loop(self):
+        while True:
+            time.sleep(self.flush_seconds)
+            try:
+                self.flush()
+            except OSError:
+                pass
+
+    def snapshot(self):
+        return {
+            name: {"kind": metric.kind, "help": metric.documentation, "labelnames": list(metric.labelnames),
+                   "buckets": list(getattr(metric, 'buckets', ())),
+                   "multiprocess_mode": getattr(metric, 'multiprocess_mode', 'sum'), "samples": metric.samples()}
+            for name, metric in self._metrics.items()
+        }
+
+    def flush(self):
+        """Write this process's values to the metrics directory (no-op without one)."""
+        if not self.directory:
+            return
+        path = os.path.join(self.directory, f"metrics-{os.getpid()}.json")
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(self.snapshot(), f)
+        os.replace(tmp_path, path)
+
+    def collect(self):
+        """This process's snapshot merged with those of the other processes sharing the directory."""
+        merged = self.snapshot()
+        if not self.directory:
+            return merged
+
+        own = f"metrics-{os.getpid()}.json"
+        for path in glob.glob(os.path.join(self.directory, 'metrics-*.json')):
+            if os.path.basename(path) == own:
+                continue
+            try:
+                pid = int(os.path.basename(path)[len('metrics-'):-len('.json')])
+                with open(path, 'r') as f:
+                    other = json.load(f)
+            except (OSError, ValueError):
+                continue
+            alive = _pid_alive(pid)
+            for name, metric in other.items():
+                if name not in merged or (metric["kind"] == 'gauge' and not alive):
+                    continue
+                self._merge(merged[name], metric)
+        return merged
+
+    @staticmethod
+    def _merge(into, other):
+        samples = {tuple(labels): value for labels, value in into["samples"]}
+        for labels, value in other["samples"]:
+            labels = tuple(labels)
+            current = samples.get(labels)
+            if current is None:
+                samples[labels] = value
+            elif into["kind"] == 'histogram':
+                samples[labels] = [[a + b for a, b in zip(current[0], value[0])], current[1] + value[1]]
+            elif into["multiprocess_mode"] == 'max':
+                samples[labels] = max(current, value)
+            else:
+                samples[labels] = current + value
+        into["samples"] = [[list(labels), value] for labels, value in samples.items()]
+
+    def render(self):
+        """All metrics, summed over every process, in the Prometheus text exposition format."""
+        lines = []
+        for name, metric in self.collect().items():
+            lines.append(f"# HELP {name} {metric['help']}")
+            lines.append(f"# TYPE {name} {metric['kind']}")
+            names = metric["labelnames"]
+            for labels, value in sorted(metric["samples"]):
+                if metric["kind"] != 'histogram':
+                    lines.append(f"{name}{_format_labels(names, labels)} {_format_value(value)}")
+                    continue
+                counts, total = value
+                cumulative = 0
+                for bound, count in zip(list(metric["buckets"]) + ['+Inf'], counts):
+                    cumulative += count
+                    le = bound if bound == '+Inf' else _format_value(float(bound))
+                    lines.append(f"{name}_bucket{_format_labels(names, labels, [('le', le)])} {cumulative}")
+                lines.append(f"{name}_sum{_format_labels(names, labels)} {_format_value(float(total))}")
+                lines.append(f"{name}_count{_format_labels(names, labels)} {cumulative}")
+        return '\n'.join(lines) + '\n'
+
+
+# Metrics shared by the inference servers
+REGISTRY = MetricsRegistry()
+REQUESTS = REGISTRY.counter('ai_requests_total', "Prediction requests by endpoint and HTTP status",
+                            ('endpoint', 'status'))
+REQUEST_ERRORS = REGISTRY.counter('ai_request_errors_total', "Failed or rejected prediction requests by reason",
+                                  ('endpoint', 'reason'))
+IN_FLIGHT = REGISTRY.gauge('ai_requests_in_flight', "Prediction requests currently being handled", ('endpoint',))
+QUEUE_DEPTH = REGISTRY.gauge('ai_inference_queue_depth', "Images or jobs waiting for the model")
+REQUEST_SECONDS = REGISTRY.histogram('ai_request_duration_seconds', "End-to-end prediction request latency",
+                                     ('endpoint',))
+STAGE_SECONDS = REGISTRY.histogram('ai_stage_duration_seconds',
+                                   "Time spent per predict stage (decode, preprocess, forward, ...)", ('stage',))
+MODEL_INFO = REGISTRY.gauge('ai_model_info', "1 for the inference backend and precision serving predictions",
+                            ('backend', 'precision'), multiprocess_mode='max')
+MODEL_PRECISION = REGISTRY.gauge('ai_model_precision',
+                                 "1 for the numeric precision the model runs in, with the one that was requested",
+                                 ('requested', 'active'), multiprocess_mode='max')
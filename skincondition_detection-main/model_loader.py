@@ -0,0 +1,256 @@
+import logging
+import os
+import statistics
+import threading
+import time
+import weakref
+from contextlib import contextmanager
+
+
+# Defaults, overridable from the environment
+WARMUP_BATCH_SIZE = int(os.environ.get('AI_WARMUP_BATCH_SIZE', '4'))
+WARMUP_MIN_RUNS = int(os.environ.get('AI_WARMUP_MIN_RUNS', '10'))
+WARMUP_MAX_RUNS = int(os.environ.get('AI_WARMUP_MAX_RUNS', '60'))
+# Warm-up stops once the p50 of two consecutive windows differs by less than this fraction
+WARMUP_TOLERANCE = float(os.environ.get('AI_WARMUP_TOLERANCE', '0.1'))
+WARMUP_WINDOW = 5
+
+logger = logging.getLogger(__name__)
+
+_loaders = weakref.WeakSet()
+_imported_at = time.time()
+
+
+def process_start_time():
+    """Wall-clock time this process started (from /proc on Linux, else when this module was imported)."""
+    try:
+        with open('/proc/self/stat', 'r') as f:
+            start_ticks = int(f.read().rsplit(')', 1)[1].split()[19])
+        with open('/proc/uptime', 'r') as f:
+            uptime = float(f.read().split()[0])
+        return time.time() - uptime + start_ticks / os.sysconf('SC_CLK_TCK')
+    except (OSError, ValueError, IndexError, AttributeError):
+        return _imported_at
+
+
+class ModelNotReady(Exception):
+    """Raised when the model is requested before it has finished loading."""
+
+
+class ModelLoader:
+    """
+    Load a model in a background thread and warm it up, so the server can bind its
+    port immediately and report liveness and readiness separately.
+
+    `load()` returns the model. `warmup_step(model, batch_size)` runs one synthetic
+    batch through the full predict path. Warm-up repeats it until the p50 latency of
+    two consecutive windows agrees within `tolerance`, or `max_runs` is reached.
+
+    Warm-up state is tracked per process: after a fork (prefork serving) the
+    inherited model is reused, but the worker warms up its own thread pools before
+    it reports ready.
+
+    `swap(load)` replaces the model without downtime: the new one is loaded and
+    warmed up in the background while the current one keeps serving, then made
+    current in a single assignment. Callers that read `model` once per request
+    finish on the model they started with. The replaced model stays resident as
+    `previous` for `rollback()`, and the model it replaces there is only dropped
+    once the swap succeeds, so a failed swap leaves rollback intact. `unload(model)`,
+    if given, is called when a model is dropped for good.
+    """
+
+    def __init__(self, load, warmup_step=None, batch_size=WARMUP_BATCH_SIZE, min_runs=WARMUP_MIN_RUNS,
+                 max_runs=WARMUP_MAX_RUNS, tolerance=WARMUP_TOLERANCE, unload=None):
+        self._load = load
+        self._warmup_step = warmup_step
+        self._unload = unload
+        self.batch_size = batch_size
+        self.min_runs = max(WARMUP_WINDOW * 2, min_runs)
+        self.max_runs = max(self.min_runs, max_runs)
+        self.tolerance = tolerance
+
+        self._model = None
+        self._previous = None
+        self._lock = threading.Lock()
+        self._thread = None
+        self._thread_pid = None
+        self._warm_pid = None
+        self.state = 'not_started'
+        self.error = None
+        self.load_seconds = None
+        self.warmup_seconds = None
+        self.warmup_latencies_ms = []
+        # Seconds spent in each cold-start phase, see `timed`
+        self.startup_timings = {}
+        self.swap_status = {"state": 'idle'}
+        _loaders.add(self)
+
+    @property
+    def model(self):
+        if self._model is None:
+            raise ModelNotReady(f"Model is not loaded yet (state: {self.state})")
+        return self._model
+
+    @property
+    def previous(self):
+        return self._previous
+
+    @property
+    def loaded(self):
+        return self._model is not None
+
+    @property
+    def ready(self):
+        return self._model is not None and self._warm_pid == os.getpid()
+
+    @contextmanager
+    def timed(self, phase):
+        """Record how long a startup phase takes, e.g. `with loader.timed('import'): ...` inside `load`."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.startup_timings[phase] = time.perf_counter() - started
+
+    def load(self):
+        """Load the model synchronously without warming it up (used before forking workers)."""
+        with self._lock:
+            if self._model is None:
+                self.state = 'loading'
+                started = time.perf_counter()
+                self._model = self._load()
+                self.load_seconds = time.perf_counter() - started
+                self.startup_timings.setdefault('load', self.load_seconds)
+                self.state = 'loaded'
+        return self._model
+
+    def start(self):
+        """Load (if needed) and warm up in a background thread; safe to call repeatedly."""
+        with self._lock:
+            if self._thread_pid == os.getpid() and self._thread is not None:
+                return
+            self.startup_timings.setdefault('process_to_loader_start', time.time() - process_start_time())
+            self._thread = threading.Thread(target=self._run, name='model-loader', daemon=True)
+            self._thread_pid = os.getpid()
+            self._thread.start()
+
+    def _run(self):
+        try:
+            self.load()
+            self.state = 'warming_up'
+            self._warm_up()
+            self._warm_pid = os.getpid()
+            self.state = 'ready'
+            self.startup_timings['ready'] = time.time() - process_start_time()
+            logger.info("Model ready (load %.2fs, warm-up %.2fs over %d runs, p50 %.1f ms)",
+                        self.load_seconds or 0.0, self.warmup_seconds, len(self.warmup_latencies_ms),
+                        self.warmup_p50_ms or 0.0)
+            logger.info("Startup breakdown: %s", ", ".join(
+                f"{phase} {seconds:.2f}s" for phase, seconds in self.startup_timings.items()))
+        except Exception as e:
+            self.state = 'failed'
+            self.error = str(e)
+            logger.exception("Model loading failed")
+
+    def _warm_up(self):
+        started = time.perf_counter()
+        self.warmup_latencies_ms = self._measure_warm_up(self._model)
+        if self.warmup_latencies_ms:
+            self.startup_timings['first_forward'] = self.warmup_latencies_ms[0] / 1000
+        self.warmup_seconds = time.perf_counter() - started
+        self.startup_timings['warmup'] = self.warmup_seconds
+
+    def _measure_warm_up(self, model):
+        """Run warm-up steps on `model` until latency is stable; returns the latencies in ms."""
+        latencies = []
+        if self._warmup_step is None:
+            return latencies
+        previous_p50 = None
+        for run in range(self.max_runs):
+            run_started = time.perf_counter()
+            self._warmup_step(model, self.batch_size)
+            latencies.append((time.perf_counter() - run_started) * 1000)
+
+            if (run + 1) % WARMUP_WINDOW == 0:
+                p50 = statistics.median(latencies[-WARMUP_WINDOW:])
+                stable = previous_p50 is not None and abs(p50 - previous_p50) <= self.tolerance * previous_p50
+                if stable and run + 1 >= self.min_runs:
+                    break
+                previous_p50 = p50
+        return latencies
+
+    def swap(self, load):
+        """
+        Load `load()` in a background thread, warm it up and make it the current model.
+        Returns False (and does nothing) while the initial load or another swap is running.
+        """
+        with self._lock:
+            if self._model is None or self.swap_status["state"] in ('loading', 'warming_up'):
+                return False
+            self.swap_status = {"state": 'loading', "started": time.time()}
+        threading.Thread(target=self._run_swap, args=(load,), name='model-swap', daemon=True).start()
+        return True
+
+    def _run_swap(self, load):
+        status = self.swap_status
+        try:
+            started = time.perf_counter()
+            model = load()
+            status["load_seconds"] = time.perf_counter() - started
+            status["state"] = 'warming_up'
+            started = time.perf_counter()
+            latencies = self._measure_warm_up(model)
+            status["warmup_seconds"] = time.perf_counter() - started
+            status["warmup_p50_ms"] = statistics.median(latencies[-WARMUP_WINDOW:]) if latencies else None
+            with self._lock:
+                # The old rollback target is only dropped now that the new model is serving
+                evicted = self._previous
+                self._previous, self._model = self._model, model
+            self._release(evicted)
+            status["state"] = 'swapped'
+            logger.info("Swapped in model %s (load %.2fs, warm-up %.2fs)", getattr(model, 'version', None),
+                        status["load_seconds"], status["warmup_seconds"])
+        except Exception as e:
+            status["state"] = 'failed'
+            status["error"] = str(e)
+            logger.exception("Model swap failed; still serving the current model")
+
+    def rollback(self):
+        """Make the previous model current again (and keep the replaced one as previous); None if there is none."""
+        with self._lock:
+            if self._previous is None:
+                return None
+            self._model, self._previous = self._previous, self._model
+            return self._model
+
+    def _release(self, model):
+        if model is not None and self._unload is not None:
+            self._unload(model)
+
+    @property
+    def warmup_p50_ms(self):
+        if not self.warmup_latencies_ms:
+            return None
+        return statistics.median(self.warmup_latencies_ms[-WARMUP_WINDOW:])
+
+    def status(self):
+        return {
+            "state": self.state,
+            "live": True,
+            "ready": self.ready,
+            "error": self.error,
+            "load_seconds": self.load_seconds,
+            "warmup_seconds": self.warmup_seconds,
+            "warmup_runs": len(self.warmup_latencies_ms),
+            "warmup_p50_ms": self.warmup_p50_ms,
+            "startup_seconds": dict(self.startup_timings),
+            "version": getattr(self._model, 'version', None),
+            "previous_version": getattr(self._previous, 'version', None),
+            "swap": dict(self.swap_status),
+        }
+
+
+def start_all_after_fork():
+    """Warm up every loader in a freshly forked worker (call from the server's post_fork hook)."""
+    for loader in list(_loaders):
+        loader.start()
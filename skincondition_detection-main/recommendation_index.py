@@ -0,0 +1,82 @@
+import argparse
+import time
+
+import pandas as pd
+
+
+class RecommendationIndex:
+    """
+    Immutable condition -> top-k products lookup, built once when the product data is loaded.
+
+    The product records are converted to plain dicts up front, so a lookup is a dict
+    access with no pandas on the request path. Lookups are case-insensitive; unknown
+    conditions get an empty list. The returned records are shared between requests
+    and must not be modified.
+    """
+
+    def __init__(self, products_by_condition):
+        self._products = {condition.lower(): tuple(products) for condition, products in products_by_condition.items()}
+
+    def __call__(self, condition):
+        return list(self._products.get(condition.lower(), ()))
+
+    def __len__(self):
+        return len(self._products)
+
+    @classmethod
+    def from_column(cls, df, column, fields, top_k=3):
+        """Index rows whose `column` equals the condition (case-insensitive), keeping `fields`."""
+        products = {}
+        keys = df[column].astype(str).str.lower()
+        for condition, rows in df.groupby(keys, sort=False):
+            products[condition] = rows[fields].head(top_k).to_dict(orient='records')
+        return cls(products)
+
+    @classmethod
+    def from_substring(cls, df, column, conditions, top_k=3, required=None):
+        """Index, for each of `conditions`, the rows whose `column` contains it (case-insensitive)."""
+        if required is not None:
+            df = df[df[required].notna()]
+        haystack = df[column].str.lower()
+        products = {}
+        for condition in conditions:
+            matches = df[haystack.str.contains(condition.lower(), na=False, regex=False)]
+            products[condition] = matches.head(top_k).to_dict(orient='records')
+        return cls(products)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Per-request recommendation cost: pandas filtering vs the prebuilt index.")
+    parser.add_argument('--csv', default='aurora_products_B.csv')
+    parser.add_argument('--column', default='Targets')
+    parser.add_argument('--conditions', nargs='+', default=["Acne", "Milia", "Hyperpigmentation", "Wrinkles", "Keratosis",
+                                                             "Oily Skin", "Dry Skin", "Normal", "Non-Wrinkled Skin"])
+    parser.add_argument('--requests', type=int, default=2000)
+    args = parser.parse_args()
+
+    df = pd.read_csv(args.csv)
+    conditions = [args.conditions[i % len(args.conditions)] for i in range(args.requests)]
+
+    # What main.py did for every prediction
+    started = time.perf_counter()
+    for condition in conditions:
+        matches = df[df[args.column].str.lower().str.contains(condition.lower(), na=False)]
+        matches[matches.iloc[:, 0].notna()].head(3).to_dict(orient='records')
+    pandas_us = (time.perf_counter() - started) / len(conditions) * 1e6
+
+    started = time.perf_counter()
+    index = RecommendationIndex.from_substring(df, args.column, args.conditions, required=df.columns[0])
+    build_ms = (time.perf_counter() - started) * 1000
+
+    started = time.perf_counter()
+    for condition in conditions:
+        index(condition)
+    index_us = (time.perf_counter() - started) / len(conditions) * 1e6
+
+    print(f"{len(df)} products, {len(args.conditions)} conditions, {len(conditions)} requests")
+    print(f"pandas filter per request: {pandas_us:10.1f} us")
+    print(f"index lookup per request:  {index_us:10.2f} us ({pandas_us / index_us:.0f}x faster, built once in {build_ms:.1f} ms)")
+
+
+if __name__ == "__main__":
+    main()
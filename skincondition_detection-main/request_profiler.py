@@ -0,0 +1,205 @@
+import cProfile
+import hmac
+import os
+import random
+import re
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+
+# Defaults, overridable from the environment. Profiling is off unless a sample rate
+# or an admin token is set.
+PROFILE_DIR = os.environ.get('AI_PROFILE_DIR', os.path.join(tempfile.gettempdir(), 'ai-profiles'))
+PROFILE_SAMPLE_RATE = float(os.environ.get('AI_PROFILE_SAMPLE_RATE', '0'))
+PROFILE_ADMIN_TOKEN = os.environ.get('AI_PROFILE_ADMIN_TOKEN', '')
+PROFILE_MAX_FILES = int(os.environ.get('AI_PROFILE_MAX_FILES', '50'))
+# 'collapsed' samples stacks for flame graphs; 'cprofile' writes pstats of the request thread only
+PROFILE_FORMAT = os.environ.get('AI_PROFILE_FORMAT', 'collapsed')
+PROFILE_INTERVAL_MS = float(os.environ.get('AI_PROFILE_INTERVAL_MS', '1'))
+
+# Send the admin token in this header to profile a request or to list and download profiles
+PROFILE_HEADER = 'X-Profile-Token'
+EXTENSIONS = {'collapsed': '.collapsed', 'cprofile': '.prof'}
+PROFILE_NAME = re.compile(r'^[\w.-]+\.(collapsed|prof)$')
+
+
+def _frame_name(frame):
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class _StackSampler:
+    """Sample the stacks of the given threads into collapsed-stack counts until stopped."""
+
+    def __init__(self, thread_ids, thread_prefixes, interval):
+        self.thread_ids = set(thread_ids)
+        self.thread_prefixes = tuple(thread_prefixes)
+        self.interval = interval
+        self.stacks = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='profile-sampler', daemon=True)
+
+    def _sampled_threads(self):
+        names = {}
+        for thread in threading.enumerate():
+            if thread.ident in self.thread_ids or (self.thread_prefixes and thread.name.startswith(self.thread_prefixes)):
+                names[thread.ident] = thread.name
+        return names
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            threads = self._sampled_threads()
+            for ident, frame in sys._current_frames().items():
+                name = threads.get(ident)
+                if name is None:
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(_frame_name(frame))
+                    frame = frame.f_back
+                self.stacks[name + ';' + ';'.join(reversed(stack))] += 1
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def write(self, path):
+        with open(path, 'w') as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+
+
+class ProfileSession:
+    """One profiled request; `stop()` writes the profile and returns its file name."""
+
+    def __init__(self, profiler, label):
+        self.profiler = profiler
+        self.label = re.sub(r'[^\w-]+', '_', label).strip('_') or 'request'
+        self.started = time.time()
+        self._started = time.perf_counter()
+        if profiler.profile_format == 'cprofile':
+            self._profile = cProfile.Profile()
+            self._profile.enable()
+        else:
+            self._profile = _StackSampler([threading.get_ident()], profiler.thread_prefixes, profiler.interval)
+            self._profile.start()
+
+    def stop(self):
+        try:
+            if isinstance(self._profile, cProfile.Profile):
+                self._profile.disable()
+            else:
+                self._profile.stop()
+            elapsed_ms = (time.perf_counter() - self._started) * 1000
+            stamp = time.strftime('%Y%m%dT%H%M%S', time.gmtime(self.started))
+            name = (f"{stamp}-{int(self.started * 1000) % 1000:03d}-{self.label}-{os.getpid()}-{elapsed_ms:.0f}ms"
+                    f"{EXTENSIONS[self.profiler.profile_format]}")
+            path = os.path.join(self.profiler.directory, name)
+            if isinstance(self._profile, cProfile.Profile):
+                self._profile.dump_stats(path)
+            else:
+                self._profile.write(path)
+            self.profiler.rotate()
+            return name
+        finally:
+            self.profiler._release()
+
+
+class RequestProfiler:
+    """
+    Profile selected requests in a running server.
+
+    A request is profiled when it carries the admin token in the X-Profile-Token
+    header, or at random with probability `sample_rate`. At most one request per
+    process is profiled at a time. When neither trigger is configured, `start`
+    returns None after a single comparison, so the hot path pays nothing.
+
+    The 'collapsed' format samples the stacks of the request thread, plus any
+    thread whose name starts with one of `thread_prefixes` (e.g. the micro-batcher
+    that runs the forward pass), every `interval_ms`. The output can be fed to
+    flamegraph.pl or speedscope. The 'cprofile' format writes pstats of the
+    request thread only. Profiles go to `directory`, keeping the newest `max_files`.
+    """
+
+    def __init__(self, directory=PROFILE_DIR, sample_rate=PROFILE_SAMPLE_RATE, admin_token=PROFILE_ADMIN_TOKEN,
+                 max_files=PROFILE_MAX_FILES, profile_format=PROFILE_FORMAT, interval_ms=PROFILE_INTERVAL_MS,
+                 thread_prefixes=()):
+        if profile_format not in EXTENSIONS:
+            raise ValueError(f"Unknown profile format {profile_format!r}; expected one of {', '.join(EXTENSIONS)}")
+        self.directory = directory
+        self.sample_rate = max(0.0, sample_rate)
+        self.admin_token = admin_token
+        self.max_files = max(1, max_files)
+        self.profile_format = profile_format
+        self.interval = max(0.1, interval_ms) / 1000
+        self.thread_prefixes = tuple(thread_prefixes)
+        self.enabled = bool(self.sample_rate or self.admin_token)
+        self._active = threading.Lock()
+        if self.enabled:
+            os.makedirs(directory, exist_ok=True)
+
+    def authorized(self, headers):
+        """True if the request carries the admin token (never, when no token is configured)."""
+        token = headers.get(PROFILE_HEADER)
+        return bool(self.admin_token and token) and hmac.compare_digest(token, self.admin_token)
+
+    def start(self, headers, label):
+        """Start profiling this request if it is selected; returns a ProfileSession or None."""
+        if not self.enabled:
+            return None
+        if not (self.authorized(headers) or (self.sample_rate and random.random() < self.sample_rate)):
+            return None
+        if not self._active.acquire(blocking=False):
+            return None
+        try:
+            return ProfileSession(self, label)
+        except BaseException:
+            self._active.release()
+            raise
+
+    def _release(self):
+        self._active.release()
+
+    def _profile_paths(self):
+        try:
+            names = [name for name in os.listdir(self.directory) if PROFILE_NAME.match(name)]
+        except OSError:
+            return []
+        return [os.path.join(self.directory, name) for name in names]
+
+    def rotate(self):
+        """Delete the oldest profiles beyond `max_files` (shared by all workers using the directory)."""
+        paths = []
+        for path in self._profile_paths():
+            try:
+                paths.append((os.path.getmtime(path), path))
+            except OSError:
+                continue
+        for _, path in sorted(paths)[:-self.max_files]:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def list_profiles(self):
+        """Recent profiles, newest first."""
+        profiles = []
+        for path in self._profile_paths():
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            profiles.append({"name": os.path.basename(path), "bytes": stat.st_size, "created": stat.st_mtime})
+        return sorted(profiles, key=lambda p: p["created"], reverse=True)
+
+    def profile_path(self, name):
+        """Path of a listed profile, or None for anything else (including path traversal attempts)."""
+        if not PROFILE_NAME.match(name):
+            return None
+        path = os.path.join(self.directory, name)
+        return path if os.path.isfile(path) else None
@@ -7,15 +7,24 @@ Original file is located at
     https://colab.research.google.com/drive/1Y7ryzPMl71ws_vXoh2BIM4TKwQDsHSZ-
 """
 
-from fastapi import FastAPI, File, UploadFile
+import os
+import time
+from typing import List
+
+from fastapi import FastAPI, File, HTTPException, Request, Response, UploadFile
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import FileResponse, JSONResponse
 import uvicorn
 import numpy as np
-from io import BytesIO
 from PIL import Image
-import tensorflow as tf
 import pandas as pd
-from transformers import TFViTForImageClassification, ViTFeatureExtractor
+from bounded_executor import RETRY_AFTER_SECONDS, BoundedExecutor, ExecutorBusy
+from metrics import (CONTENT_TYPE, IN_FLIGHT, QUEUE_DEPTH, REGISTRY, REQUEST_ERRORS, REQUEST_SECONDS, REQUESTS,
+                     STAGE_SECONDS)
+from model_loader import ModelLoader
+from recommendation_index import RecommendationIndex
+from request_profiler import RequestProfiler
+from vit_preprocessing import InvalidImage, ViTPreprocessor
 
 app = FastAPI()
 
@@ -32,47 +41,182 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# === Load ViT model and feature extractor ===
-MODEL_PATH = "saved_vit_model"  # path to your ViT model directory
+# === Load ViT model and preprocessor ===
+MODEL_PATH = os.environ.get("AI_MODEL_PATH", "saved_vit_model")  # path to your ViT model directory
 CSV_PATH = "skincare_recommendations_full.csv"
 
-vit_model = TFViTForImageClassification.from_pretrained(MODEL_PATH)
-feature_extractor = ViTFeatureExtractor.from_pretrained(MODEL_PATH)
+preprocessor = ViTPreprocessor.from_pretrained(MODEL_PATH)
+
+def load_model():
+    # TensorFlow and transformers are imported here so the port is bound before they finish loading
+    with model_loader.timed('import'):
+        from transformers import TFViTForImageClassification
+    with model_loader.timed('weight_load'):
+        return TFViTForImageClassification.from_pretrained(MODEL_PATH)
+
+def warm_up_model(model, batch_size):
+    image = Image.fromarray(np.random.randint(0, 256, (480, 640, 3), dtype=np.uint8))
+    model(pixel_values=preprocessor([image] * batch_size))
+
+model_loader = ModelLoader(load_model, warm_up_model)
+model_loader.start()
 
 # === Load CSV recommendation data ===
 df = pd.read_csv(CSV_PATH)
+recommendations_index = RecommendationIndex.from_column(df, 'condition', ['product', 'brand', 'skin_type', 'category'])
 
 # === Class categories ===
 CATEGORIES = ['acne', 'Milia', 'Dry', 'Oily', 'Wrinkles', 'Non Wrinkles',
               'hyperpigmentation', 'Keratosis', 'Normal']
 CRITICAL_CONDITIONS = ['acne', 'Milia', 'Keratosis', 'hyperpigmentation']
 
+# Maximum number of images accepted by /predict_batch in one request
+MAX_BATCH_FILES = 16
+
+# Decode, preprocessing and inference run here so they never block the event loop
+inference_executor = BoundedExecutor()
+QUEUE_DEPTH.set_function(lambda: inference_executor.stats()["queued"])
+
 # === Utility Functions ===
 def read_imagefile(file) -> Image.Image:
-    image = Image.open(BytesIO(file)).convert("RGB")
-    return image
+    # Oriented, RGB and at model resolution; large JPEGs are decoded at reduced scale
+    return preprocessor.decode(file)
+
+def softmax(logits):
+    logits = logits - logits.max(axis=1, keepdims=True)
+    exp = np.exp(logits)
+    return exp / exp.sum(axis=1, keepdims=True)
+
+def require_model(endpoint):
+    if not model_loader.loaded:
+        REQUEST_ERRORS.inc(endpoint, 'not_ready')
+        raise HTTPException(status_code=503, detail="Model is still loading, please retry shortly",
+                            headers={"Retry-After": "5"})
+    return model_loader.model
+
+def classify(vit_model, files):
+    """
+    Decode, preprocess and classify raw image bytes; blocking, runs on inference_executor.
+    Returns one entry per file, in order: its category probabilities, or the InvalidImage it was rejected with.
+    """
+    results = [None] * len(files)
+    images = []
+    positions = []
+    with STAGE_SECONDS.time('decode'):
+        for i, file in enumerate(files):
+            try:
+                images.append(read_imagefile(file))
+            except InvalidImage as e:
+                results[i] = e
+                continue
+            positions.append(i)
+    if not images:
+        return results
+    # Stack all images into one tensor and run a single forward pass
+    with STAGE_SECONDS.time('preprocess'):
+        pixel_values = preprocessor(images)
+    with STAGE_SECONDS.time('forward'):
+        logits = vit_model(pixel_values=pixel_values).logits
+    with STAGE_SECONDS.time('category_mapping'):
+        probs = softmax(logits.numpy())
+    for row, i in enumerate(positions):
+        results[i] = probs[row]
+    return results
+
+def rejected_image(endpoint, e):
+    REQUEST_ERRORS.inc(endpoint, e.reason)
+    return {"error": str(e), "reason": e.reason}
+
+async def run_inference(endpoint, vit_model, files):
+    try:
+        return await inference_executor.run(classify, vit_model, files)
+    except ExecutorBusy:
+        REQUEST_ERRORS.inc(endpoint, 'busy')
+        raise HTTPException(status_code=503, detail="Server is busy, please retry shortly",
+                            headers={"Retry-After": str(RETRY_AFTER_SECONDS)})
 
 def recommend_products(condition, top_k=3):
-    condition = condition.lower()
-    matches = df[df['condition'].str.lower() == condition]
-    if matches.empty:
-        return []
-    return matches[['product', 'brand', 'skin_type', 'category']].head(top_k).to_dict(orient='records')
+    with STAGE_SECONDS.time('recommend'):
+        return recommendations_index(condition)[:top_k]
+
+PREDICT_ENDPOINTS = ('/predict', '/predict_batch')
+
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    endpoint = request.url.path
+    if endpoint not in PREDICT_ENDPOINTS:
+        return await call_next(request)
+    started = time.perf_counter()
+    status = 500
+    IN_FLIGHT.inc(endpoint)
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    except Exception:
+        REQUEST_ERRORS.inc(endpoint, 'error')
+        raise
+    finally:
+        IN_FLIGHT.dec(endpoint)
+        REQUESTS.inc(endpoint, str(status))
+        REQUEST_SECONDS.observe(time.perf_counter() - started, endpoint)
+
+# Profiles selected prediction requests on demand (admin header or sampling rate).
+# Inference runs on the executor threads, so they are sampled along with the event loop.
+profiler = RequestProfiler(thread_prefixes=('inference',))
+
+@app.middleware("http")
+async def profile_request(request: Request, call_next):
+    session = profiler.start(request.headers, request.url.path) if request.url.path in PREDICT_ENDPOINTS else None
+    if session is None:
+        return await call_next(request)
+    try:
+        response = await call_next(request)
+    except Exception:
+        session.stop()
+        raise
+    response.headers["X-Profile-Id"] = session.stop()
+    return response
 
 # === Test endpoint ===
 @app.get("/ping")
 async def ping():
     return {"message": "API is live!"}
 
-# === Prediction endpoint ===
-@app.post("/predict")
-async def predict(file: UploadFile = File(...)):
-    image = read_imagefile(await file.read()).resize((224, 224))
-    inputs = feature_extractor(images=[np.array(image)], return_tensors='tf')
-
-    logits = vit_model(**inputs).logits
-    probs = tf.nn.softmax(logits, axis=1).numpy()[0]
-
+@app.get("/health/live")
+async def health_live():
+    return {"status": "alive"}
+
+@app.get("/health/ready")
+async def health_ready():
+    status = model_loader.status()
+    return JSONResponse(status, status_code=200 if status["ready"] else 503)
+
+@app.get("/metrics")
+async def metrics():
+    return Response(REGISTRY.render(), media_type=CONTENT_TYPE)
+
+@app.get("/profiles")
+async def list_profiles(request: Request):
+    if not profiler.authorized(request.headers):
+        raise HTTPException(status_code=403, detail="Profiling admin token required")
+    return {"profiles": profiler.list_profiles()}
+
+@app.get("/profiles/{name}")
+async def download_profile(name: str, request: Request):
+    if not profiler.authorized(request.headers):
+        raise HTTPException(status_code=403, detail="Profiling admin token required")
+    path = profiler.profile_path(name)
+    if path is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return FileResponse(path, filename=name)
+
+@app.get("/stats")
+async def stats():
+    return {"model": model_loader.status(), "inference_executor": inference_executor.stats(),
+            "rejected_images": preprocessor.rejection_stats()}
+
+def build_prediction_result(probs):
     top_idx = np.argmax(probs)
     confidence = float(probs[top_idx])
     condition = CATEGORIES[top_idx]
@@ -96,6 +240,35 @@ async def predict(file: UploadFile = File(...)):
 
     return result
 
+# === Prediction endpoint ===
+@app.post("/predict")
+async def predict(file: UploadFile = File(...)):
+    vit_model = require_model("/predict")
+    probs = (await run_inference("/predict", vit_model, [await file.read()]))[0]
+    if isinstance(probs, InvalidImage):
+        raise HTTPException(status_code=probs.status_code, detail=rejected_image("/predict", probs))
+    return build_prediction_result(probs)
+
+# === Batch prediction endpoint ===
+@app.post("/predict_batch")
+async def predict_batch(files: List[UploadFile] = File(...)):
+    vit_model = require_model("/predict_batch")
+    if len(files) > MAX_BATCH_FILES:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_BATCH_FILES} images can be analyzed per request")
+
+    probs = await run_inference("/predict_batch", vit_model, [await file.read() for file in files])
+
+    # Undecodable images are reported in place; the others keep their position in the request
+    results = []
+    for file, image_probs in zip(files, probs):
+        if isinstance(image_probs, InvalidImage):
+            result = rejected_image("/predict_batch", image_probs)
+        else:
+            result = build_prediction_result(image_probs)
+        result["filename"] = file.filename
+        results.append(result)
+    return {"results": results}
+
 # === Run server ===
 if __name__ == "__main__":
     uvicorn.run(app, host="0.0.0.0", port=8000)
@@ -0,0 +1,170 @@
+import io
+import json
+import os
+import threading
+from collections import Counter
+
+import numpy as np
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+# EXIF orientations that rotate the image by 90 or 270 degrees
+TRANSPOSED_ORIENTATIONS = (5, 6, 7, 8)
+EXIF_ORIENTATION = 0x0112
+
+# Formats accepted for uploads (MPO is the multi-picture JPEG many phones write)
+SUPPORTED_FORMATS = ('JPEG', 'MPO', 'PNG', 'WEBP', 'BMP')
+JPEG_FORMATS = ('JPEG', 'MPO')
+# Larger images are rejected from their header, before any pixels are decoded
+MAX_IMAGE_PIXELS = int(os.environ.get('AI_MAX_IMAGE_PIXELS', str(50_000_000)))
+
+
+class InvalidImage(ValueError):
+    """An upload rejected from its header; `reason` is a short code and `status_code` the HTTP status to return."""
+
+    def __init__(self, message, reason, status_code=400):
+        super().__init__(message)
+        self.reason = reason
+        self.status_code = status_code
+
+
+class ViTPreprocessor:
+    """
+    Drop-in replacement for `ViTFeatureExtractor(images=..., return_tensors=...)['pixel_values']`.
+
+    The extractor converts every image to float, then rescales, then normalizes, and
+    allocates new arrays at each step. Here the resized uint8 pixels are mapped
+    straight to their normalized float32 values through a per-channel 256-entry
+    lookup table, written into a preallocated channels-first buffer. The output
+    matches the extractor's within float32 rounding.
+
+    Each thread gets its own buffer, sized to the largest batch that thread has
+    preprocessed, so the returned array stays valid until the same thread calls the
+    preprocessor again. Copy it if it needs to live longer. Reusing the buffer only
+    pays off when the same threads serve many requests (a thread pool such as the
+    gthread workers of ai_server_gunicorn.py); with a thread per request, as under
+    Flask's development server, each request allocates one buffer for its own batch.
+
+    `decode` opens uploaded image bytes. JPEGs are decoded at a reduced DCT scale
+    (1/2, 1/4 or 1/8) that is still at least the model resolution, which avoids
+    fully decoding a 12 MP phone photo only to shrink it to 224x224. Uploads that
+    are unreadable, in an unsupported format or larger than `max_pixels` are rejected
+    with InvalidImage from their header alone, and counted in `rejections`.
+    """
+
+    def __init__(self, size=(224, 224), rescale_factor=1 / 255, image_mean=(0.5, 0.5, 0.5),
+                 image_std=(0.5, 0.5, 0.5), resample=Image.BILINEAR, draft_decode=True,
+                 max_pixels=MAX_IMAGE_PIXELS):
+        self.width, self.height = size
+        self.resample = resample
+        self.draft_decode = draft_decode
+        self.max_pixels = max_pixels
+        self.rejections = Counter()
+        self._rejections_lock = threading.Lock()
+
+        # lut[c, v] == (v * rescale_factor - mean[c]) / std[c]
+        mean = np.asarray(image_mean, dtype=np.float64)[:, None]
+        std = np.asarray(image_std, dtype=np.float64)[:, None]
+        values = np.arange(256, dtype=np.float64)[None, :] * rescale_factor
+        self.lut = ((values - mean) / std).astype(np.float32)
+
+        self._local = threading.local()
+
+    @classmethod
+    def from_pretrained(cls, model_dir, **kwargs):
+        """Build a preprocessor from the `preprocessor_config.json` saved next to the model."""
+        with open(os.path.join(model_dir, 'preprocessor_config.json'), 'r', encoding='utf-8') as f:
+            config = json.load(f)
+
+        size = config.get('size', 224)
+        if isinstance(size, dict):
+            size = (size.get('width', size.get('shortest_edge')), size.get('height', size.get('shortest_edge')))
+        elif isinstance(size, int):
+            size = (size, size)
+
+        return cls(
+            size=tuple(size),
+            rescale_factor=config.get('rescale_factor', 1 / 255) if config.get('do_rescale', True) else 1.0,
+            image_mean=config.get('image_mean', (0.5, 0.5, 0.5)) if config.get('do_normalize', True) else (0.0, 0.0, 0.0),
+            image_std=config.get('image_std', (0.5, 0.5, 0.5)) if config.get('do_normalize', True) else (1.0, 1.0, 1.0),
+            resample=config.get('resample', Image.BILINEAR),
+            **kwargs,
+        )
+
+    def _buffer(self, batch_size):
+        buffer = getattr(self._local, 'buffer', None)
+        if buffer is None or buffer.shape[0] < batch_size:
+            buffer = np.empty((batch_size, 3, self.height, self.width), dtype=np.float32)
+            self._local.buffer = buffer
+        return buffer[:batch_size]
+
+    def _reject(self, message, reason, status_code):
+        with self._rejections_lock:
+            self.rejections[reason] += 1
+        return InvalidImage(message, reason, status_code)
+
+    def open(self, data):
+        """
+        Open image bytes (or a file object) and validate format and dimensions from the
+        header only. Raises InvalidImage without decoding any pixels.
+        """
+        try:
+            image = Image.open(io.BytesIO(data) if isinstance(data, (bytes, bytearray, memoryview)) else data)
+        except Image.DecompressionBombError as e:
+            raise self._reject(str(e), 'too_many_pixels', 413) from e
+        except (UnidentifiedImageError, OSError, SyntaxError) as e:
+            raise self._reject("Not a readable image file", 'unreadable', 400) from e
+
+        if image.format not in SUPPORTED_FORMATS:
+            raise self._reject(f"Unsupported image format {image.format}; use one of {', '.join(SUPPORTED_FORMATS)}",
+                               'unsupported_format', 415)
+        width, height = image.size
+        if width <= 0 or height <= 0:
+            raise self._reject("Image has no pixels", 'unreadable', 400)
+        if width * height > self.max_pixels:
+            raise self._reject(f"Image is {width}x{height}; at most {self.max_pixels} pixels are accepted",
+                               'too_many_pixels', 413)
+        return image
+
+    def decode(self, data):
+        """
+        Validate image bytes (or a file object) with `open`, apply the EXIF orientation
+        and resize to the model resolution. JPEGs are decoded at the smallest DCT scale
+        that is still at least that resolution; other formats are fully decoded.
+        """
+        image = self.open(data)
+        try:
+            orientation = image.getexif().get(EXIF_ORIENTATION, 1)
+            if self.draft_decode and image.format in JPEG_FORMATS:
+                # The draft size applies before the rotation, so swap the target for rotated photos
+                target = (self.height, self.width) if orientation in TRANSPOSED_ORIENTATIONS else (self.width, self.height)
+                image.draft('RGB', target)
+            if orientation != 1:
+                image = ImageOps.exif_transpose(image)
+            return self.resize(image)
+        except (OSError, SyntaxError) as e:
+            # A valid header followed by corrupt or truncated pixel data
+            raise self._reject(f"Corrupt image data: {e}", 'corrupt', 400) from e
+
+    def rejection_stats(self):
+        with self._rejections_lock:
+            return dict(self.rejections)
+
+    def resize(self, image):
+        """Convert to RGB and resize to the model resolution, skipping work that is not needed."""
+        if image.mode != 'RGB':
+            image = image.convert('RGB')
+        if image.size != (self.width, self.height):
+            image = image.resize((self.width, self.height), resample=self.resample)
+        return image
+
+    def __call__(self, images):
+        """Return normalized pixel values of shape (N, 3, H, W) for a list of PIL images."""
+        if isinstance(images, Image.Image):
+            images = [images]
+
+        pixel_values = self._buffer(len(images))
+        for i, image in enumerate(images):
+            pixels = np.asarray(self.resize(image))
+            for c in range(3):
+                np.take(self.lut[c], pixels[:, :, c], out=pixel_values[i, c])
+        return pixel_values
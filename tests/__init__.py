@@ -0,0 +1,6 @@
+import os
+import sys
+
+# The shared modules live next to the model, as in the servers
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                                'skincondition_detection-main'))
@@ -0,0 +1,78 @@
+import json
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from artifact_store import ArtifactCache, LocalBucket, file_md5, open_bucket
+
+
+class ArtifactCacheTests(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.bucket_dir = os.path.join(directory.name, 'bucket')
+        self.cache_dir = os.path.join(directory.name, 'cache')
+        os.makedirs(self.bucket_dir)
+        self.write('model.bin', b'weights' * 1000)
+        self.write('labels.json', b'["acne"]')
+        self.files = {name: os.path.join(self.cache_dir, name) for name in ('model.bin', 'labels.json')}
+        self.cache = ArtifactCache(LocalBucket(self.bucket_dir), workers=2)
+
+    def write(self, name, data):
+        with open(os.path.join(self.bucket_dir, name), 'wb') as f:
+            f.write(data)
+
+    def statuses(self, reports):
+        return {report["name"]: report["status"] for report in reports}
+
+    def test_second_fetch_reuses_current_copies(self):
+        first = self.cache.fetch(self.files)
+        self.assertEqual(self.statuses(first), {'model.bin': 'downloaded', 'labels.json': 'downloaded'})
+        with open(self.files['model.bin'], 'rb') as f:
+            self.assertEqual(f.read(), b'weights' * 1000)
+        with open(self.files['model.bin'] + '.meta.json') as f:
+            self.assertEqual(json.load(f)["md5"], file_md5(os.path.join(self.bucket_dir, 'model.bin')))
+
+        with mock.patch.object(LocalBucket, 'download', side_effect=AssertionError("downloaded again")):
+            second = self.cache.fetch(self.files)
+        self.assertEqual(self.statuses(second), {'model.bin': 'cached', 'labels.json': 'cached'})
+
+    def test_changed_object_is_downloaded_again(self):
+        self.cache.fetch(self.files)
+        self.write('labels.json', b'["acne", "eczema"]')
+        reports = self.cache.fetch(self.files)
+        self.assertEqual(self.statuses(reports), {'model.bin': 'cached', 'labels.json': 'downloaded'})
+        with open(self.files['labels.json'], 'rb') as f:
+            self.assertEqual(f.read(), b'["acne", "eczema"]')
+
+    def test_truncated_or_unrecorded_copy_is_not_trusted(self):
+        self.cache.fetch(self.files)
+        with open(self.files['model.bin'], 'r+b') as f:
+            f.truncate(10)
+        os.remove(self.files['labels.json'] + '.meta.json')
+        reports = self.cache.fetch(self.files)
+        self.assertEqual(self.statuses(reports), {'model.bin': 'downloaded', 'labels.json': 'downloaded'})
+        self.assertEqual(os.path.getsize(self.files['model.bin']), 7000)
+
+    def test_checksum_mismatch_leaves_no_file_behind(self):
+        def corrupt_download(name, destination):
+            with open(destination, 'wb') as f:
+                f.write(b'garbage')
+
+        with mock.patch.object(LocalBucket, 'download', side_effect=corrupt_download):
+            with self.assertRaisesRegex(IOError, "Checksum mismatch downloading model.bin"):
+                self.cache.fetch_one('model.bin', self.files['model.bin'])
+        self.assertEqual(os.listdir(self.cache_dir), [])
+
+    def test_missing_object_raises(self):
+        with self.assertRaises(FileNotFoundError):
+            self.cache.fetch({'missing.bin': os.path.join(self.cache_dir, 'missing.bin')})
+
+    def test_open_bucket_accepts_file_urls_and_paths(self):
+        self.assertEqual(open_bucket(f'file://{self.bucket_dir}').root, self.bucket_dir)
+        self.assertEqual(open_bucket(self.bucket_dir).root, self.bucket_dir)
+
+
+if __name__ == '__main__':
+    unittest.main()
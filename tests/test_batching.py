@@ -0,0 +1,95 @@
+import threading
+import unittest
+
+import torch
+
+from batching import MicroBatcher
+
+
+def submit_all(batcher, images):
+    """Submit every image from its own thread; returns the results (or exceptions) in input order."""
+    results = [None] * len(images)
+
+    def submit(i):
+        try:
+            results[i] = batcher.submit(images[i], timeout=10)
+        except Exception as e:
+            results[i] = e
+
+    threads = [threading.Thread(target=submit, args=(i,)) for i in range(len(images))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def image(value):
+    return torch.full((3, 2, 2), float(value))
+
+
+class MicroBatcherTests(unittest.TestCase):
+    def setUp(self):
+        self.batch_sizes = []
+
+    def run_batch(self, pixel_values):
+        self.batch_sizes.append(len(pixel_values))
+        # One value per image, identifying the image it came from
+        return pixel_values.flatten(1).mean(dim=1), None
+
+    def test_concurrent_images_share_a_batch_and_get_their_own_rows(self):
+        batcher = MicroBatcher(self.run_batch, max_batch_size=4, max_wait_ms=2000)
+        results = submit_all(batcher, [image(i) for i in range(4)])
+
+        self.assertEqual(self.batch_sizes, [4])
+        self.assertEqual([float(value) for value, _ in results], [0.0, 1.0, 2.0, 3.0])
+        # None outputs stay None for every image
+        self.assertTrue(all(extra is None for _, extra in results))
+        self.assertEqual((batcher.batches_run, batcher.images_run), (1, 4))
+
+    def test_batches_are_capped_at_max_batch_size(self):
+        batcher = MicroBatcher(self.run_batch, max_batch_size=2, max_wait_ms=50)
+        results = submit_all(batcher, [image(i) for i in range(5)])
+
+        self.assertEqual(sum(self.batch_sizes), 5)
+        self.assertLessEqual(max(self.batch_sizes), 2)
+        self.assertEqual([float(value) for value, _ in results], [0.0, 1.0, 2.0, 3.0, 4.0])
+
+    def test_a_lone_image_is_run_when_the_window_closes(self):
+        batcher = MicroBatcher(self.run_batch, max_batch_size=16, max_wait_ms=1)
+        value, _ = batcher.submit(image(7), timeout=10)
+        self.assertEqual(float(value), 7.0)
+        self.assertEqual(self.batch_sizes, [1])
+
+    def test_single_tensor_outputs_are_sliced_per_image(self):
+        batcher = MicroBatcher(lambda pixel_values: pixel_values[:, 0, 0, 0] * 2, max_wait_ms=1)
+        self.assertEqual(float(batcher.submit(image(3), timeout=10)), 6.0)
+
+    def test_a_failed_batch_raises_in_every_caller_and_the_next_batch_runs(self):
+        calls = []
+
+        def run_batch(pixel_values):
+            calls.append(len(pixel_values))
+            if len(calls) == 1:
+                raise RuntimeError("forward failed")
+            return pixel_values.flatten(1).mean(dim=1)
+
+        batcher = MicroBatcher(run_batch, max_batch_size=3, max_wait_ms=2000)
+        results = submit_all(batcher, [image(i) for i in range(3)])
+        self.assertEqual(calls, [3])
+        for result in results:
+            self.assertIsInstance(result, RuntimeError)
+            self.assertEqual(str(result), "forward failed")
+
+        self.assertEqual(float(batcher.submit(image(5), timeout=10)), 5.0)
+
+    def test_submit_after_close_still_runs(self):
+        batcher = MicroBatcher(self.run_batch, max_wait_ms=1)
+        batcher.submit(image(1), timeout=10)
+        batcher.close()
+        value, _ = batcher.submit(image(2), timeout=10)
+        self.assertEqual(float(value), 2.0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,50 @@
+import io
+import threading
+import unittest
+
+from PIL import Image
+
+from benchmark_inference import encode_images, run_scenario
+
+
+class FakeClient:
+    """Records every payload and fails each request whose first upload is `fail_on`."""
+
+    def __init__(self, fail_on=None):
+        self.fail_on = fail_on
+        self.payloads = []
+        self._lock = threading.Lock()
+
+    def post(self, endpoint, uploads):
+        with self._lock:
+            self.payloads.append([filename for _, filename, _ in uploads])
+        return 503 if uploads[0][1] == self.fail_on else 200
+
+
+class BenchmarkTests(unittest.TestCase):
+    def test_encode_images_follows_the_specs(self):
+        uploads = encode_images(['64x48:jpeg', '32x32:png', '40x30'], count=2)
+        self.assertEqual([filename for _, filename, _ in uploads],
+                         ['64x48-0.jpeg', '64x48-1.jpeg', '32x32-0.png', '32x32-1.png', '40x30-0.jpeg', '40x30-1.jpeg'])
+        for spec, filename, data in uploads:
+            image = Image.open(io.BytesIO(data))
+            self.assertEqual(image.format, filename.rsplit('.', 1)[1].upper())
+            self.assertEqual('x'.join(map(str, image.size)), spec.split(':')[0])
+        # Distinct uploads, so caches keyed on content see no repeats
+        self.assertEqual(len({data for _, _, data in uploads}), len(uploads))
+
+    def test_run_scenario_rotates_uploads_and_counts_errors(self):
+        uploads = encode_images(['16x16:png'], count=3)
+        client = FakeClient(fail_on='16x16-2.png')
+        report = run_scenario(client, '/predict_batch', uploads, batch_size=2, concurrency=2, requests=6, warmup=1)
+
+        self.assertEqual(len(client.payloads), 7)
+        self.assertEqual(report["requests"], 6)
+        # Requests 0..5 start at uploads 0, 2, 1, 0, 2, 1; those starting at the third upload fail
+        self.assertEqual(report["errors"], {'503': 2})
+        self.assertGreater(report["images_per_second"], 0)
+        self.assertLessEqual(report["latency_ms_p50"], report["latency_ms_p99"])
+
+
+if __name__ == '__main__':
+    unittest.main()
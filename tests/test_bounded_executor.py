@@ -0,0 +1,65 @@
+import asyncio
+import threading
+import unittest
+
+from bounded_executor import BoundedExecutor, ExecutorBusy
+
+
+class BoundedExecutorTests(unittest.TestCase):
+    def setUp(self):
+        self.release = threading.Event()
+        self.addCleanup(self.release.set)
+
+    def blocked_job(self):
+        self.release.wait(10)
+        return 'done'
+
+    def test_rejects_jobs_beyond_running_plus_queued(self):
+        executor = BoundedExecutor(concurrency=1, queue_depth=1)
+        running = executor.submit(self.blocked_job)
+        queued = executor.submit(self.blocked_job)
+        with self.assertRaises(ExecutorBusy):
+            executor.submit(self.blocked_job)
+        self.assertEqual(executor.stats(), {"concurrency": 1, "queue_depth": 1, "running": 1, "queued": 1,
+                                            "completed": 0, "rejected": 1})
+
+        self.release.set()
+        self.assertEqual((running.result(10), queued.result(10)), ('done', 'done'))
+        # Capacity is given back once jobs finish
+        self.assertEqual(executor.submit(lambda: 'again').result(10), 'again')
+        self.assertEqual(executor.stats()["completed"], 3)
+
+    def test_zero_queue_depth_only_admits_running_jobs(self):
+        executor = BoundedExecutor(concurrency=2, queue_depth=0)
+        executor.submit(self.blocked_job)
+        executor.submit(self.blocked_job)
+        with self.assertRaises(ExecutorBusy):
+            executor.submit(self.blocked_job)
+
+    def test_failed_job_raises_and_frees_its_slot(self):
+        executor = BoundedExecutor(concurrency=1, queue_depth=0)
+
+        def fail():
+            raise ValueError("bad image")
+
+        with self.assertRaisesRegex(ValueError, "bad image"):
+            executor.submit(fail).result(10)
+        self.assertEqual(executor.submit(lambda: 1).result(10), 1)
+
+    def test_run_awaits_without_blocking_the_event_loop(self):
+        executor = BoundedExecutor(concurrency=1, queue_depth=0)
+
+        async def main():
+            job = asyncio.ensure_future(executor.run(self.blocked_job))
+            await asyncio.sleep(0.05)
+            # The loop keeps serving while the job blocks; a second request is shed right away
+            with self.assertRaises(ExecutorBusy):
+                await executor.run(self.blocked_job)
+            self.release.set()
+            return await job
+
+        self.assertEqual(asyncio.run(main()), 'done')
+
+
+if __name__ == '__main__':
+    unittest.main()
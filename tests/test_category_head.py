@@ -0,0 +1,68 @@
+import unittest
+
+import torch
+from transformers import ViTConfig
+
+from category_head import CategoryHead
+from condition_labels import LABEL_TO_NAME
+
+# As in local_ai_server.py: ten categories with ImageNet ranges, two only the fine-tuned head predicts
+CATEGORIES = ["Acne", "Carcinoma", "Eczema", "Keratosis", "Milia", "Rosacea",
+              "Oily Skin", "Dry Skin", "Normal", "Non-Wrinkled Skin", "Hyperpigmentation", "Wrinkles"]
+RANGES = {category: (i * 100 + (i > 0), (i + 1) * 100) for i, category in enumerate(CATEGORIES[:10])}
+
+
+# Stands in for the ImageNet class names of saved_vit_model/config.json
+IMAGENET_LABELS = {i: f"imagenet class {i}" for i in range(1000)}
+
+
+def head_for(num_labels, id2label=None, categories=CATEGORIES):
+    config = ViTConfig(num_labels=num_labels)
+    if id2label is not None:
+        config.id2label = id2label
+    return CategoryHead.from_config(config, categories, RANGES, default="Normal", label_names=LABEL_TO_NAME)
+
+
+class CategoryHeadTests(unittest.TestCase):
+    def test_nine_generic_labels_map_through_the_shared_label_names(self):
+        # The LABEL_0..LABEL_8 head of skincondition_detection-main/config.json
+        head = head_for(9)
+        self.assertEqual([head.category_of(i) for i in range(9)],
+                         ["Acne", "Milia", "Hyperpigmentation", "Wrinkles", "Keratosis", "Oily Skin", "Dry Skin",
+                          "Normal", "Non-Wrinkled Skin"])
+
+        probs = torch.zeros(1, 9)
+        probs[0, 1] = 1.0
+        self.assertEqual(CATEGORIES[int(head(probs).argmax())], "Milia")
+
+    def test_generic_labels_without_a_category_are_refused(self):
+        with self.assertRaisesRegex(ValueError, r"LABEL_2 \(Hyperpigmentation\), LABEL_3 \(Wrinkles\)"):
+            head_for(9, categories=CATEGORIES[:10])
+        with self.assertRaisesRegex(ValueError, r"LABEL_9 \(no name\)"):
+            head_for(10)
+
+    def test_named_labels_map_by_name(self):
+        names = ["normal", "ACNE", "Rosacea"]
+        head = head_for(3, {i: name for i, name in enumerate(names)})
+        self.assertEqual([head.category_of(i) for i in range(3)], ["Normal", "Acne", "Rosacea"])
+
+    def test_imagenet_head_maps_with_ranges(self):
+        head = head_for(1000, IMAGENET_LABELS)
+        self.assertEqual(head.category_of(0), "Acne")
+        self.assertEqual(head.category_of(150), "Carcinoma")
+        self.assertEqual(head.category_of(999), "Non-Wrinkled Skin")
+        # Gaps between the ranges fall back to the default
+        self.assertEqual(head.category_of(100), "Normal")
+
+    def test_probability_mass_is_summed_per_category(self):
+        head = head_for(1000, IMAGENET_LABELS)
+        probs = torch.softmax(torch.randn(4, 1000, generator=torch.Generator().manual_seed(0)), dim=1)
+        category_probs = head(probs)
+
+        self.assertEqual(category_probs.shape, (4, len(CATEGORIES)))
+        torch.testing.assert_close(category_probs.sum(dim=1), torch.ones(4))
+        torch.testing.assert_close(category_probs[:, 1], probs[:, 101:200].sum(dim=1))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,90 @@
+import unittest
+
+import torch
+
+from confidence_cascade import ConfidenceCascade
+
+
+class FakeTier:
+    """Returns fixed per-image top-2 answers and embeddings, and records the batches it was given."""
+
+    def __init__(self, probs, indices, embeddings):
+        self.probs = torch.tensor(probs)
+        self.indices = torch.tensor(indices)
+        self.embeddings = None if embeddings is None else torch.tensor(embeddings, dtype=torch.float32)
+        self.calls = []
+
+    def __call__(self, pixel_values):
+        self.calls.append(pixel_values)
+        rows = [int(row[0, 0, 0]) for row in pixel_values]
+        embeddings = None if self.embeddings is None else self.embeddings[rows]
+        return self.probs[rows], self.indices[rows], embeddings
+
+
+def batch(count, size=8):
+    """Images whose pixels all equal their row number, so the fake tiers can tell them apart."""
+    return torch.arange(count, dtype=torch.float32).view(count, 1, 1, 1).expand(count, 3, size, size).contiguous()
+
+
+class ConfidenceCascadeTests(unittest.TestCase):
+    def setUp(self):
+        self.cascade = ConfidenceCascade(resolution=4, threshold=0.8)
+        self.fast = FakeTier([[0.95, 0.05], [0.8, 0.1], [0.79, 0.2], [0.4, 0.3]],
+                             [[1, 0], [2, 0], [3, 0], [4, 0]], [[0.0], [1.0], [2.0], [3.0]])
+        self.full = FakeTier([[0.9, 0.1], [0.9, 0.1], [0.6, 0.3], [0.7, 0.2]],
+                             [[1, 0], [2, 0], [3, 0], [5, 0]], [[10.0], [11.0], [12.0], [13.0]])
+
+    def test_confident_images_stay_on_the_fast_tier(self):
+        probs, indices, embeddings, tiers = self.cascade.run(batch(4), self.fast, self.full)
+        # 0.8 reaches the threshold; 0.79 does not
+        self.assertEqual(tiers, ['fast', 'fast', 'full', 'full'])
+        self.assertEqual(indices[:, 0].tolist(), [1, 2, 3, 5])
+        torch.testing.assert_close(probs[:, 0], torch.tensor([0.95, 0.8, 0.6, 0.7]))
+        self.assertEqual(embeddings.flatten().tolist(), [0.0, 1.0, 12.0, 13.0])
+
+    def test_tiers_see_the_right_images_at_the_right_resolution(self):
+        self.cascade.run(batch(4), self.fast, self.full)
+        self.assertEqual(self.fast.calls[0].shape, (4, 3, 4, 4))
+        (escalated,) = self.full.calls
+        self.assertEqual(escalated.shape, (2, 3, 8, 8))
+        self.assertEqual(escalated[:, 0, 0, 0].tolist(), [2.0, 3.0])
+
+    def test_full_model_is_skipped_when_every_image_is_confident(self):
+        self.cascade.run(batch(2), self.fast, self.full)
+        self.assertEqual(self.full.calls, [])
+        self.assertEqual(self.cascade.stats()["fast_hit_rate"], 1.0)
+        self.assertIsNone(self.cascade.stats()["escalated_disagreement_rate"])
+
+    def test_fast_answers_are_not_modified_in_place(self):
+        before = self.fast.probs.clone()
+        self.cascade.run(batch(4), self.fast, self.full)
+        torch.testing.assert_close(self.fast.probs, before)
+
+    def test_missing_embeddings_are_passed_through(self):
+        full = FakeTier(self.full.probs.tolist(), self.full.indices.tolist(), None)
+        _, _, embeddings, _ = self.cascade.run(batch(4), self.fast, full)
+        self.assertEqual(embeddings.flatten().tolist(), [0.0, 1.0, 2.0, 3.0])
+
+    def test_stats_count_tiers_and_escalated_disagreements(self):
+        self.cascade.run(batch(4), self.fast, self.full)
+        self.cascade.run(batch(1), self.fast, self.full)
+        self.assertEqual(self.cascade.stats(), {
+            "resolution": 4,
+            "threshold": 0.8,
+            "images": {"fast": 3, "full": 2},
+            "fast_hit_rate": 0.6,
+            # Of the two escalated images only the last changed its top-1 (4 -> 5)
+            "escalated_disagreement_rate": 0.5,
+        })
+
+    def test_downscale_averages_areas(self):
+        pixel_values = torch.zeros(1, 3, 8, 8)
+        pixel_values[..., :4, :4] = 1.0
+        low_res = self.cascade.downscale(pixel_values)
+        self.assertEqual(low_res.shape, (1, 3, 4, 4))
+        self.assertEqual(float(low_res[0, 0, 0, 0]), 1.0)
+        self.assertEqual(float(low_res.mean()), 0.25)
+
+
+if __name__ == '__main__':
+    unittest.main()
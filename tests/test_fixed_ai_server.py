@@ -0,0 +1,52 @@
+import importlib
+import io
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import torch
+
+from tests.test_local_ai_server import jpeg
+from tests.test_model_loader import wait_for
+from tests.tiny_vit import build_tiny_vit
+
+server = None
+_directory = None
+
+
+def setUpModule():
+    """Import the server once against a tiny model; its settings are read from the environment at import."""
+    global server, _directory
+    _directory = tempfile.TemporaryDirectory()
+    model_path = build_tiny_vit(os.path.join(_directory.name, 'model'))
+    with mock.patch.dict(os.environ, {'AI_MODEL_PATH': model_path}):
+        server = importlib.import_module('fixed_ai_server')
+    wait_for(lambda: server.model_loader.ready, timeout=120)
+
+
+def tearDownModule():
+    _directory.cleanup()
+
+
+class PredictionResultTests(unittest.TestCase):
+    def test_alternatives_are_the_next_categories_above_ten_percent(self):
+        probs = torch.zeros(len(server.CATEGORIES))
+        probs[[3, 5, 7]] = torch.tensor([0.6, 0.3, 0.05])
+        result = server.build_prediction_result(probs)
+        self.assertEqual(result["condition"], server.CATEGORIES[3])
+        self.assertEqual([alt["condition"] for alt in result["alternative_predictions"]], [server.CATEGORIES[5]])
+        self.assertAlmostEqual(result["alternative_predictions"][0]["confidence"], 0.3, places=6)
+
+    def test_batch_results_carry_alternatives_with_errors_in_place(self):
+        data = {'files': [(io.BytesIO(jpeg(1)), 'a.jpg'), (io.BytesIO(b'not an image'), 'junk.jpg')]}
+        response = server.app.test_client().post('/predict_batch', data=data, content_type='multipart/form-data')
+        self.assertEqual(response.status_code, 200)
+        results = response.json["results"]
+        self.assertEqual([r["filename"] for r in results], ['a.jpg', 'junk.jpg'])
+        self.assertIn("alternative_predictions", results[0])
+        self.assertEqual(results[1]["reason"], 'unreadable')
+
+
+if __name__ == '__main__':
+    unittest.main()
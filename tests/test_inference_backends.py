@@ -0,0 +1,317 @@
+import contextlib
+import io
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import torch
+from PIL import Image
+
+import export_model
+from safetensors.torch import load_file
+from transformers import ViTForImageClassification
+
+from category_head import CategoryHead
+from inference_backends import (COMPILE_CACHE_DIR, ONNX_FILE, QUANTIZED_CACHE_DIR, SAFETENSORS_FILE, TORCHSCRIPT_FILE,
+                                OnnxRuntimeBackend, TorchCompiledBackend, TorchEagerBackend, TorchInt8Backend,
+                                TorchScriptBackend, apply_precision, calibration_images, load_backend,
+                                load_mmap_state_dict, load_vit)
+from tests.tiny_vit import build_tiny_vit
+
+
+class BackendTestCase(unittest.TestCase):
+    """Every backend is compared with the eager fp32 model on the same tiny ViT."""
+
+    @classmethod
+    def setUpClass(cls):
+        cls._directory = tempfile.TemporaryDirectory()
+        cls.model_path = build_tiny_vit(cls._directory.name)
+        cls.eager = TorchEagerBackend(cls.model_path)
+        cls.pixel_values = torch.randn(3, 3, 224, 224, generator=torch.Generator().manual_seed(0))
+        cls.reference = cls.eager(cls.pixel_values)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls._directory.cleanup()
+
+    def export(self, exporter):
+        with contextlib.redirect_stdout(io.StringIO()):
+            exporter(self.model_path)
+
+
+class InferenceBackendTests(BackendTestCase):
+    def test_eager_backend_returns_fp32_logits(self):
+        self.assertEqual(self.reference.shape, (3, 9))
+        self.assertEqual(self.reference.dtype, torch.float32)
+        self.assertEqual(self.eager.name, 'torch')
+
+    def test_eager_embeddings_are_the_cls_token_the_classifier_reads(self):
+        logits, embeddings = self.eager.forward_features(self.pixel_values)
+        torch.testing.assert_close(logits, self.reference)
+        self.assertEqual(embeddings.shape, (3, self.eager.config.hidden_size))
+        torch.testing.assert_close(self.eager.model.classifier(embeddings), logits)
+
+    def test_torchscript_matches_eager(self):
+        self.export(export_model.export_torchscript)
+        self.assertTrue(os.path.exists(os.path.join(self.model_path, TORCHSCRIPT_FILE)))
+        backend = load_backend(self.model_path, 'torchscript')
+        self.assertIsInstance(backend, TorchScriptBackend)
+        torch.testing.assert_close(backend(self.pixel_values), self.reference, atol=1e-4, rtol=1e-4)
+
+    def test_onnx_matches_eager(self):
+        try:
+            import onnxruntime  # noqa: F401
+        except ImportError:
+            self.skipTest("onnxruntime is not installed")
+        self.export(export_model.export_onnx)
+        self.assertTrue(os.path.exists(os.path.join(self.model_path, ONNX_FILE)))
+        backend = load_backend(self.model_path, 'onnx')
+        self.assertIsInstance(backend, OnnxRuntimeBackend)
+        # Also with a batch size other than the one exported
+        torch.testing.assert_close(backend(self.pixel_values), self.reference, atol=1e-4, rtol=1e-4)
+        torch.testing.assert_close(backend(self.pixel_values[:1]), self.reference[:1], atol=1e-4, rtol=1e-4)
+
+    def test_missing_export_is_reported(self):
+        with tempfile.TemporaryDirectory() as directory:
+            build_tiny_vit(directory)
+            with self.assertRaisesRegex(FileNotFoundError, 'export_model.py --format torchscript'):
+                load_backend(directory, 'torchscript')
+
+    def test_unknown_backend_is_rejected(self):
+        with self.assertRaisesRegex(ValueError, "Unknown inference backend 'tensorrt'"):
+            load_backend(self.model_path, 'tensorrt')
+
+
+class Int8BackendTests(BackendTestCase):
+    def test_quantized_model_stays_close_to_fp32(self):
+        with tempfile.TemporaryDirectory() as cache_dir:
+            backend = TorchInt8Backend(self.model_path, cache_dir)
+            logits = backend(self.pixel_values)
+        self.assertEqual(backend.name, 'torch-int8')
+        self.assertIsInstance(backend.model.classifier, torch.ao.nn.quantized.dynamic.Linear)
+        self.assertLess(float((logits - self.reference).abs().max()), 0.05)
+
+    def test_quantized_weights_are_cached_per_model_version(self):
+        with tempfile.TemporaryDirectory() as cache_dir:
+            first = TorchInt8Backend(self.model_path, cache_dir)
+            self.assertEqual(os.listdir(cache_dir), [f"vit-int8-{first.version}.pt"])
+
+            # A second start loads the cached int8 weights without touching the fp32 ones
+            with mock.patch('inference_backends.load_vit', side_effect=AssertionError("fp32 weights loaded")):
+                second = TorchInt8Backend(self.model_path, cache_dir)
+            torch.testing.assert_close(second(self.pixel_values), first(self.pixel_values))
+
+            with tempfile.TemporaryDirectory() as other_model:
+                build_tiny_vit(other_model, seed=1)
+                TorchInt8Backend(other_model, cache_dir)
+            self.assertEqual(len(os.listdir(cache_dir)), 2)
+
+
+class MemoryMappedWeightsTests(BackendTestCase):
+    def test_mapped_tensors_equal_the_saved_ones(self):
+        path = os.path.join(self.model_path, SAFETENSORS_FILE)
+        mapped, saved = load_mmap_state_dict(path), load_file(path)
+        self.assertEqual(set(mapped), set(saved))
+        for name, tensor in saved.items():
+            self.assertEqual(mapped[name].dtype, tensor.dtype)
+            torch.testing.assert_close(mapped[name], tensor, rtol=0, atol=0)
+
+    def test_writes_to_mapped_tensors_never_reach_the_file(self):
+        path = os.path.join(self.model_path, SAFETENSORS_FILE)
+        with open(path, 'rb') as f:
+            before = f.read()
+        mapped = load_mmap_state_dict(path)
+        mapped['classifier.bias'].add_(1.0)
+        with open(path, 'rb') as f:
+            self.assertEqual(f.read(), before)
+
+    def test_mapped_model_matches_from_pretrained(self):
+        model = load_vit(self.model_path).eval()
+        reference = ViTForImageClassification.from_pretrained(self.model_path).eval()
+        with torch.no_grad():
+            torch.testing.assert_close(model(self.pixel_values).logits, reference(self.pixel_values).logits)
+
+    def test_disabling_mmap_falls_back_to_from_pretrained(self):
+        with mock.patch('inference_backends.MMAP_WEIGHTS', False), \
+                mock.patch('inference_backends.load_mmap_state_dict', side_effect=AssertionError("mapped")):
+            model = load_vit(self.model_path).eval()
+        with torch.no_grad():
+            torch.testing.assert_close(model(self.pixel_values).logits, self.reference)
+
+
+class PrecisionTests(BackendTestCase):
+    def setUp(self):
+        self.backend = TorchEagerBackend(self.model_path)
+
+    def calibration(self):
+        return self.pixel_values
+
+    def test_fp32_needs_no_calibration(self):
+        report = apply_precision(self.backend, lambda: self.fail("calibrated"), precision='fp32')
+        self.assertEqual(report, {"requested": 'fp32', "active": 'fp32', "fallback_reason": None})
+        self.assertIs(self.backend.precision_check, report)
+
+    def test_bf16_is_kept_when_it_passes_the_check(self):
+        report = apply_precision(self.backend, self.calibration, precision='bf16', min_agreement=0.0, min_speedup=0.0)
+        self.assertEqual((report["active"], report["fallback_reason"]), ('bf16', None))
+        self.assertEqual(report["calibration_images"], 3)
+        self.assertEqual(self.backend.model.classifier.weight.dtype, torch.bfloat16)
+        # Callers still get fp32 logits
+        logits = self.backend(self.pixel_values)
+        self.assertEqual(logits.dtype, torch.float32)
+        torch.testing.assert_close(logits, self.reference, atol=0.1, rtol=0.1)
+
+    def test_rejected_bf16_goes_back_to_the_exact_fp32_weights(self):
+        report = apply_precision(self.backend, self.calibration, precision='bf16', min_agreement=1.01, min_speedup=0.0)
+        self.assertEqual(report["active"], 'fp32')
+        self.assertIn('top-1 agreement', report["fallback_reason"])
+        self.assertEqual(self.backend.precision, 'fp32')
+        torch.testing.assert_close(self.backend(self.pixel_values), self.reference, rtol=0, atol=0)
+
+    def test_slower_precision_is_rejected(self):
+        report = apply_precision(self.backend, self.calibration, precision='bf16-autocast', min_agreement=0.0,
+                                 min_speedup=1e6)
+        self.assertEqual(report["active"], 'fp32')
+        self.assertIn('faster than fp32', report["fallback_reason"])
+
+    def test_autocast_keeps_fp32_weights(self):
+        apply_precision(self.backend, self.calibration, precision='bf16-autocast', min_agreement=0.0, min_speedup=0.0)
+        self.assertEqual(self.backend.precision, 'bf16-autocast')
+        self.assertEqual(self.backend.model.classifier.weight.dtype, torch.float32)
+
+    def test_unsupported_backend_stays_in_fp32(self):
+        with tempfile.TemporaryDirectory() as cache_dir:
+            backend = TorchInt8Backend(self.model_path, cache_dir)
+        with self.assertLogs('inference_backends', 'WARNING'):
+            report = apply_precision(backend, lambda: self.fail("calibrated"), precision='bf16')
+        self.assertEqual(report["fallback_reason"], "not supported by the torch-int8 backend")
+
+    def test_unknown_precision_is_rejected(self):
+        with self.assertRaisesRegex(ValueError, "Unknown precision 'fp8'"):
+            apply_precision(self.backend, self.calibration, precision='fp8')
+
+    def test_agreement_is_measured_on_the_returned_category(self):
+        class LabelFlippingBackend:
+            """Predicts label 0 in fp32 and label 1 in bf16; both belong to the same category."""
+            name = 'fake'
+            precisions = ('fp32', 'bf16')
+            precision = 'fp32'
+
+            def set_precision(self, precision):
+                self.precision = precision
+
+            def __call__(self, pixel_values):
+                logits = torch.zeros(len(pixel_values), 3)
+                logits[:, 0 if self.precision == 'fp32' else 1] = 5.0
+                return logits
+
+        head = CategoryHead(["Acne", "Milia"], [0, 0, 1])
+        report = apply_precision(LabelFlippingBackend(), self.calibration, precision='bf16', min_agreement=1.0,
+                                 min_speedup=0.0, category_head=head)
+        self.assertEqual((report["active"], report["top1_agreement"]), ('bf16', 1.0))
+
+        with self.assertLogs('inference_backends', 'WARNING'):
+            report = apply_precision(LabelFlippingBackend(), self.calibration, precision='bf16', min_agreement=1.0,
+                                     min_speedup=0.0)
+        self.assertEqual((report["active"], report["top1_agreement"]), ('fp32', 0.0))
+
+    def test_missing_calibration_images_keep_fp32(self):
+        def calibration():
+            return calibration_images(directory=None)
+
+        with self.assertLogs('inference_backends', 'ERROR') as logs:
+            report = apply_precision(self.backend, calibration, precision='bf16')
+        self.assertIn('AI_PRECISION_CALIBRATION_DIR', logs.output[0])
+        self.assertEqual(report["active"], 'fp32')
+        self.assertEqual(self.backend.model.classifier.weight.dtype, torch.float32)
+
+    def test_calibration_images_are_the_first_real_images_in_sorted_order(self):
+        with tempfile.TemporaryDirectory() as directory:
+            with self.assertRaisesRegex(FileNotFoundError, "No calibration images"):
+                calibration_images(directory)
+            for name, color in (('b.jpg', (0, 0, 255)), ('a.png', (255, 0, 0)), ('c.png', (0, 255, 0))):
+                Image.new('RGB', (8, 8), color).save(os.path.join(directory, name))
+            images = calibration_images(directory, count=2)
+        self.assertEqual([image.getpixel((0, 0))[0] for image in images], [255, 0])
+
+
+class CompiledBackendTests(BackendTestCase):
+    """Bucketing and padding are checked with torch.compile replaced by a recorder of the batch shapes."""
+
+    def build(self, buckets, environ=None):
+        shapes = []
+
+        def fake_compile(module, **kwargs):
+            def run(pixel_values):
+                shapes.append(len(pixel_values))
+                return module(pixel_values)
+            return run
+
+        with tempfile.TemporaryDirectory() as cache_dir, mock.patch.dict(os.environ), \
+                mock.patch('torch.compile', side_effect=fake_compile):
+            os.environ.pop('TORCHINDUCTOR_CACHE_DIR', None)
+            os.environ.update(environ or {})
+            backend = TorchCompiledBackend(self.model_path, buckets=buckets, cache_dir=cache_dir)
+            backend.requested_cache_dir = cache_dir
+        return backend, shapes
+
+    def test_caches_default_to_outside_the_source_tree(self):
+        repo = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        for cache_dir in (COMPILE_CACHE_DIR, QUANTIZED_CACHE_DIR):
+            self.assertFalse(os.path.abspath(cache_dir).startswith(repo + os.sep), cache_dir)
+
+    def test_cache_dir_is_used_unless_the_operator_set_one(self):
+        backend, _ = self.build((1,))
+        self.assertEqual(backend.cache_dir, backend.requested_cache_dir)
+        with tempfile.TemporaryDirectory() as operator_dir:
+            backend, _ = self.build((1,), environ={'TORCHINDUCTOR_CACHE_DIR': operator_dir})
+            self.assertEqual(backend.cache_dir, operator_dir)
+
+    def test_missing_inductor_options_are_skipped(self):
+        class OldInductorConfig:
+            """Like torch 2.0's inductor config: no fx_graph_cache, and unknown options cannot be set."""
+
+            def __setattr__(self, name, value):
+                raise AttributeError(name)
+
+        with mock.patch.object(torch._inductor, 'config', OldInductorConfig()):
+            backend, shapes = self.build((1, 4))
+        self.assertEqual(shapes, [1, 4])
+
+    def test_every_bucket_is_compiled_while_loading(self):
+        backend, shapes = self.build((8, 1, 4, 4))
+        self.assertEqual(backend.buckets, (1, 4, 8))
+        self.assertEqual(shapes, [1, 4, 8])
+        self.assertEqual(set(backend.compile_seconds), {1, 4, 8})
+
+    def test_bucket_for(self):
+        backend, _ = self.build((1, 4, 8))
+        self.assertEqual([backend.bucket_for(n) for n in (1, 2, 4, 5, 8, 20)], [1, 4, 4, 8, 8, 8])
+
+    def test_batches_are_padded_to_a_bucket_and_trimmed(self):
+        backend, shapes = self.build((1, 4))
+        shapes.clear()
+        logits, embeddings = backend.forward_features(self.pixel_values)
+        self.assertEqual(shapes, [4])
+        self.assertEqual((logits.shape, embeddings.shape), ((3, 9), (3, backend.config.hidden_size)))
+        # Padding rows never change the real rows' outputs
+        torch.testing.assert_close(logits, self.reference)
+
+    def test_batches_beyond_the_largest_bucket_are_chunked(self):
+        backend, shapes = self.build((1, 2))
+        shapes.clear()
+        pixel_values = torch.cat([self.pixel_values, self.pixel_values[:2]])
+        logits = backend(pixel_values)
+        self.assertEqual(shapes, [2, 2, 1])
+        torch.testing.assert_close(logits, torch.cat([self.reference, self.reference[:2]]))
+
+    @unittest.skipUnless(os.environ.get('AI_TEST_TORCH_COMPILE'), "set AI_TEST_TORCH_COMPILE=1 to run inductor (slow)")
+    def test_compiled_model_matches_eager(self):
+        with tempfile.TemporaryDirectory() as cache_dir, mock.patch.dict(os.environ):
+            backend = TorchCompiledBackend(self.model_path, buckets=(1, 4), cache_dir=cache_dir)
+            torch.testing.assert_close(backend(self.pixel_values), self.reference, atol=1e-4, rtol=1e-4)
+
+
+if __name__ == '__main__':
+    unittest.main()
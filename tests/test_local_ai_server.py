@@ -0,0 +1,139 @@
+import importlib
+import io
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from PIL import Image
+
+from sample_images import synthetic_images
+from tests.test_model_loader import wait_for
+from tests.tiny_vit import build_tiny_vit
+
+ADMIN_TOKEN = 'admin-secret'
+server = None
+_directory = None
+
+
+def setUpModule():
+    """Import the server once against a tiny model; its settings are read from the environment at import."""
+    global server, _directory
+    _directory = tempfile.TemporaryDirectory()
+    model_path = build_tiny_vit(os.path.join(_directory.name, 'model'))
+    with mock.patch.dict(os.environ, {'AI_MODEL_PATH': model_path, 'AI_ADMIN_TOKEN': ADMIN_TOKEN}):
+        server = importlib.import_module('local_ai_server')
+    wait_for(lambda: server.model_loader.ready, timeout=120)
+
+
+def tearDownModule():
+    _directory.cleanup()
+
+
+def jpeg(seed):
+    data = io.BytesIO()
+    synthetic_images(1, seed=seed, width=320, height=240)[0].save(data, 'JPEG')
+    return data.getvalue()
+
+
+class ServerTestCase(unittest.TestCase):
+    def setUp(self):
+        self.client = server.app.test_client()
+        server.clear_prediction_caches()
+
+    def post_files(self, endpoint, field, uploads, **kwargs):
+        data = {field: [(io.BytesIO(data), filename) for filename, data in uploads]}
+        return self.client.post(endpoint, data=data, content_type='multipart/form-data', **kwargs)
+
+
+class PredictBatchTests(ServerTestCase):
+    def test_results_come_back_in_upload_order_with_errors_in_place(self):
+        uploads = [('a.jpg', jpeg(1)), ('junk.jpg', b'not an image'), ('b.jpg', jpeg(2)),
+                   ('anim.gif', self.gif())]
+        response = self.post_files('/predict_batch', 'files', uploads)
+        self.assertEqual(response.status_code, 200)
+        results = response.json["results"]
+        self.assertEqual([r["filename"] for r in results], ['a.jpg', 'junk.jpg', 'b.jpg', 'anim.gif'])
+        self.assertEqual([r.get("reason") for r in results], [None, 'unreadable', None, 'unsupported_format'])
+        for result in (results[0], results[2]):
+            self.assertIn(result["condition"], server.CATEGORIES)
+            self.assertEqual(result["model_version"], server.model_loader.model.version)
+
+    def test_batch_results_match_single_predictions(self):
+        uploads = [('a.jpg', jpeg(3)), ('b.jpg', jpeg(4))]
+        batch = self.post_files('/predict_batch', 'files', uploads).json["results"]
+        server.clear_prediction_caches()
+        for (filename, data), batched in zip(uploads, batch):
+            single = self.post_files('/predict', 'file', [(filename, data)]).json
+            self.assertEqual(single["condition"], batched["condition"])
+            self.assertAlmostEqual(single["confidence"], batched["confidence"], places=5)
+
+    def test_repeated_uploads_are_answered_from_the_cache(self):
+        uploads = [('a.jpg', jpeg(5))]
+        self.post_files('/predict_batch', 'files', uploads)
+        with mock.patch.object(server, 'run_prediction', side_effect=AssertionError("model ran")):
+            response = self.post_files('/predict_batch', 'files', uploads * 2)
+        self.assertEqual([r["filename"] for r in response.json["results"]], ['a.jpg', 'a.jpg'])
+
+    def test_request_limits(self):
+        self.assertEqual(self.post_files('/predict_batch', 'files', []).status_code, 400)
+        too_many = [(f'{i}.jpg', b'x') for i in range(server.MAX_BATCH_FILES + 1)]
+        response = self.post_files('/predict_batch', 'files', too_many)
+        self.assertEqual(response.status_code, 400)
+        self.assertIn(str(server.MAX_BATCH_FILES), response.json["error"])
+
+    def test_single_upload_rejection_uses_its_status_code(self):
+        response = self.post_files('/predict', 'file', [('anim.gif', self.gif())])
+        self.assertEqual((response.status_code, response.json["reason"]), (415, 'unsupported_format'))
+
+    @staticmethod
+    def gif():
+        data = io.BytesIO()
+        Image.new('RGB', (8, 8)).save(data, 'GIF')
+        return data.getvalue()
+
+
+class AdminModelTests(ServerTestCase):
+    def admin(self, method, path, **kwargs):
+        return getattr(self.client, method)(path, headers={'X-Admin-Token': ADMIN_TOKEN}, **kwargs)
+
+    def test_admin_token_is_required(self):
+        self.assertEqual(self.client.get('/admin/model').status_code, 403)
+        self.assertEqual(self.client.post('/admin/model/rollback',
+                                          headers={'X-Admin-Token': 'wrong'}).status_code, 403)
+
+    def test_swap_then_rollback(self):
+        original = server.model_loader.model.version
+        candidate = build_tiny_vit(os.path.join(_directory.name, 'candidate'), seed=1)
+
+        response = self.admin('post', '/admin/model', json={"model_path": candidate})
+        self.assertEqual(response.status_code, 202)
+        wait_for(lambda: server.model_loader.swap_status["state"] == 'swapped', timeout=120)
+        swapped = self.admin('get', '/admin/model').json
+        self.assertNotEqual(swapped["version"], original)
+        self.assertEqual(swapped["previous_version"], original)
+        prediction = self.post_files('/predict', 'file', [('a.jpg', jpeg(6))]).json
+        self.assertEqual(prediction["model_version"], swapped["version"])
+
+        rolled_back = self.admin('post', '/admin/model/rollback')
+        self.assertEqual(rolled_back.status_code, 200)
+        self.assertEqual((rolled_back.json["version"], rolled_back.json["previous_version"]),
+                         (original, swapped["version"]))
+        # Cached answers are keyed by model version, so the rolled-back model answers again
+        prediction = self.post_files('/predict', 'file', [('a.jpg', jpeg(6))]).json
+        self.assertEqual(prediction["model_version"], original)
+
+    def test_checkpoints_that_cannot_be_served_are_refused(self):
+        response = self.admin('post', '/admin/model', json={"model_path": _directory.name})
+        self.assertEqual(response.status_code, 400)
+
+        other = build_tiny_vit(os.path.join(_directory.name, 'other-preprocessing'))
+        with open(os.path.join(other, 'preprocessor_config.json'), 'w') as f:
+            f.write('{"size": 160, "image_mean": [0.5, 0.5, 0.5], "image_std": [0.5, 0.5, 0.5]}')
+        response = self.admin('post', '/admin/model', json={"model_path": other})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('different preprocessing', response.json["error"])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,151 @@
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+
+from metrics import MetricsRegistry
+
+
+def define(registry):
+    """The same metrics every server process registers."""
+    return {
+        "requests": registry.counter('requests_total', "Requests by status", ('status',)),
+        "latency": registry.histogram('latency_seconds', "Request latency", buckets=(0.1, 1.0)),
+        "in_flight": registry.gauge('in_flight', "Requests in flight"),
+        "model_info": registry.gauge('model_info', "The loaded model", ('version',), multiprocess_mode='max'),
+    }
+
+
+def dead_pid():
+    process = subprocess.Popen([sys.executable, '-c', 'pass'])
+    process.wait()
+    return process.pid
+
+
+class MultiProcessGaugeTests(unittest.TestCase):
+    def setUp(self):
+        self._directory = tempfile.TemporaryDirectory()
+        self.directory = self._directory.name
+        self.addCleanup(self._directory.cleanup)
+        # Only collect() reads the directory; set afterwards so no flusher thread or exit hook is started
+        self.registry = MetricsRegistry()
+        self.registry.directory = self.directory
+
+    def write_other_process(self, pid, record):
+        """Write the metrics file another server process with `pid` would have flushed."""
+        other = MetricsRegistry()
+        record(define(other))
+        with open(os.path.join(self.directory, f"metrics-{pid}.json"), 'w') as f:
+            json.dump(other.snapshot(), f)
+
+    def samples(self, name):
+        return {tuple(labels): value for labels, value in self.registry.collect()[name]["samples"]}
+
+    def record(self, metrics):
+        metrics["requests"].inc('200', amount=3)
+        metrics["requests"].inc('503')
+        metrics["latency"].observe(0.05)
+        metrics["latency"].observe(0.5)
+        metrics["in_flight"].set(2)
+        metrics["model_info"].set(1, 'abc')
+
+    def test_gauges_are_summed_by_default(self):
+        self.record(define(self.registry))
+        self.write_other_process(os.getppid(), self.record)
+        self.assertEqual(self.samples('in_flight'), {(): 4})
+
+    def test_info_gauges_read_one_across_processes(self):
+        self.record(define(self.registry))
+        for _ in range(3):
+            self.write_other_process(os.getppid(), self.record)
+        self.assertEqual(self.samples('model_info'), {('abc',): 1})
+        self.assertIn('model_info{version="abc"} 1', self.registry.render())
+
+    def test_gauges_of_exited_processes_are_dropped(self):
+        self.record(define(self.registry))
+        self.write_other_process(dead_pid(), self.record)
+        self.assertEqual(self.samples('in_flight'), {(): 2})
+
+    def test_counters_and_histograms_are_summed(self):
+        self.record(define(self.registry))
+        self.write_other_process(os.getppid(), self.record)
+        self.assertEqual(self.samples('requests_total'), {('200',): 6, ('503',): 2})
+        # Per-bucket counts for (<=0.1, <=1.0, +Inf) and the sum of observations
+        self.assertEqual(self.samples('latency_seconds'), {(): [[2, 2, 0], 1.1]})
+
+    def test_counters_and_histograms_of_exited_processes_are_kept(self):
+        self.record(define(self.registry))
+        self.write_other_process(dead_pid(), self.record)
+        self.assertEqual(self.samples('requests_total'), {('200',): 6, ('503',): 2})
+        self.assertEqual(self.samples('latency_seconds')[()][0], [2, 2, 0])
+
+    def test_flushed_file_is_read_back(self):
+        self.record(define(self.registry))
+        self.registry.flush()
+        self.assertEqual(os.listdir(self.directory), [f"metrics-{os.getpid()}.json"])
+        # The process's own file is not merged on top of its live values
+        self.assertEqual(self.samples('requests_total'), {('200',): 3, ('503',): 1})
+
+    def test_unknown_multiprocess_mode_is_rejected(self):
+        with self.assertRaises(ValueError):
+            MetricsRegistry().gauge('bad', "Bad", multiprocess_mode='mean')
+
+
+class RenderTests(unittest.TestCase):
+    def setUp(self):
+        self.registry = MetricsRegistry()
+        self.metrics = define(self.registry)
+
+    def test_prometheus_text_format(self):
+        self.metrics["requests"].inc('200', amount=3)
+        self.metrics["in_flight"].set(1.5)
+        self.assertEqual(self.registry.render().splitlines()[:6], [
+            '# HELP requests_total Requests by status',
+            '# TYPE requests_total counter',
+            'requests_total{status="200"} 3',
+            '# HELP latency_seconds Request latency',
+            '# TYPE latency_seconds histogram',
+            '# HELP in_flight Requests in flight',
+        ])
+        self.assertIn('in_flight 1.5', self.registry.render())
+
+    def test_histogram_buckets_are_cumulative(self):
+        # A value equal to a bound falls in that bucket, as `le` means less than or equal
+        for value in (0.05, 0.1, 0.5, 7.0):
+            self.metrics["latency"].observe(value)
+        lines = [line for line in self.registry.render().splitlines() if line.startswith('latency_seconds')]
+        self.assertEqual(lines, [
+            'latency_seconds_bucket{le="0.1"} 2',
+            'latency_seconds_bucket{le="1.0"} 3',
+            'latency_seconds_bucket{le="+Inf"} 4',
+            'latency_seconds_sum 7.65',
+            'latency_seconds_count 4',
+        ])
+
+    def test_label_values_are_escaped(self):
+        self.metrics["model_info"].set(1, 'say "hi"\\n')
+        self.assertIn('model_info{version="say \\"hi\\"\\\\n"} 1', self.registry.render())
+
+    def test_function_gauges_are_read_at_collection(self):
+        versions = {('v1',): 1}
+        self.metrics["model_info"].set_function(lambda: versions)
+        self.assertIn('model_info{version="v1"} 1', self.registry.render())
+        versions = {('v2',): 1}
+        self.metrics["model_info"].set_function(lambda: versions)
+        render = self.registry.render()
+        self.assertIn('model_info{version="v2"} 1', render)
+        self.assertNotIn('v1', render)
+
+    def test_timers_observe_and_track_in_flight(self):
+        with self.metrics["in_flight"].track_inprogress():
+            self.assertEqual(self.metrics["in_flight"].samples(), [[[], 1]])
+            with self.metrics["latency"].time():
+                pass
+        self.assertEqual(self.metrics["in_flight"].samples(), [[[], 0]])
+        self.assertEqual(self.metrics["latency"].samples()[0][1][0], [1, 0, 0])
+
+
+if __name__ == '__main__':
+    unittest.main()
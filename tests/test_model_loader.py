@@ -0,0 +1,175 @@
+import threading
+import time
+import unittest
+
+from model_loader import ModelLoader, ModelNotReady
+
+
+def wait_for(predicate, timeout=10):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        if time.monotonic() > deadline:
+            raise AssertionError("Timed out waiting for the model loader")
+        time.sleep(0.01)
+
+
+class FakeModel:
+    def __init__(self, version):
+        self.version = version
+
+
+class ModelLoaderTests(unittest.TestCase):
+    def test_background_load_then_warm_up_then_ready(self):
+        release = threading.Event()
+        steps = []
+
+        def load():
+            release.wait(10)
+            return FakeModel('v1')
+
+        loader = ModelLoader(load, lambda model, batch_size: steps.append((model.version, batch_size)),
+                             batch_size=2, min_runs=10, max_runs=10)
+        loader.start()
+        self.assertFalse(loader.loaded)
+        self.assertFalse(loader.ready)
+        with self.assertRaises(ModelNotReady):
+            loader.model
+
+        release.set()
+        wait_for(lambda: loader.ready)
+        self.assertEqual(loader.model.version, 'v1')
+        self.assertEqual(steps, [('v1', 2)] * 10)
+        status = loader.status()
+        self.assertEqual((status["state"], status["ready"], status["warmup_runs"]), ('ready', True, 10))
+        self.assertIn('load', status["startup_seconds"])
+
+    def test_warm_up_stops_once_latency_is_stable(self):
+        loader = ModelLoader(lambda: FakeModel('v1'), lambda model, batch_size: time.sleep(0.005),
+                             min_runs=10, max_runs=60, tolerance=0.5)
+        loader.start()
+        wait_for(lambda: loader.ready)
+        # Stops after the first two windows that agree, well before max_runs
+        self.assertLess(len(loader.warmup_latencies_ms), 60)
+
+    def test_warm_up_stops_at_max_runs_if_latency_never_settles(self):
+        delays = iter([0.001, 0.004] * 20)
+        loader = ModelLoader(lambda: FakeModel('v1'), lambda model, batch_size: time.sleep(next(delays)),
+                             min_runs=10, max_runs=20, tolerance=0.0)
+        loader.start()
+        wait_for(lambda: loader.ready)
+        self.assertEqual(len(loader.warmup_latencies_ms), 20)
+
+    def test_failed_load_is_reported_and_never_ready(self):
+        def load():
+            raise RuntimeError("weights missing")
+
+        loader = ModelLoader(load)
+        loader.start()
+        wait_for(lambda: loader.state == 'failed')
+        self.assertFalse(loader.ready)
+        self.assertEqual(loader.status()["error"], "weights missing")
+
+    def test_synchronous_load_is_not_ready_until_warmed_up(self):
+        # What the prefork master does before forking its workers
+        loader = ModelLoader(lambda: FakeModel('v1'), lambda model, batch_size: None)
+        loader.load()
+        self.assertTrue(loader.loaded)
+        self.assertFalse(loader.ready)
+        loader.start()
+        wait_for(lambda: loader.ready)
+
+
+class SwapTests(unittest.TestCase):
+    def setUp(self):
+        self.unloaded = []
+        self.loader = ModelLoader(lambda: FakeModel('v1'), lambda model, batch_size: None,
+                                  unload=lambda model: self.unloaded.append(model.version))
+        self.loader.load()
+
+    def swap(self, version):
+        self.assertTrue(self.loader.swap(lambda: FakeModel(version)))
+        wait_for(lambda: self.loader.swap_status["state"] not in ('loading', 'warming_up'))
+        return self.loader.swap_status
+
+    def test_new_model_serves_only_after_it_is_warmed_up(self):
+        release = threading.Event()
+        warmed = []
+
+        def warmup_step(model, batch_size):
+            release.wait(10)
+            warmed.append(model.version)
+
+        loader = ModelLoader(lambda: FakeModel('v1'), warmup_step, min_runs=10, max_runs=10)
+        loader.load()
+        self.assertTrue(loader.swap(lambda: FakeModel('v2')))
+        wait_for(lambda: loader.swap_status["state"] == 'warming_up')
+        # The current model keeps serving while the new one warms up
+        self.assertEqual(loader.model.version, 'v1')
+
+        release.set()
+        wait_for(lambda: loader.swap_status["state"] == 'swapped')
+        self.assertEqual((loader.model.version, loader.previous.version), ('v2', 'v1'))
+        self.assertEqual(warmed, ['v2'] * 10)
+        self.assertIsNotNone(loader.swap_status["warmup_p50_ms"])
+
+    def test_swap_is_refused_before_the_first_load(self):
+        loader = ModelLoader(lambda: FakeModel('v1'))
+        self.assertFalse(loader.swap(lambda: FakeModel('v2')))
+
+    def test_swap_is_refused_while_another_is_running(self):
+        release = threading.Event()
+
+        def load():
+            release.wait(10)
+            return FakeModel('v2')
+
+        self.assertTrue(self.loader.swap(load))
+        self.assertFalse(self.loader.swap(lambda: FakeModel('v3')))
+        release.set()
+        wait_for(lambda: self.loader.swap_status["state"] == 'swapped')
+        self.assertEqual(self.loader.model.version, 'v2')
+
+    def test_failed_swap_keeps_serving_the_current_model(self):
+        def load():
+            raise RuntimeError("bad checkpoint")
+
+        self.assertTrue(self.loader.swap(load))
+        wait_for(lambda: self.loader.swap_status["state"] == 'failed')
+        self.assertEqual(self.loader.swap_status["error"], "bad checkpoint")
+        self.assertEqual(self.loader.model.version, 'v1')
+        self.assertEqual(self.unloaded, [])
+
+    def test_rollback_swaps_back_and_forth(self):
+        self.swap('v2')
+        self.assertEqual(self.loader.rollback().version, 'v1')
+        self.assertEqual(self.loader.status()["previous_version"], 'v2')
+        self.assertEqual(self.loader.rollback().version, 'v2')
+
+    def test_rollback_without_a_previous_model_is_none(self):
+        self.assertIsNone(self.loader.rollback())
+        self.assertEqual(self.loader.model.version, 'v1')
+
+    def test_only_the_serving_and_previous_models_stay_resident(self):
+        self.swap('v2')
+        self.assertEqual(self.unloaded, [])
+        # Swapping again drops v1, which is neither serving nor the rollback target any more
+        self.swap('v3')
+        self.assertEqual(self.unloaded, ['v1'])
+        self.assertEqual((self.loader.model.version, self.loader.previous.version), ('v3', 'v2'))
+        self.assertEqual(self.loader.status()["version"], 'v3')
+
+    def test_failed_swap_keeps_the_rollback_target(self):
+        self.swap('v2')
+
+        def load():
+            raise RuntimeError("bad checkpoint")
+
+        self.assertTrue(self.loader.swap(load))
+        wait_for(lambda: self.loader.swap_status["state"] == 'failed')
+        self.assertEqual(self.unloaded, [])
+        self.assertEqual(self.loader.rollback().version, 'v1')
+        self.assertEqual(self.loader.previous.version, 'v2')
+
+
+if __name__ == '__main__':
+    unittest.main()
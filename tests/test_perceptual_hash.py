@@ -0,0 +1,90 @@
+import io
+import os
+import unittest
+
+import numpy as np
+from PIL import Image
+
+from perceptual_hash import HASH_SIZE, NearDuplicateIndex, dhash
+from sample_images import synthetic_images
+
+HASH_BYTES = HASH_SIZE * HASH_SIZE // 8
+
+
+def hash_with_bits_set(count):
+    """A hash that is `count` bits away from the all-zero hash."""
+    bits = np.zeros(HASH_SIZE * HASH_SIZE, dtype=bool)
+    bits[:count] = True
+    return np.packbits(bits)
+
+
+def hamming(a, b):
+    return int(np.unpackbits(np.bitwise_xor(a, b)).sum())
+
+
+class NearDuplicateIndexTests(unittest.TestCase):
+    def test_matches_up_to_max_distance_bits(self):
+        index = NearDuplicateIndex(max_distance=10)
+        index.add(np.zeros(HASH_BYTES, dtype=np.uint8), "stored")
+
+        self.assertEqual(index.lookup(hash_with_bits_set(0)), "stored")
+        self.assertEqual(index.lookup(hash_with_bits_set(10)), "stored")
+        self.assertIsNone(index.lookup(hash_with_bits_set(11)))
+
+        stats = index.stats()
+        self.assertEqual((stats["lookups"], stats["hits"]), (3, 2))
+        self.assertEqual(stats["nearest_distance_histogram"], {"0": 1, "10": 1, "11": 1})
+
+    def test_closest_stored_hash_wins(self):
+        index = NearDuplicateIndex(max_distance=10)
+        index.add(hash_with_bits_set(8), "eight")
+        index.add(hash_with_bits_set(2), "two")
+        self.assertEqual(index.lookup(hash_with_bits_set(3)), "two")
+        self.assertEqual(index.lookup(hash_with_bits_set(7)), "eight")
+
+    def test_zero_distance_only_matches_identical_hashes(self):
+        index = NearDuplicateIndex(max_distance=0)
+        index.add(hash_with_bits_set(5), "five")
+        self.assertEqual(index.lookup(hash_with_bits_set(5)), "five")
+        self.assertIsNone(index.lookup(hash_with_bits_set(4)))
+
+    @unittest.skipIf('AI_PHASH_MAX_DISTANCE' in os.environ, "near-duplicate distance set by the environment")
+    def test_lookup_is_off_by_default(self):
+        self.assertFalse(NearDuplicateIndex().enabled)
+
+    def test_negative_distance_disables_the_lookup(self):
+        self.assertFalse(NearDuplicateIndex(max_distance=-1).enabled)
+        self.assertTrue(NearDuplicateIndex(max_distance=0).enabled)
+
+    def test_oldest_entry_is_overwritten_when_full(self):
+        index = NearDuplicateIndex(max_distance=0, max_entries=2)
+        for count in (1, 2, 3):
+            index.add(hash_with_bits_set(count), count)
+        self.assertIsNone(index.lookup(hash_with_bits_set(1)))
+        self.assertEqual((index.lookup(hash_with_bits_set(2)), index.lookup(hash_with_bits_set(3))), (2, 3))
+        self.assertEqual(index.stats()["entries"], 2)
+
+    def test_empty_index_and_clear(self):
+        index = NearDuplicateIndex()
+        self.assertIsNone(index.lookup(hash_with_bits_set(0)))
+        index.add(hash_with_bits_set(0), "stored")
+        index.clear()
+        self.assertIsNone(index.lookup(hash_with_bits_set(0)))
+
+
+class DifferenceHashTests(unittest.TestCase):
+    def test_reencoded_copy_is_close_and_a_different_image_is_far(self):
+        original, other = synthetic_images(2, seed=11)
+        buffer = io.BytesIO()
+        original.resize((480, 360)).save(buffer, 'JPEG', quality=60)
+        reencoded = Image.open(buffer)
+
+        self.assertLessEqual(hamming(dhash(original), dhash(reencoded)), 10)
+        self.assertGreater(hamming(dhash(original), dhash(other)), 40)
+
+    def test_hash_has_hash_size_squared_bits(self):
+        self.assertEqual(dhash(synthetic_images(1)[0]).shape, (HASH_BYTES,))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,80 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from prediction_cache import PredictionCache, compute_model_version
+
+
+class PredictionCacheTests(unittest.TestCase):
+    def test_keys_include_the_model_version(self):
+        upload = b'jpeg bytes'
+        self.assertEqual(PredictionCache.make_key(upload, 'v1'), PredictionCache.make_key(upload, 'v1'))
+        self.assertNotEqual(PredictionCache.make_key(upload, 'v1'), PredictionCache.make_key(upload, 'v2'))
+        self.assertNotEqual(PredictionCache.make_key(upload, 'v1'), PredictionCache.make_key(b'other', 'v1'))
+
+        cache = PredictionCache()
+        cache.put(PredictionCache.make_key(upload, 'v1'), {"condition": "Acne"})
+        self.assertIsNone(cache.get(PredictionCache.make_key(upload, 'v2')))
+        self.assertEqual(cache.get(PredictionCache.make_key(upload, 'v1')), {"condition": "Acne"})
+
+    def test_least_recently_used_entry_is_evicted(self):
+        cache = PredictionCache(max_entries=2)
+        cache.put('a', 1)
+        cache.put('b', 2)
+        # Reading 'a' makes 'b' the least recently used
+        self.assertEqual(cache.get('a'), 1)
+        cache.put('c', 3)
+
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual((cache.get('a'), cache.get('c')), (1, 3))
+        self.assertEqual(cache.stats()["evictions"], 1)
+
+    def test_entries_expire_after_the_ttl(self):
+        cache = PredictionCache(ttl_seconds=60)
+        with mock.patch('prediction_cache.time.monotonic', return_value=1000.0):
+            cache.put('a', 1)
+        with mock.patch('prediction_cache.time.monotonic', return_value=1059.0):
+            self.assertEqual(cache.get('a'), 1)
+        with mock.patch('prediction_cache.time.monotonic', return_value=1061.0):
+            self.assertIsNone(cache.get('a'))
+
+        stats = cache.stats()
+        self.assertEqual((stats["entries"], stats["expirations"], stats["hits"], stats["misses"]), (0, 1, 1, 1))
+
+    def test_zero_entries_disables_the_cache(self):
+        cache = PredictionCache(max_entries=0)
+        cache.put('a', 1)
+        self.assertIsNone(cache.get('a'))
+
+    def test_clear(self):
+        cache = PredictionCache()
+        cache.put('a', 1)
+        cache.clear()
+        self.assertIsNone(cache.get('a'))
+
+
+class ModelVersionTests(unittest.TestCase):
+    def test_version_changes_with_the_config_and_the_weights(self):
+        with tempfile.TemporaryDirectory() as model_dir:
+            with open(os.path.join(model_dir, 'config.json'), 'w') as f:
+                f.write('{"num_labels": 9}')
+            weights = os.path.join(model_dir, 'model.safetensors')
+            with open(weights, 'wb') as f:
+                f.write(b'0' * 16)
+            version = compute_model_version(model_dir)
+            self.assertEqual(compute_model_version(model_dir), version)
+
+            # A new checkpoint of the same size is told apart by its mtime
+            stat = os.stat(weights)
+            os.utime(weights, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000))
+            retrained = compute_model_version(model_dir)
+            self.assertNotEqual(retrained, version)
+
+            with open(os.path.join(model_dir, 'config.json'), 'w') as f:
+                f.write('{"num_labels": 10}')
+            self.assertNotEqual(compute_model_version(model_dir), retrained)
+
+
+if __name__ == '__main__':
+    unittest.main()
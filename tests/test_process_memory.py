@@ -0,0 +1,50 @@
+import os
+import subprocess
+import sys
+import unittest
+
+import numpy as np
+
+from process_memory import child_pids, prefork_memory_report, read_memory
+
+
+@unittest.skipUnless(os.path.exists('/proc/self/smaps_rollup'), "needs Linux /proc/<pid>/smaps_rollup")
+class ProcessMemoryTests(unittest.TestCase):
+    def test_reads_this_process(self):
+        memory = read_memory(os.getpid())
+        self.assertEqual(set(memory), {"rss_mb", "pss_mb", "shared_mb", "private_mb"})
+        self.assertGreater(memory["rss_mb"], 0)
+        self.assertLessEqual(memory["pss_mb"], memory["rss_mb"])
+
+    def test_missing_process_reads_as_none(self):
+        process = subprocess.Popen([sys.executable, '-c', 'pass'])
+        process.wait()
+        self.assertIsNone(read_memory(process.pid))
+
+    def test_forked_child_shares_the_parent_pages(self):
+        # Stands in for the model weights the prefork master loads before forking
+        weights = np.ones(64 * 1024 * 1024 // 8)
+        read_fd, write_fd = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            os.close(write_fd)
+            os.read(read_fd, 1)
+            os._exit(0)
+        os.close(read_fd)
+        try:
+            self.assertIn(pid, child_pids(os.getpid()))
+            report = prefork_memory_report(os.getpid())
+            child = report["workers"][str(pid)]
+            # The untouched 64 MB array is shared with the child, not copied into it
+            self.assertGreater(child["shared_mb"], 50)
+            self.assertLess(child["private_mb"], 50)
+            self.assertLess(report["combined_pss_mb"], report["combined_rss_mb"])
+        finally:
+            os.write(write_fd, b'x')
+            os.close(write_fd)
+            os.waitpid(pid, 0)
+        self.assertEqual(float(weights.sum()), len(weights))
+
+
+if __name__ == '__main__':
+    unittest.main()
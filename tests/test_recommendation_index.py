@@ -0,0 +1,48 @@
+import unittest
+
+import pandas as pd
+
+from recommendation_index import RecommendationIndex
+
+
+class RecommendationIndexTests(unittest.TestCase):
+    def setUp(self):
+        self.df = pd.DataFrame({
+            'Product': ['Gel A', 'Serum B', None, 'Cream D', 'Toner E', 'Mask F'],
+            'Targets': ['Acne, Oily Skin', 'acne', 'Acne', 'Dry Skin', 'ACNE scars', 'Wrinkles'],
+            'Condition': ['Acne', 'acne', 'Acne', 'Dry Skin', 'Acne', 'Wrinkles'],
+        })
+
+    def test_substring_index_matches_the_pandas_filter_it_replaces(self):
+        conditions = ['Acne', 'Dry Skin', 'Wrinkles', 'Milia']
+        index = RecommendationIndex.from_substring(self.df, 'Targets', conditions, required='Product')
+        for condition in conditions:
+            matches = self.df[self.df['Targets'].str.lower().str.contains(condition.lower(), na=False)]
+            expected = matches[matches['Product'].notna()].head(3).to_dict(orient='records')
+            self.assertEqual(index(condition), expected)
+        self.assertEqual([p['Product'] for p in index('Acne')], ['Gel A', 'Serum B', 'Toner E'])
+
+    def test_substring_matching_is_literal(self):
+        df = pd.DataFrame({'Product': ['A', 'B'], 'Targets': ['Acne (mild)', 'Acne']})
+        index = RecommendationIndex.from_substring(df, 'Targets', ['Acne (mild)'])
+        self.assertEqual([p['Product'] for p in index('Acne (mild)')], ['A'])
+
+    def test_column_index_groups_case_insensitively_and_keeps_fields(self):
+        index = RecommendationIndex.from_column(self.df, 'Condition', ['Product'], top_k=2)
+        self.assertEqual(index('ACNE'), [{'Product': 'Gel A'}, {'Product': 'Serum B'}])
+        self.assertEqual(index('dry skin'), [{'Product': 'Cream D'}])
+        self.assertEqual(len(index), 3)
+
+    def test_unknown_condition_gets_an_empty_list(self):
+        index = RecommendationIndex({'Acne': [{'Product': 'Gel A'}]})
+        self.assertEqual(index('Milia'), [])
+        self.assertEqual(index('acne'), [{'Product': 'Gel A'}])
+
+    def test_callers_cannot_change_the_index(self):
+        index = RecommendationIndex({'Acne': [{'Product': 'Gel A'}]})
+        index('Acne').append({'Product': 'Injected'})
+        self.assertEqual(len(index('Acne')), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,107 @@
+import os
+import pstats
+import tempfile
+import threading
+import time
+import unittest
+
+from request_profiler import PROFILE_HEADER, RequestProfiler
+
+
+def busy(seconds):
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        pass
+
+
+class RequestProfilerTests(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+
+    def profiler(self, **kwargs):
+        kwargs.setdefault('admin_token', 'secret')
+        kwargs.setdefault('sample_rate', 0)
+        return RequestProfiler(self.directory, **kwargs)
+
+    def test_nothing_is_profiled_when_disabled(self):
+        profiler = self.profiler(admin_token='')
+        self.assertFalse(profiler.enabled)
+        self.assertIsNone(profiler.start({PROFILE_HEADER: ''}, '/predict'))
+
+    def test_only_the_admin_token_selects_a_request(self):
+        profiler = self.profiler()
+        self.assertIsNone(profiler.start({}, '/predict'))
+        self.assertIsNone(profiler.start({PROFILE_HEADER: 'wrong'}, '/predict'))
+        session = profiler.start({PROFILE_HEADER: 'secret'}, '/predict')
+        self.assertIsNotNone(session)
+        session.stop()
+
+    def test_sample_rate_selects_requests_without_a_token(self):
+        profiler = self.profiler(admin_token='', sample_rate=1.0)
+        session = profiler.start({}, '/predict')
+        self.assertIsNotNone(session)
+        session.stop()
+
+    def test_one_request_at_a_time(self):
+        profiler = self.profiler()
+        first = profiler.start({PROFILE_HEADER: 'secret'}, '/predict')
+        self.assertIsNone(profiler.start({PROFILE_HEADER: 'secret'}, '/predict'))
+        first.stop()
+        second = profiler.start({PROFILE_HEADER: 'secret'}, '/predict')
+        self.assertIsNotNone(second)
+        second.stop()
+
+    def test_collapsed_stacks_include_the_request_and_prefixed_threads(self):
+        profiler = self.profiler(interval_ms=1, thread_prefixes=('micro-batcher',))
+        worker = threading.Thread(target=busy, args=(0.2,), name='micro-batcher-0')
+        session = profiler.start({PROFILE_HEADER: 'secret'}, '/predict batch')
+        worker.start()
+        busy(0.2)
+        worker.join()
+        name = session.stop()
+
+        self.assertRegex(name, r'-predict_batch-\d+-\d+ms\.collapsed$')
+        with open(os.path.join(self.directory, name)) as f:
+            stacks = f.read().splitlines()
+        self.assertTrue(any(line.startswith('MainThread;') and 'busy (test_request_profiler.py' in line
+                            for line in stacks))
+        self.assertTrue(any(line.startswith('micro-batcher-0;') for line in stacks))
+        for line in stacks:
+            self.assertRegex(line, r' \d+$')
+
+    def test_cprofile_format_writes_pstats(self):
+        profiler = self.profiler(profile_format='cprofile')
+        session = profiler.start({PROFILE_HEADER: 'secret'}, '/predict')
+        busy(0.01)
+        name = session.stop()
+        self.assertTrue(name.endswith('.prof'))
+        stats = pstats.Stats(os.path.join(self.directory, name))
+        self.assertTrue(any(function == 'busy' for _, _, function in stats.stats))
+
+    def test_unknown_format_is_rejected(self):
+        with self.assertRaisesRegex(ValueError, "Unknown profile format 'perf'"):
+            self.profiler(profile_format='perf')
+
+    def test_oldest_profiles_are_rotated_out(self):
+        profiler = self.profiler(max_files=2, profile_format='cprofile')
+        names = []
+        for label in ('first', 'second', 'third'):
+            names.append(profiler.start({PROFILE_HEADER: 'secret'}, label).stop())
+            # Distinct modification times, so rotation order is deterministic
+            os.utime(os.path.join(self.directory, names[-1]), (len(names), len(names)))
+            profiler.rotate()
+        self.assertEqual([p["name"] for p in profiler.list_profiles()], [names[2], names[1]])
+
+    def test_only_listed_profiles_can_be_downloaded(self):
+        profiler = self.profiler(profile_format='cprofile')
+        name = profiler.start({PROFILE_HEADER: 'secret'}, '/predict').stop()
+        self.assertEqual(profiler.profile_path(name), os.path.join(self.directory, name))
+        self.assertIsNone(profiler.profile_path('missing.prof'))
+        self.assertIsNone(profiler.profile_path('../etc/passwd'))
+        self.assertIsNone(profiler.profile_path('notes.txt'))
+
+
+if __name__ == '__main__':
+    unittest.main()
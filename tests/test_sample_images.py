@@ -0,0 +1,36 @@
+import os
+import tempfile
+import unittest
+
+import numpy as np
+from PIL import Image
+
+from sample_images import find_images, synthetic_image, synthetic_images
+
+
+class SyntheticImageTests(unittest.TestCase):
+    def test_same_seed_gives_same_images(self):
+        first, second = synthetic_images(3, seed=7), synthetic_images(3, seed=7)
+        for a, b in zip(first, second):
+            np.testing.assert_array_equal(np.asarray(a), np.asarray(b))
+        self.assertFalse(np.array_equal(np.asarray(first[0]), np.asarray(synthetic_images(1, seed=8)[0])))
+
+    def test_size_and_mode(self):
+        image = synthetic_image(np.random.default_rng(0), 320, 200)
+        self.assertEqual(image.size, (320, 200))
+        self.assertEqual(image.mode, 'RGB')
+
+
+class FindImagesTests(unittest.TestCase):
+    def test_finds_jpeg_and_png_recursively(self):
+        with tempfile.TemporaryDirectory() as directory:
+            os.makedirs(os.path.join(directory, 'nested'))
+            Image.new('RGB', (4, 4)).save(os.path.join(directory, 'b.jpg'))
+            Image.new('RGB', (4, 4)).save(os.path.join(directory, 'nested', 'a.png'))
+            open(os.path.join(directory, 'notes.txt'), 'w').close()
+            found = [os.path.relpath(p, directory) for p in find_images(directory)]
+        self.assertEqual(sorted(found), ['b.jpg', os.path.join('nested', 'a.png')])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,89 @@
+import threading
+import time
+import unittest
+
+import torch
+
+from shadow_evaluation import ShadowEvaluator
+
+
+def wait_for(predicate, timeout=10):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        if time.monotonic() > deadline:
+            raise AssertionError("Timed out waiting for the shadow model")
+        time.sleep(0.01)
+
+
+class ShadowEvaluatorTests(unittest.TestCase):
+    def setUp(self):
+        self.release = threading.Event()
+        self.addCleanup(self.release.set)
+        self.pixel_values = torch.zeros(2, 3, 4, 4)
+        # Live top-2 for two images: class 1 at 0.9, then class 2 at 0.6
+        self.top_probs = torch.tensor([[0.9, 0.05], [0.6, 0.3]])
+        self.top_indices = torch.tensor([[1, 0], [2, 0]])
+
+    def evaluated(self, shadow, images):
+        wait_for(lambda: sum(shadow.stats()["images"].values()) >= images)
+        return shadow.stats()
+
+    def test_agreement_is_measured_on_top1(self):
+        seen = []
+
+        def run(pixel_values):
+            seen.append(pixel_values.clone())
+            return torch.tensor([[0.8, 0.1], [0.7, 0.2]]), torch.tensor([[1, 2], [3, 2]])
+
+        shadow = ShadowEvaluator(run, sample_rate=1.0)
+        self.assertTrue(shadow.submit(self.pixel_values, self.top_probs, self.top_indices, queue_depth=0))
+        # The live path reuses its buffer right away; the shadow works on its own copy
+        self.pixel_values.fill_(1.0)
+
+        stats = self.evaluated(shadow, 2)
+        self.assertEqual(stats["images"], {'evaluated': 2})
+        self.assertEqual(stats["agreement_rate"], 0.5)
+        self.assertEqual(float(seen[0].abs().sum()), 0.0)
+
+    def test_unsampled_batches_are_not_counted(self):
+        shadow = ShadowEvaluator(lambda pixel_values: self.fail("shadow ran"), sample_rate=0.0)
+        self.assertFalse(shadow.submit(self.pixel_values, self.top_probs, self.top_indices, queue_depth=0))
+        self.assertEqual(shadow.stats()["images"], {})
+        self.assertIsNone(shadow.stats()["agreement_rate"])
+
+    def test_shed_while_the_live_model_has_a_queue(self):
+        shadow = ShadowEvaluator(lambda pixel_values: self.fail("shadow ran"), sample_rate=1.0, shed_queue_depth=4)
+        self.assertFalse(shadow.submit(self.pixel_values, self.top_probs, self.top_indices, queue_depth=5))
+        self.assertEqual(shadow.stats()["images"], {'shed_queue_pressure': 2})
+
+    def test_shed_when_shadow_jobs_back_up(self):
+        def run(pixel_values):
+            self.release.wait(10)
+            return self.top_probs, self.top_indices
+
+        shadow = ShadowEvaluator(run, sample_rate=1.0, max_pending=1)
+        results = [shadow.submit(self.pixel_values, self.top_probs, self.top_indices, queue_depth=0)
+                   for _ in range(3)]
+        # One evaluating, one waiting, the third shed
+        self.assertEqual(results, [True, True, False])
+        self.assertEqual(shadow.stats()["images"], {'shed_backlog': 2})
+
+        self.release.set()
+        stats = self.evaluated(shadow, 6)
+        self.assertEqual(stats["images"], {'shed_backlog': 2, 'evaluated': 4})
+        self.assertEqual(stats["agreement_rate"], 1.0)
+
+    def test_shadow_errors_are_counted_and_never_raised(self):
+        def run(pixel_values):
+            raise RuntimeError("shadow crashed")
+
+        shadow = ShadowEvaluator(run, sample_rate=1.0)
+        with self.assertLogs('shadow_evaluation', 'ERROR'):
+            self.assertTrue(shadow.submit(self.pixel_values, self.top_probs, self.top_indices, queue_depth=0))
+            stats = self.evaluated(shadow, 2)
+        self.assertEqual(stats["images"], {'error': 2})
+        self.assertIsNone(stats["agreement_rate"])
+
+
+if __name__ == '__main__':
+    unittest.main()
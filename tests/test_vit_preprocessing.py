@@ -0,0 +1,169 @@
+import io
+import os
+import threading
+import unittest
+from unittest import mock
+
+import numpy as np
+from PIL import Image
+from transformers import ViTImageProcessor
+
+from sample_images import synthetic_images
+from vit_preprocessing import EXIF_ORIENTATION, InvalidImage, ViTPreprocessor
+
+MODEL_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                          'skincondition_detection-main', 'saved_vit_model')
+# Both resize with PIL; only the float32 rounding of rescale + normalize differs
+TOLERANCE = 1e-5
+
+
+class EquivalenceTests(unittest.TestCase):
+    """The fused preprocessor must produce what ViTImageProcessor produces for the saved model."""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.preprocessor = ViTPreprocessor.from_pretrained(MODEL_PATH)
+        cls.reference = ViTImageProcessor.from_pretrained(MODEL_PATH)
+
+    def assert_matches_reference(self, images):
+        expected = self.reference(images=images, return_tensors='np')['pixel_values']
+        actual = self.preprocessor(images)
+        self.assertEqual(actual.shape, expected.shape)
+        self.assertEqual(actual.dtype, np.float32)
+        np.testing.assert_allclose(actual, expected, rtol=0, atol=TOLERANCE)
+
+    def test_batch_of_photos(self):
+        self.assert_matches_reference(synthetic_images(4, seed=1))
+
+    def test_image_already_at_model_resolution(self):
+        self.assert_matches_reference(synthetic_images(1, seed=2, width=224, height=224))
+
+    def test_small_and_portrait_images(self):
+        self.assert_matches_reference([synthetic_images(1, seed=3, width=50, height=80)[0],
+                                       synthetic_images(1, seed=4, width=480, height=1000)[0]])
+
+    def test_extreme_pixel_values(self):
+        self.assert_matches_reference([Image.new('RGB', (300, 200), (0, 0, 0)),
+                                       Image.new('RGB', (300, 200), (255, 255, 255))])
+
+    def test_grayscale_and_alpha_images_are_converted_to_rgb(self):
+        image = synthetic_images(1, seed=5)[0]
+        for converted in (image.convert('L'), image.convert('RGBA')):
+            expected = self.reference(images=[converted.convert('RGB')], return_tensors='np')['pixel_values']
+            np.testing.assert_allclose(self.preprocessor([converted]), expected, rtol=0, atol=TOLERANCE)
+
+
+class BufferTests(unittest.TestCase):
+    def setUp(self):
+        self.preprocessor = ViTPreprocessor()
+        self.image = Image.new('RGB', (64, 48), (200, 120, 90))
+
+    def test_buffer_is_sized_to_the_batch_and_grown_on_demand(self):
+        single = self.preprocessor([self.image])
+        self.assertEqual(single.shape, (1, 3, 224, 224))
+        self.assertEqual(single.base.shape[0], 1)
+
+        batch = self.preprocessor([self.image] * 3)
+        self.assertEqual(batch.base.shape[0], 3)
+        # Smaller batches reuse the grown buffer
+        again = self.preprocessor([self.image] * 2)
+        self.assertIs(again.base, batch.base)
+
+    def test_each_thread_has_its_own_buffer(self):
+        mine = self.preprocessor([self.image])
+        other = []
+        thread = threading.Thread(target=lambda: other.append(self.preprocessor([self.image])))
+        thread.start()
+        thread.join()
+        self.assertIsNot(other[0].base, mine.base)
+
+
+def encode(image, image_format='JPEG', **kwargs):
+    data = io.BytesIO()
+    image.save(data, image_format, **kwargs)
+    return data.getvalue()
+
+
+class DecodeTests(unittest.TestCase):
+    def setUp(self):
+        self.preprocessor = ViTPreprocessor()
+
+    def decoded_sizes(self, preprocessor, data):
+        """Decode `data` and return the size of the image handed to `resize`, i.e. what was actually decoded."""
+        sizes = []
+        resize = preprocessor.resize
+        with mock.patch.object(preprocessor, 'resize', side_effect=lambda image: sizes.append(image.size) or resize(image)):
+            image = preprocessor.decode(data)
+        self.assertEqual(image.size, (224, 224))
+        return sizes[0]
+
+    def test_large_jpeg_is_decoded_at_the_smallest_sufficient_dct_scale(self):
+        data = encode(synthetic_images(1, seed=6, width=2000, height=1500)[0])
+        # 1/4 scale: 1/8 would make the short side 188 pixels, below the model's 224
+        self.assertEqual(self.decoded_sizes(self.preprocessor, data), (500, 375))
+        self.assertEqual(self.decoded_sizes(ViTPreprocessor(draft_decode=False), data), (2000, 1500))
+
+    def test_draft_decode_stays_close_to_a_full_decode(self):
+        data = encode(synthetic_images(1, seed=7, width=2000, height=1500)[0], quality=95)
+        draft = np.asarray(self.preprocessor.decode(data), dtype=np.float64)
+        full = np.asarray(ViTPreprocessor(draft_decode=False).decode(data), dtype=np.float64)
+        self.assertLess(np.abs(draft - full).mean(), 1.0)
+
+    def test_small_jpeg_and_png_are_decoded_in_full(self):
+        image = synthetic_images(1, seed=8, width=300, height=200)[0]
+        self.assertEqual(self.decoded_sizes(self.preprocessor, encode(image)), (300, 200))
+        self.assertEqual(self.decoded_sizes(self.preprocessor, encode(image, 'PNG')), (300, 200))
+
+    def test_exif_orientation_is_applied_after_the_draft(self):
+        # Red left half, blue right half; orientation 6 means "rotate 90 degrees clockwise to display"
+        image = Image.new('RGB', (1600, 1200), (255, 0, 0))
+        image.paste((0, 0, 255), (800, 0, 1600, 1200))
+        exif = image.getexif()
+        exif[EXIF_ORIENTATION] = 6
+        data = encode(image, exif=exif)
+
+        self.assertEqual(self.decoded_sizes(self.preprocessor, data), (300, 400))
+        decoded = self.preprocessor.decode(data)
+        top, bottom = decoded.getpixel((112, 10)), decoded.getpixel((112, 214))
+        self.assertGreater(top[0], 200)
+        self.assertGreater(bottom[2], 200)
+
+
+class RejectionTests(unittest.TestCase):
+    def setUp(self):
+        self.preprocessor = ViTPreprocessor(max_pixels=1000 * 1000)
+        self.jpeg = encode(synthetic_images(1, seed=9)[0])
+
+    def assert_rejected(self, data, reason, status_code):
+        with self.assertRaises(InvalidImage) as raised:
+            self.preprocessor.decode(data)
+        self.assertEqual((raised.exception.reason, raised.exception.status_code), (reason, status_code))
+
+    def test_unreadable_bytes(self):
+        self.assert_rejected(b'not an image at all', 'unreadable', 400)
+
+    def test_unsupported_format(self):
+        self.assert_rejected(encode(Image.new('RGB', (10, 10)), 'GIF'), 'unsupported_format', 415)
+
+    def test_too_many_pixels_is_rejected_from_the_header(self):
+        data = encode(Image.new('RGB', (1200, 1000)))
+        with mock.patch.object(Image.Image, 'load', side_effect=AssertionError("pixels decoded")):
+            self.assert_rejected(data, 'too_many_pixels', 413)
+
+    def test_truncated_pixel_data_is_corrupt(self):
+        self.assert_rejected(self.jpeg[:len(self.jpeg) // 2], 'corrupt', 400)
+
+    def test_valid_upload_is_accepted(self):
+        self.assertEqual(self.preprocessor.decode(self.jpeg).size, (224, 224))
+        self.assertEqual(self.preprocessor.decode(io.BytesIO(self.jpeg)).size, (224, 224))
+
+    def test_rejections_are_counted_by_reason(self):
+        for data in (b'junk', b'more junk', self.jpeg[:len(self.jpeg) // 2]):
+            with self.assertRaises(InvalidImage):
+                self.preprocessor.decode(data)
+        self.preprocessor.decode(self.jpeg)
+        self.assertEqual(self.preprocessor.rejection_stats(), {'unreadable': 2, 'corrupt': 1})
+
+
+if __name__ == '__main__':
+    unittest.main()
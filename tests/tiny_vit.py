@@ -0,0 +1,21 @@
+import os
+import shutil
+
+import torch
+from transformers import ViTConfig, ViTForImageClassification
+
+SAVED_MODEL = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                           'skincondition_detection-main', 'saved_vit_model')
+
+
+def build_tiny_vit(directory, num_labels=9, seed=0):
+    """
+    Save a small randomly initialized ViT with the saved model's input size and
+    preprocessing, so backends and servers can be exercised without the real weights.
+    """
+    torch.manual_seed(seed)
+    config = ViTConfig(hidden_size=32, num_hidden_layers=2, num_attention_heads=2, intermediate_size=64,
+                       num_labels=num_labels)
+    ViTForImageClassification(config).eval().save_pretrained(directory)
+    shutil.copy(os.path.join(SAVED_MODEL, 'preprocessor_config.json'), directory)
+    return directory